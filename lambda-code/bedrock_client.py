@@ -0,0 +1,568 @@
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# 接続プール（同時に呼び出すモデル数に合わせる）
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.environ.get('BEDROCK_MAX_POOL_CONNECTIONS', '10'))
+
+# タイムアウト（秒）。長文の要約・タグ選択は応答に時間がかかるため読み込みは長め
+BEDROCK_CONNECT_TIMEOUT = float(os.environ.get('BEDROCK_CONNECT_TIMEOUT', '3'))
+BEDROCK_READ_TIMEOUT = float(os.environ.get('BEDROCK_READ_TIMEOUT', '120'))
+
+# リトライ（初回を含む試行回数。adaptive: スロットリングされたら送信レートも下げる）
+BEDROCK_MAX_ATTEMPTS = int(os.environ.get('BEDROCK_MAX_ATTEMPTS', '3'))
+BEDROCK_RETRY_MODE = os.environ.get('BEDROCK_RETRY_MODE', 'adaptive')
+
+# コンテナの初回に、トークンを消費しない軽い呼び出しで接続（TCP・TLS）を張っておく（BEDROCK_WARM_UP_CONNECTION=0で無効）
+BEDROCK_WARM_UP_CONNECTION = os.environ.get('BEDROCK_WARM_UP_CONNECTION', '1') != '0'
+
+# ストリーミングで受け取り、必要なJSONが揃った時点で打ち切る（BEDROCK_STREAMING=0で無効）
+BEDROCK_STREAMING = os.environ.get('BEDROCK_STREAMING', '1') != '0'
+
+# ストリーミングが使えなかったモデル（権限がない・対応していない）は以後invoke_modelで呼ぶ
+STREAMING_UNAVAILABLE = set()
+
+# 結果が不要になった呼び出しを止めるためのイベント（threading.Event、呼び出し元のスレッドで設定）
+BEDROCK_CANCEL = contextvars.ContextVar('BEDROCK_CANCEL', default=None)
+
+# 送信した呼び出しの受け取り中の内容（progress）を追加するリスト（呼び出し元のスレッドで設定）。
+# 呼び出し元が結果を待たずに打ち切った時、ここからトークン数を見積もる（get_attempts_usage）
+BEDROCK_ATTEMPTS = contextvars.ContextVar('BEDROCK_ATTEMPTS', default=None)
+
+# ヘッジ（応答が遅い呼び出しに同じリクエストをもう1つ送り、先に返った方を使う。BEDROCK_HEDGE=1で有効）
+BEDROCK_HEDGE = os.environ.get('BEDROCK_HEDGE', '0') == '1'
+# ヘッジを送るまでの待ち時間は、モデルごとの直近の応答時間のこのパーセンタイル
+BEDROCK_HEDGE_PERCENTILE = float(os.environ.get('BEDROCK_HEDGE_PERCENTILE', '95'))
+# 応答時間がこの件数たまるまでは固定の待ち時間（秒）を使う
+BEDROCK_HEDGE_MIN_SAMPLES = int(os.environ.get('BEDROCK_HEDGE_MIN_SAMPLES', '20'))
+BEDROCK_HEDGE_DELAY = float(os.environ.get('BEDROCK_HEDGE_DELAY', '5'))
+# ヘッジを送ってよい呼び出しの割合（トークンの増加をこの割合までに抑える）
+BEDROCK_HEDGE_BUDGET = float(os.environ.get('BEDROCK_HEDGE_BUDGET', '0.05'))
+# ヘッジの送り先の推論プロファイル（us・globalなど、空なら同じモデルID）
+BEDROCK_HEDGE_PROFILE = os.environ.get('BEDROCK_HEDGE_PROFILE', '')
+# 同時に送るヘッジの上限（ヘッジ専用のスレッド数）。接続プールが埋まっている時もヘッジは送らない
+BEDROCK_HEDGE_MAX_IN_FLIGHT = int(os.environ.get('BEDROCK_HEDGE_MAX_IN_FLIGHT', '2'))
+
+# モデルごとの直近の応答時間（秒）と、ヘッジの予算の計算に使う呼び出し数・ヘッジ数、
+# 実行中の呼び出し数（ヘッジを含む）・ヘッジ数
+HEDGE_LATENCIES = {}
+HEDGE_STATS = {'calls': 0, 'hedges': 0, 'in_flight': 0, 'hedges_in_flight': 0}
+HEDGE_LOCK = threading.Lock()
+ATTEMPT_EXECUTOR = None
+HEDGE_EXECUTOR = None
+
+# 推論プロファイルの接頭辞（リージョン別・グローバル）
+INFERENCE_PROFILE_PREFIXES = ('us', 'eu', 'apac', 'jp', 'au', 'ca', 'us-gov', 'global')
+
+# 推論部分（この中のJSONは回答として扱わない）
+REASONING_TAGS = (('<thinking>', '</thinking>'), ('<reasoning>', '</reasoning>'))
+
+# ウォームスタート間で共有するクライアント（接続を使い回す）
+BEDROCK_CLIENT = None
+BEDROCK_CLIENT_LOCK = threading.Lock()
+BEDROCK_CONNECTION_WARMING = None  # 接続を張るスレッド（コンテナごとに1回）
+
+class InvocationCancelled(Exception):
+    """BEDROCK_CANCELのイベントが設定されたため途中で打ち切った呼び出し"""
+
+def get_bedrock_config():
+    """Bedrock Runtimeクライアントの設定（接続プール・keep-alive・タイムアウト・リトライ）"""
+    return Config(
+        max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+        read_timeout=BEDROCK_READ_TIMEOUT,
+        retries={'total_max_attempts': BEDROCK_MAX_ATTEMPTS, 'mode': BEDROCK_RETRY_MODE}
+    )
+
+def create_bedrock_client(endpoint_url=None):
+    """Bedrock Runtimeクライアントを作成（テスト時はendpoint_urlでローカルのサーバーに向けられる）"""
+    # デフォルトセッションはスレッドセーフでないため専用のセッションで作成
+    return boto3.session.Session().client('bedrock-runtime', config=get_bedrock_config(), endpoint_url=endpoint_url)
+
+def get_bedrock_client():
+    """共有のBedrock Runtimeクライアントを取得（初回のみ作成、複数スレッドから使える）"""
+    global BEDROCK_CLIENT
+    with BEDROCK_CLIENT_LOCK:
+        if BEDROCK_CLIENT is None:
+            BEDROCK_CLIENT = create_bedrock_client()
+    return BEDROCK_CLIENT
+
+def warm_up_connection(client):
+    """ListAsyncInvokes（トークンを消費しない）で接続を張る。権限がなくてもエラー応答の後の接続はプールに残る"""
+    try:
+        client.list_async_invokes(maxResults=1)
+    except Exception:
+        pass
+
+def warm_up_bedrock():
+    """Bedrockクライアントの作成（サービス定義の読み込み・認証情報の解決）を済ませ、接続を張り始める
+
+    接続はバックグラウンドのスレッドで張り、呼び出し元は待たない（コンテナごとに1回）。
+    戻り値はそのスレッド（接続を張らない場合はNone）
+    """
+    global BEDROCK_CONNECTION_WARMING
+    try:
+        client = get_bedrock_client()
+    except Exception:
+        return None  # 失敗しても本処理で再作成する
+    if not BEDROCK_WARM_UP_CONNECTION or not hasattr(client, 'list_async_invokes'):
+        return None
+    with BEDROCK_CLIENT_LOCK:
+        if BEDROCK_CONNECTION_WARMING is not None:
+            return None
+        BEDROCK_CONNECTION_WARMING = threading.Thread(target=warm_up_connection, args=(client,), daemon=True)
+    BEDROCK_CONNECTION_WARMING.start()
+    return BEDROCK_CONNECTION_WARMING
+
+class JsonObjectScanner:
+    """ストリーミングで届くテキストから、keyを含むJSONオブジェクトが閉じた時点を検出
+
+    文字列内の括弧は数えず、推論部分（<thinking>・<reasoning>）の中は読み飛ばす。
+    届いたテキストは追加した分だけ1回走査する（読み終えた部分は捨て、オブジェクトの途中は断片で持つ）
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.chunks = []  # 届いたテキスト（textで連結）
+        self.pending = ''  # まだ読み終えていない部分（タグの途中など）
+        self.position = 0  # pending内の読む位置
+        self.start = None  # オブジェクトの途中ならpending内でのこの断片の開始位置
+        self.object_parts = []  # オブジェクトのうち前回までに読んだ断片
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.reasoning_end = None
+        self.result = None
+
+    @property
+    def text(self):
+        """ここまでに届いたテキスト全体"""
+        return ''.join(list(self.chunks))
+
+    def feed(self, text):
+        """テキストを追加し、オブジェクトが揃えば解析結果を返す（揃うまではNone）"""
+        self.chunks.append(text)
+        self.pending += text
+        while self.result is None and self.position < len(self.pending):
+            if self.reasoning_end is not None:
+                end = self.pending.find(self.reasoning_end, self.position)
+                if end < 0:
+                    # 閉じタグが分割されて届く場合に備えて末尾は読み直す
+                    self.position = max(self.position, len(self.pending) - len(self.reasoning_end) + 1)
+                    break
+                self.position = end + len(self.reasoning_end)
+                self.reasoning_end = None
+                continue
+            if not self.scan():
+                break  # 開始タグの途中なので続きを待つ
+        self.discard()
+        return self.result
+
+    def discard(self):
+        """読み終えた部分を捨てる（オブジェクトの途中なら断片として残す）"""
+        if self.start is not None:
+            self.object_parts.append(self.pending[self.start:self.position])
+            self.start = 0
+        self.pending = self.pending[self.position:]
+        self.position = 0
+
+    def scan(self):
+        """1文字読み進める（推論部分の開始タグかどうか判断できなければFalse）"""
+        char = self.pending[self.position]
+        if self.start is None:
+            if char == '<':
+                for open_tag, close_tag in REASONING_TAGS:
+                    if self.pending.startswith(open_tag, self.position):
+                        self.reasoning_end = close_tag
+                        self.position += len(open_tag)
+                        return True
+                remaining = len(self.pending) - self.position
+                if any(remaining < len(open_tag) and open_tag.startswith(self.pending[self.position:])
+                       for open_tag, _ in REASONING_TAGS):
+                    return False
+            elif char == '{':
+                self.start, self.depth = self.position, 0
+                self.object_parts = []
+        if self.start is not None:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    self.close(''.join(self.object_parts) + self.pending[self.start:self.position + 1])
+        self.position += 1
+        return True
+
+    def close(self, candidate):
+        self.start = None
+        self.object_parts = []
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            return
+        if isinstance(data, dict) and isinstance(data.get(self.key), (list, dict)):
+            self.result = data
+
+# モデルごとの使用量のキー（入力, 出力）
+USAGE_KEYS = {
+    'anthropic': ('input_tokens', 'output_tokens'),
+    'nova': ('inputTokens', 'outputTokens'),
+    'openai': ('prompt_tokens', 'completion_tokens'),
+}
+
+def get_model_family(model_id):
+    if 'anthropic' in model_id:
+        return 'anthropic'
+    if 'nova' in model_id:
+        return 'nova'
+    return 'openai'
+
+def read_stream_event(family, event, usage):
+    """ストリームのイベント1件からテキストを取り出し、使用量をusageに反映"""
+    chunk = json.loads(event['chunk']['bytes'])
+    metrics = chunk.get('amazon-bedrock-invocationMetrics')
+    if metrics:
+        input_key, output_key = USAGE_KEYS[family]
+        usage.setdefault(input_key, metrics.get('inputTokenCount', 0))
+        usage.setdefault(output_key, metrics.get('outputTokenCount', 0))
+
+    if family == 'anthropic':
+        if chunk.get('type') == 'message_start':
+            usage.update(chunk.get('message', {}).get('usage', {}))
+        elif chunk.get('type') == 'message_delta':
+            usage.update(chunk.get('usage', {}))
+        elif chunk.get('type') == 'content_block_delta':
+            return chunk.get('delta', {}).get('text', '')
+    elif family == 'nova':
+        if 'metadata' in chunk:
+            usage.update(chunk['metadata'].get('usage', {}))
+        elif 'contentBlockDelta' in chunk:
+            return chunk['contentBlockDelta'].get('delta', {}).get('text', '')
+    else:
+        if chunk.get('usage'):
+            usage.update(chunk['usage'])
+        choices = chunk.get('choices') or []
+        if choices:
+            return (choices[0].get('delta') or {}).get('content') or ''
+    return ''
+
+def estimate_tokens(text):
+    """トークン数の見積もり（ASCIIは4文字で1トークン、それ以外は1文字1トークン）"""
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+def get_prompt_text(value):
+    """リクエストの本文に含まれる文字列（プロンプト）を連結"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return ''.join(get_prompt_text(item) for key, item in value.items() if key != 'anthropic_version')
+    if isinstance(value, list):
+        return ''.join(get_prompt_text(item) for item in value)
+    return ''
+
+def make_response_body(family, text, usage, delta_count, stopped_early, request_body=None):
+    """invoke_modelと同じ形の応答を作る（呼び出し側の解析処理をそのまま使う）
+
+    打ち切った場合は最後に届く使用量を受け取れないため、届いていないトークン数は
+    プロンプトと受け取ったテキストから見積もり、'usage_estimated' をTrueにする
+    """
+    input_key, output_key = USAGE_KEYS[family]
+    if stopped_early:
+        if not usage.get(input_key):
+            usage[input_key] = estimate_tokens(get_prompt_text(request_body))
+        usage[output_key] = max(usage.get(output_key, 0), delta_count, estimate_tokens(text))
+    else:
+        usage.setdefault(input_key, 0)
+        usage.setdefault(output_key, delta_count)
+
+    if family == 'anthropic':
+        body = {'content': [{'type': 'text', 'text': text}]}
+    elif family == 'nova':
+        body = {'output': {'message': {'content': [{'text': text}]}}}
+    else:
+        body = {'choices': [{'message': {'content': text}}]}
+    body['usage'] = usage
+    body['stream_stopped_early'] = stopped_early
+    body['usage_estimated'] = stopped_early
+    return body
+
+def is_streaming_unavailable(error):
+    """ストリーミング自体が使えないエラーか（権限がない・モデルが対応していない）
+
+    リクエストの内容によるValidationExceptionはinvoke_modelでも失敗するため対象外
+    """
+    code = error.response.get('Error', {}).get('Code')
+    message = error.response.get('Error', {}).get('Message', '').lower()
+    if code == 'AccessDeniedException':
+        return 'invokemodelwithresponsestream' in message.replace(' ', '')
+    return code == 'ValidationException' and 'stream' in message and 'support' in message
+
+def invoke_model_json(model_id, body, key, client=None):
+    """モデルを呼び出し、応答JSON（invoke_modelと同じ形）を返す
+
+    ストリーミングで受け取り、回答中の key を含むJSONオブジェクトが閉じた時点で
+    ストリームを閉じて残りの生成（GPT-OSSの推論の後の余分な出力など）を待たない。
+    打ち切った場合は 'stream_stopped_early' がTrue。
+    BEDROCK_CANCELのイベントが設定されたらストリームを閉じてInvocationCancelled。
+    BEDROCK_HEDGEが有効なら応答が遅い時にヘッジを送る（invoke_model_json_hedged）
+    """
+    if BEDROCK_HEDGE:
+        return invoke_model_json_hedged(model_id, body, key, client)
+    return invoke_model_json_once(model_id, body, key, client)
+
+def invoke_model_json_once(model_id, body, key, client=None, progress=None):
+    """モデルを1回呼び出す（ヘッジなし）
+
+    progress（dict）を渡すと、送信したモデルID・本文と受け取り中のテキスト・使用量を入れる
+    （打ち切った時のトークン数の見積もり用）。渡さなければBEDROCK_ATTEMPTSのリストに追加する
+    """
+    client = client or get_bedrock_client()
+    cancel = BEDROCK_CANCEL.get()
+    if cancel is not None and cancel.is_set():
+        raise InvocationCancelled(model_id)
+    if progress is None:
+        progress = {}
+        attempts = BEDROCK_ATTEMPTS.get()
+        if attempts is not None:
+            attempts.append(progress)
+    progress.update(model_id=model_id, body=body)
+    if not BEDROCK_STREAMING or model_id in STREAMING_UNAVAILABLE:
+        response = client.invoke_model(modelId=model_id, body=json.dumps(body))
+        return json.loads(response['body'].read())
+
+    try:
+        response = client.invoke_model_with_response_stream(modelId=model_id, body=json.dumps(body))
+    except ClientError as e:
+        if not is_streaming_unavailable(e):
+            raise
+        STREAMING_UNAVAILABLE.add(model_id)
+        return invoke_model_json_once(model_id, body, key, client, progress)
+
+    family = get_model_family(model_id)
+    scanner = JsonObjectScanner(key)
+    usage = {}
+    delta_count = 0
+    stream = response['body']
+    stopped_early = False
+    progress.update(scanner=scanner, usage=usage, delta_count=0)
+    try:
+        for event in stream:
+            if cancel is not None and cancel.is_set():
+                raise InvocationCancelled(model_id)
+            if 'chunk' not in event:
+                continue
+            text = read_stream_event(family, event, usage)
+            if text:
+                delta_count += 1
+                progress['delta_count'] = delta_count
+                if scanner.feed(text) is not None:
+                    stopped_early = True
+                    break
+    finally:
+        stream.close()
+
+    return make_response_body(family, scanner.text, usage, delta_count, stopped_early, body)
+
+def get_hedge_model_id(model_id):
+    """ヘッジの送り先のモデルID（BEDROCK_HEDGE_PROFILEがあれば推論プロファイルを差し替える）"""
+    if not BEDROCK_HEDGE_PROFILE:
+        return model_id
+    prefix, _, rest = model_id.partition('.')
+    if prefix not in INFERENCE_PROFILE_PREFIXES:
+        return model_id  # 推論プロファイルのないモデル（openai.gpt-oss など）はそのまま
+    return f"{BEDROCK_HEDGE_PROFILE}.{rest}"
+
+def get_hedge_delay(model_id):
+    """ヘッジを送るまでの待ち時間（直近の応答時間のパーセンタイル、少なければ固定値）"""
+    with HEDGE_LOCK:
+        latencies = sorted(HEDGE_LATENCIES.get(model_id, ()))
+    if len(latencies) < BEDROCK_HEDGE_MIN_SAMPLES:
+        return BEDROCK_HEDGE_DELAY
+    index = math.ceil(len(latencies) * BEDROCK_HEDGE_PERCENTILE / 100) - 1  # nearest-rank
+    return latencies[min(max(index, 0), len(latencies) - 1)]
+
+def record_latency(model_id, latency):
+    """モデルの応答時間（秒）を記録（ヘッジで打ち切った呼び出しは打ち切るまでの時間を下限として記録）"""
+    with HEDGE_LOCK:
+        if model_id not in HEDGE_LATENCIES:
+            HEDGE_LATENCIES[model_id] = deque(maxlen=max(BEDROCK_HEDGE_MIN_SAMPLES * 5, 100))
+        HEDGE_LATENCIES[model_id].append(latency)
+
+def acquire_hedge():
+    """予算内で、ヘッジ専用のスレッドと接続プールに空きがあればヘッジを1つ使う
+
+    ヘッジ数が呼び出し数のBEDROCK_HEDGE_BUDGETの割合を超えず、同時に送るヘッジは
+    BEDROCK_HEDGE_MAX_IN_FLIGHTまで。実行中の呼び出しが接続プールの数に達していれば送らない
+    （空きを待つヘッジは速くならない）
+    """
+    with HEDGE_LOCK:
+        if HEDGE_STATS['hedges_in_flight'] >= BEDROCK_HEDGE_MAX_IN_FLIGHT:
+            return False
+        if HEDGE_STATS['in_flight'] >= BEDROCK_MAX_POOL_CONNECTIONS:
+            return False
+        if HEDGE_STATS['hedges'] + 1 > HEDGE_STATS['calls'] * BEDROCK_HEDGE_BUDGET:
+            return False
+        HEDGE_STATS['hedges'] += 1
+        HEDGE_STATS['in_flight'] += 1
+        HEDGE_STATS['hedges_in_flight'] += 1
+        return True
+
+def get_attempt_executors():
+    """最初の呼び出し用（接続プールの数）とヘッジ専用（BEDROCK_HEDGE_MAX_IN_FLIGHT）のスレッドプール"""
+    global ATTEMPT_EXECUTOR, HEDGE_EXECUTOR
+    with HEDGE_LOCK:
+        if ATTEMPT_EXECUTOR is None:
+            ATTEMPT_EXECUTOR = ThreadPoolExecutor(max_workers=BEDROCK_MAX_POOL_CONNECTIONS)
+        if HEDGE_EXECUTOR is None:
+            HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=max(BEDROCK_HEDGE_MAX_IN_FLIGHT, 1))
+    return ATTEMPT_EXECUTOR, HEDGE_EXECUTOR
+
+def run_attempt(model_id, body, key, client, cancel, progress, is_hedge):
+    """ヘッジの1回分の呼び出し（cancelが設定されたら打ち切る）"""
+    token = BEDROCK_CANCEL.set(cancel)
+    try:
+        return invoke_model_json_once(model_id, body, key, client, progress)
+    finally:
+        BEDROCK_CANCEL.reset(token)
+        with HEDGE_LOCK:
+            HEDGE_STATS['in_flight'] -= 1
+            if is_hedge:
+                HEDGE_STATS['hedges_in_flight'] -= 1
+
+def get_attempt_usage(model_id, body, progress):
+    """打ち切る呼び出しのここまでのトークン数（最初のイベントの前ならプロンプトからの見積もり）"""
+    scanner = progress.get('scanner')
+    text = scanner.text if scanner is not None else ''
+    usage = dict(progress.get('usage', {}))
+    return make_response_body(get_model_family(model_id), text, usage, progress.get('delta_count', 0), True, body)['usage']
+
+def get_attempts_usage(attempts):
+    """結果を待たずに打ち切った呼び出し（BEDROCK_ATTEMPTSのリスト）のトークン数の見積もり（cache_infoと同じキー）
+
+    送信済みの呼び出しは課金されるため、受け取ったところまでの出力と入力のトークン数を数える
+    """
+    total = {'input_tokens': 0, 'output_tokens': 0, 'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0}
+    for progress in list(attempts):
+        if 'model_id' not in progress:
+            continue  # まだ送信していない
+        model_id = progress['model_id']
+        usage = get_attempt_usage(model_id, progress['body'], progress)
+        input_key, output_key = USAGE_KEYS[get_model_family(model_id)]
+        total['input_tokens'] += usage.get(input_key, 0)
+        total['output_tokens'] += usage.get(output_key, 0)
+        total['cache_creation_input_tokens'] += usage.get('cache_creation_input_tokens', 0)
+        total['cache_read_input_tokens'] += usage.get('cache_read_input_tokens', 0)
+    return total
+
+def add_usage(usage, other):
+    """usageにotherの数値の項目を加算"""
+    for name, value in other.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            usage[name] = usage.get(name, 0) + value
+
+def invoke_model_json_hedged(model_id, body, key, client=None):
+    """応答がモデルの直近のパーセンタイルより遅ければ同じリクエスト（ヘッジ）を送り、先に返った方を使う
+
+    ヘッジは予算（BEDROCK_HEDGE_BUDGET）とヘッジ専用のスレッド・接続プールの空きの範囲でだけ送り、
+    遅い方はストリームを閉じて打ち切る。一方が失敗した場合はもう一方の応答を待つ。
+    応答時間は呼び出しの開始から測り、ヘッジが勝った場合は最初の呼び出しの打ち切りまでの時間を下限として記録する。
+    打ち切った方のここまでのトークン数（見積もり）は応答の usage に加え、'hedge_usage' にも入れる。
+    応答の 'hedged' はヘッジを送ったか、'hedge_won' はヘッジの応答を使ったか
+    """
+    client = client or get_bedrock_client()
+    parent_cancel = BEDROCK_CANCEL.get()
+    if parent_cancel is not None and parent_cancel.is_set():
+        raise InvocationCancelled(model_id)
+    with HEDGE_LOCK:
+        HEDGE_STATS['calls'] += 1
+        HEDGE_STATS['in_flight'] += 1
+
+    attempt_executor, hedge_executor = get_attempt_executors()
+    start_time = time.perf_counter()
+    attempts = {}  # future -> (モデルID, 打ち切り用のイベント, 受け取り中の内容)
+    parent_attempts = BEDROCK_ATTEMPTS.get()  # 呼び出し元が打ち切った時の見積もり用（ヘッジも含める）
+    primary_cancel = threading.Event()
+    primary_progress = {}
+    if parent_attempts is not None:
+        parent_attempts.append(primary_progress)
+    primary = attempt_executor.submit(run_attempt, model_id, body, key, client, primary_cancel, primary_progress, False)
+    attempts[primary] = (model_id, primary_cancel, primary_progress)
+    pending = {primary}
+    deadline = start_time + get_hedge_delay(model_id)
+    waiting_for_hedge = True  # ヘッジを送るかまだ判断していない
+    error = None
+    try:
+        while pending:
+            if parent_cancel is not None and parent_cancel.is_set():
+                raise InvocationCancelled(model_id)
+            timeout = max(0, deadline - time.perf_counter()) if waiting_for_hedge else None
+            if parent_cancel is not None:
+                # 呼び出し元の打ち切りに気づけるように少しずつ待つ
+                timeout = 0.05 if timeout is None else min(timeout, 0.05)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            winner = None
+            response_body = None
+            losers = {}  # 同時に終わった方（応答全体のトークン数）
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if winner is None:
+                    winner, response_body = future, result
+                else:
+                    losers[future] = result.get('usage', {})
+            if winner is not None:
+                elapsed = time.perf_counter() - start_time
+                if winner is primary or primary in pending:
+                    record_latency(model_id, elapsed)  # 打ち切る最初の呼び出しの応答時間は下限
+                for future in pending:
+                    attempt_model_id, _, progress = attempts[future]
+                    losers[future] = get_attempt_usage(attempt_model_id, body, progress)
+                if losers:
+                    hedge_usage = {}
+                    for usage in losers.values():
+                        add_usage(hedge_usage, usage)
+                    response_body['usage'] = dict(response_body.get('usage', {}))
+                    add_usage(response_body['usage'], hedge_usage)
+                    response_body['hedge_usage'] = hedge_usage
+                    response_body['usage_estimated'] = response_body.get('usage_estimated', False) or bool(pending)
+                response_body['hedged'] = len(attempts) > 1
+                response_body['hedge_won'] = winner is not primary
+                return response_body
+            if waiting_for_hedge and pending and time.perf_counter() >= deadline:
+                waiting_for_hedge = False
+                if acquire_hedge():
+                    hedge_model_id = get_hedge_model_id(model_id)
+                    hedge_cancel = threading.Event()
+                    hedge_progress = {}
+                    if parent_attempts is not None:
+                        parent_attempts.append(hedge_progress)
+                    hedge = hedge_executor.submit(run_attempt, hedge_model_id, body, key, client, hedge_cancel, hedge_progress, True)
+                    attempts[hedge] = (hedge_model_id, hedge_cancel, hedge_progress)
+                    pending.add(hedge)
+        raise error
+    finally:
+        # 使わなかった方は打ち切る
+        for _, attempt_cancel, _ in attempts.values():
+            attempt_cancel.set()
@@ -0,0 +1,56 @@
+"""記事コーパスからBM25用の文書頻度を集計し、tag_stats.json.gz を作成
+
+使い方:
+    python build_tag_stats.py articles.jsonl [出力先]
+
+articles.jsonl は1行1記事のJSON（{"slug": "...", "text": "タイトル\\n\\n本文"}）
+"""
+import json
+import sys
+from enhanced_common import (
+    get_tags_from_contentful_cached,
+    get_enhanced_tag_matcher,
+    extract_tag_features
+)
+from tag_scoring import save_tag_stats
+
+def build_tag_stats(article_texts, all_tags, tags_hash=None):
+    """タグ名・タグ単語ごとに、出現する記事数を集計"""
+    matcher = get_enhanced_tag_matcher(all_tags, tags_hash)
+    
+    doc_count = 0
+    total_length = 0
+    document_frequency = {}
+    for text in article_texts:
+        features = extract_tag_features(text, matcher, with_counts=True, tags_hash=tags_hash)
+        doc_count += 1
+        total_length += features['length']
+        for term in features['tf']:
+            word = matcher.term_list[term]
+            document_frequency[word] = document_frequency.get(word, 0) + 1
+    
+    return {
+        'tags_hash': tags_hash,
+        'doc_count': doc_count,
+        'avg_length': round(total_length / doc_count, 2) if doc_count else 0,
+        'df': document_frequency
+    }
+
+def read_articles(corpus_file):
+    """JSONLファイルから記事本文を順に読み込む"""
+    with open(corpus_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)['text']
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    
+    tags_data, tags_hash = get_tags_from_contentful_cached()
+    stats = build_tag_stats(read_articles(sys.argv[1]), tags_data, tags_hash)
+    save_tag_stats(stats, sys.argv[2] if len(sys.argv) > 2 else None)
+    
+    print(f"Articles: {stats['doc_count']}")
+    print(f"Terms: {len(stats['df'])}")
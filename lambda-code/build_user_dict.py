@@ -0,0 +1,123 @@
+"""タグカタログからMeCabユーザー辞書を作成し、mecab_user.dic を出力
+
+使い方:
+    python build_user_dict.py [出力先] [ipadicのソースディレクトリ]
+
+タグ名の日本語を含む部分（"形態素解析" "サーバーレスアーキテクチャ" "生成ai" など）を
+1語として登録し、記事・タグ名の両方で分割されないようにする。
+辞書の生成元tags_hashと登録した語は 出力先.json に保存し、enhanced_commonは辞書の語が全て
+タグ名に残っているタグ一覧の時だけ使う（タグ一覧の更新でtags_hashが変わっても使い続ける）。
+mecab-dict-indexがなければmecab-python3に同梱のlibmecabで辞書を作成する
+"""
+import csv
+import ctypes
+import ctypes.util
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from enhanced_common import MECAB_USER_DIC, get_tags_from_contentful_cached, get_user_dict_words
+
+# ipadicのソース（left-id.defなど）の場所
+DEFAULT_DIC_SOURCE = '/usr/share/mecab/dic/ipadic'
+
+def find_context_id(dic_source):
+    """固有名詞（名詞,固有名詞,一般）の文脈IDをleft-id.defから取得"""
+    with open(os.path.join(dic_source, 'left-id.def'), 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            context_id, _, feature = line.strip().partition(' ')
+            if feature.startswith('名詞,固有名詞,一般,'):
+                return int(context_id)
+    raise ValueError(f"名詞,固有名詞,一般 の文脈IDが見つかりません: {dic_source}")
+
+def get_word_cost(word):
+    """長い語ほどコストを下げ、システム辞書の分割より優先させる"""
+    return int(max(-36000, -400 * len(word) ** 1.5))
+
+def write_user_dict_csv(words, context_id, csv_file):
+    """ipadic形式のユーザー辞書CSVを書き出し"""
+    with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        for word in words:
+            writer.writerow([
+                word, context_id, context_id, get_word_cost(word),
+                '名詞', '固有名詞', '一般', '*', '*', '*', word, '*', '*'
+            ])
+
+def find_dict_index_command():
+    """mecab-dict-indexのパス（PATHになければmecab-configで探す）"""
+    command = shutil.which('mecab-dict-index')
+    if command:
+        return command
+    result = subprocess.run(['mecab-config', '--libexecdir'], capture_output=True, text=True, check=True)
+    return os.path.join(result.stdout.strip(), 'mecab-dict-index')
+
+def load_libmecab():
+    """mecab-python3に同梱のlibmecab（なければシステムのlibmecab）"""
+    try:
+        import MeCab
+        libs_dir = os.path.join(os.path.dirname(os.path.dirname(MeCab.__file__)), 'mecab_python3.libs')
+        paths = glob.glob(os.path.join(libs_dir, 'libmecab*.so*'))
+    except ImportError:
+        paths = []
+    path = paths[0] if paths else ctypes.util.find_library('mecab')
+    if not path:
+        raise FileNotFoundError('mecab-dict-index・libmecabが見つかりません')
+    return ctypes.CDLL(path)
+
+def run_dict_index(args):
+    """mecab-dict-indexを実行（コマンドがなければlibmecabのmecab_dict_indexを呼ぶ）"""
+    try:
+        command = find_dict_index_command()
+    except (OSError, subprocess.CalledProcessError):
+        command = None
+    if command and os.path.exists(command):
+        subprocess.run([command] + args, check=True, capture_output=True)
+        return
+
+    argv = [b'mecab-dict-index'] + [arg.encode('utf-8') for arg in args]
+    if load_libmecab().mecab_dict_index(len(argv), (ctypes.c_char_p * len(argv))(*argv)) != 0:
+        raise RuntimeError(f"mecab_dict_index failed: {args}")
+
+def build_user_dict(all_tags, tags_hash, output=None, dic_source=None):
+    """ユーザー辞書をコンパイルし、生成元tags_hashを記録"""
+    output = output or MECAB_USER_DIC
+    dic_source = dic_source or os.environ.get('MECAB_DIC_SOURCE', DEFAULT_DIC_SOURCE)
+    words = get_user_dict_words(all_tags)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        csv_file = os.path.join(work_dir, 'user_dic.csv')
+        write_user_dict_csv(words, find_context_id(dic_source), csv_file)
+        run_dict_index([
+            '-d', dic_source,
+            '-u', output,
+            '-f', 'utf-8',
+            '-t', 'utf-8',
+            csv_file
+        ])
+
+    with open(f"{output}.json", 'w', encoding='utf-8') as f:
+        json.dump({
+            'tags_hash': tags_hash,
+            'words': len(words),
+            'word_list': words,
+            'timestamp': time.time()
+        }, f)
+
+    return words
+
+if __name__ == "__main__":
+    tags_data, tags_hash = get_tags_from_contentful_cached()
+    words = build_user_dict(
+        tags_data,
+        tags_hash,
+        sys.argv[1] if len(sys.argv) > 1 else None,
+        sys.argv[2] if len(sys.argv) > 2 else None
+    )
+
+    print(f"Tags hash: {tags_hash}")
+    print(f"Words: {len(words)}")
@@ -1,140 +1,486 @@
+import asyncio
 import json
 import hashlib
-import urllib3
 import os
 import re
+import threading
 import time
+from collections import Counter, defaultdict
+from itertools import islice
+from urllib.parse import parse_qs, urlparse
+from bedrock_client import get_bedrock_client, warm_up_bedrock
+from contentful_client import get_contentful_client
+from space_cache import get_live_tags_hashes, get_space
+from tag_matcher import (
+    RankedTags,
+    fold_width,
+    get_tag_matcher,
+    normalize_tag_name,
+    patch_tag_matchers,
+    register_live_tags_hashes,
+    register_tag_splitter,
+    release_tag_matchers
+)
+from tag_snapshot import TagCatalog, load_tag_snapshot, update_tag_snapshot_meta, write_tag_snapshot
 
-# グローバル変数でキャッシュ
-TAGS_CACHE = None
-TAGS_HASH = None
+# タグ一覧・記事・処理結果のキャッシュはスペースごと（space_cache.ContentfulSpace）
 
-def get_article_from_contentful(slug):
+# タグ一覧の有効期限（期限切れでも古い一覧を返しつつ裏で再取得）
+TAGS_CACHE_TTL = int(os.environ.get('TAGS_CACHE_TTL', '3600'))
+TAGS_REFRESH_RETRY = 60  # 再取得に失敗した後、次に試すまでの秒数
+
+# Sync APIで差分だけ取得（TAGS_SYNC=0で毎回全件取得）
+TAGS_SYNC = os.environ.get('TAGS_SYNC', '1') != '0'
+
+# 複数記事の一括取得で1リクエストに含めるslug数（URL長の上限を考慮）
+ARTICLE_PAGE_SIZE = 100
+
+# 記事・タグ一覧の取得方法（rest: Delivery API、graphql: GraphQL Content APIで1回にまとめて取得）
+CONTENTFUL_BACKEND = os.environ.get('CONTENTFUL_BACKEND', 'rest')
+
+# GraphQLで取得するフィールド（使うものだけ）。コレクション名はコンテンツタイプから作る
+ARTICLE_QUERY = """query Article($slug: String!, $locale: String) {
+  %(content_type)sCollection(where: {slug: $slug}, limit: 1, locale: $locale) {
+    items { sys { publishedVersion } title content }
+  }
+}"""
+
+ARTICLE_AND_TAGS_QUERY = """query ArticleAndTags($slug: String!, $locale: String) {
+  %(content_type)sCollection(where: {slug: $slug}, limit: 1, locale: $locale) {
+    items { sys { publishedVersion } title content }
+  }
+  %(tags_content_type)sCollection(limit: 1) {
+    items { tags }
+  }
+}"""
+
+async def fetch_article_and_tags_async(slug, space=None):
+    """記事・タグ一覧の取得とBedrockの準備を同時に実行"""
+    space = space or get_space()
+    if CONTENTFUL_BACKEND == 'graphql':
+        return await fetch_article_and_tags_graphql_async(slug, space)
+    
+    (blog_text, revision), (tags_data, tags_hash), _ = await asyncio.gather(
+        asyncio.to_thread(get_article_revision_from_contentful, slug, space),
+        asyncio.to_thread(get_tags_from_contentful_cached, space),
+        asyncio.to_thread(warm_up_bedrock)
+    )
+    return blog_text, revision, tags_data, tags_hash
+
+async def fetch_article_and_tags_graphql_async(slug, space=None):
+    """GraphQLで記事を取得（タグ一覧がキャッシュになければ同じクエリで取得）とBedrockの準備を同時に実行"""
+    space = space or get_space()
+    cached = get_cached_tags(space)
+    (blog_text, revision, tags_data), _ = await asyncio.gather(
+        asyncio.to_thread(fetch_article_and_tags_graphql, slug, cached is None, space),
+        asyncio.to_thread(warm_up_bedrock)
+    )
+    if cached is None:
+        cached = set_tags_cache(tags_data or [], space=space)
+    return (blog_text, revision) + cached
+
+def fetch_article_and_tags(slug, space=None):
+    """記事とタグ一覧を並行して取得し、(本文, リビジョン, タグ一覧, tags_hash) を返す
+
+    コールドスタート時の待ち時間は2つの取得の合計ではなく遅い方だけになる。
+    spaceを省略するとデフォルトのスペース
+    """
+    return asyncio.run(fetch_article_and_tags_async(slug, space))
+
+def get_space_client(space):
+    """スペース・環境用のContentfulクライアント（接続プールは共有）"""
+    return get_contentful_client().for_space(space.space_id, space.environment)
+
+def get_article_from_contentful(slug, space=None):
     """Contentfulから記事を取得"""
-    http = urllib3.PoolManager()
-    access_token = os.environ.get('CONTENTFUL_ACCESS_TOKEN')
-    url = f"https://cdn.contentful.com/spaces/ct0aopd36mqt/entries?limit=1&fields.slug={slug}&locale=ja&access_token={access_token}&content_type=blogPost&select=fields.content,fields.title"
+    blog_text, _ = get_article_revision_from_contentful(slug, space)
+    return blog_text
+
+def get_article_revision_from_contentful(slug, space=None):
+    """Contentfulから記事と sys.revision を取得（キャッシュ済みなら変更の有無だけ確認）
+
+    ETagがあればIf-None-Matchで、なければリビジョンだけを取得して再検証し、
+    未変更なら本文はダウンロードしない
+    """
+    space = space or get_space()
+    client = get_space_client(space)
+    params = {
+        'limit': 1,
+        'fields.slug': slug,
+        'locale': 'ja',
+        'content_type': space.content_type,
+        'select': 'fields.content,fields.title,sys.revision'
+    }
+    
+    cached = space.get_article(slug)
+    if cached and not cached['etag']:
+        data = client.get_entries({**params, 'select': 'sys.revision'})
+        items = data.get('items') or []
+        if items and items[0].get('sys', {}).get('revision') == cached['revision']:
+            return cached['text'], cached['revision']
     
-    response = http.request('GET', url)
-    data = json.loads(response.data.decode('utf-8'))
+    data, etag = client.get_entries_if_changed(params, cached['etag'] if cached else None)
+    if data is None:
+        return cached['text'], cached['revision']
     
     if data.get('items') and len(data['items']) > 0:
-        fields = data['items'][0].get('fields', {})
+        item = data['items'][0]
+        fields = item.get('fields', {})
         title = fields.get('title', '')
         content = fields.get('content', '')
-        return f"{title}\n\n{content}"
+        blog_text = f"{title}\n\n{content}"
+        revision = item.get('sys', {}).get('revision')
+        
+        # スペースごとの上限を超えたら古いものから破棄
+        space.cache_article(slug, {'text': blog_text, 'revision': revision, 'etag': etag})
+        return blog_text, revision
     
-    return None
+    space.discard_article(slug)
+    return None, None
 
-def get_tags_from_contentful_cached():
-    """Contentfulからタグ一覧を取得（ファイルキャッシュ付き）"""
-    global TAGS_CACHE, TAGS_HASH
-    
-    # メモリキャッシュをチェック
-    if TAGS_CACHE and TAGS_HASH:
-        return TAGS_CACHE, TAGS_HASH
-    
-    # ファイルキャッシュをチェック
-    cache_file = '/tmp/contentful_tags_cache.json'
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-                TAGS_CACHE = cache_data['tags_data']
-                TAGS_HASH = cache_data['tags_hash']
-                return TAGS_CACHE, TAGS_HASH
-        except Exception:
-            pass  # ファイル読み込みエラー時はAPI取得へ
+def fetch_article_and_tags_graphql(slug, with_tags=True, space=None):
+    """GraphQL Content APIで記事（with_tagsならタグ一覧も）を1回のリクエストで取得
+
+    (本文, リビジョン, タグ一覧) を返す。リビジョンは sys.publishedVersion で、
+    Delivery APIの sys.revision とは値が異なる。with_tags=Falseならタグ一覧はNone
+    """
+    space = space or get_space()
+    types = {'content_type': space.content_type, 'tags_content_type': space.tags_content_type}
+    data = get_space_client(space).query_graphql(
+        (ARTICLE_AND_TAGS_QUERY if with_tags else ARTICLE_QUERY) % types,
+        {'slug': slug, 'locale': 'ja'}
+    )
     
-    # Contentful APIから取得
-    http = urllib3.PoolManager()
-    access_token = os.environ.get('CONTENTFUL_ACCESS_TOKEN')
-    url = f"https://cdn.contentful.com/spaces/ct0aopd36mqt/entries?limit=1&select=fields.tags&access_token={access_token}&content_type=blogTags"
+    blog_text, revision = None, None
+    items = (data.get(f"{space.content_type}Collection") or {}).get('items') or []
+    if items and items[0]:
+        item = items[0]
+        blog_text = f"{item.get('title') or ''}\n\n{item.get('content') or ''}"
+        revision = (item.get('sys') or {}).get('publishedVersion')
     
-    response = http.request('GET', url)
-    data = json.loads(response.data.decode('utf-8'))
+    tags_data = None
+    if with_tags:
+        tag_items = (data.get(f"{space.tags_content_type}Collection") or {}).get('items') or []
+        tags_data = parse_tags(tag_items[0].get('tags') if tag_items and tag_items[0] else [])
+    return blog_text, revision, tags_data
+
+def get_articles_from_contentful(slugs, page_size=ARTICLE_PAGE_SIZE, space=None):
+    """複数記事を fields.slug[in] で一括取得し、(slug, 本文) を順に返すジェネレーター
+
+    slugsはpage_size件ずつ読み進めるため、数千件でもメモリ使用量は一定。
+    見つからなかったslugは本文Noneで返す
+    """
+    space = space or get_space()
+    client = get_space_client(space)
+    slugs = iter(slugs)
+    while True:
+        batch = list(dict.fromkeys(islice(slugs, page_size)))
+        if not batch:
+            return
+        
+        missing = set(batch)
+        skip = 0
+        while True:
+            data = client.get_entries({
+                'fields.slug[in]': ','.join(batch),
+                'locale': 'ja',
+                'content_type': space.content_type,
+                'select': 'fields.slug,fields.content,fields.title',
+                'skip': skip,
+                'limit': page_size
+            })
+            items = data.get('items') or []
+            for item in items:
+                fields = item.get('fields', {})
+                slug = fields.get('slug')
+                missing.discard(slug)
+                yield slug, f"{fields.get('title', '')}\n\n{fields.get('content', '')}"
+            
+            skip += len(items)
+            if not items or skip >= data.get('total', 0):
+                break
+        
+        for slug in batch:
+            if slug in missing:
+                yield slug, None
+
+def get_cached_result(slug, revision, *options, space=None):
+    """同じリビジョン・同じ条件の処理結果を取得（なければNone）"""
+    if revision is None:
+        return None
+    return (space or get_space()).get_result((slug, revision) + options)
+
+def save_cached_result(slug, revision, result, *options, space=None):
+    """処理結果をリビジョン単位で保存（slugごとに最新のリビジョンだけ保持）"""
+    if revision is None:
+        return
+    (space or get_space()).cache_result((slug, revision) + options, result)
+
+def get_tags_hash(tags_data):
+    """タグ一覧のハッシュ"""
+    content_str = json.dumps(tags_data, sort_keys=True)
+    return hashlib.md5(content_str.encode('utf-8')).hexdigest()
+
+def parse_tags(tags):
+    """タグエントリのtagsフィールドをタグ一覧に変換"""
+    return [{'id': tag.get('id'), 'name': tag.get('name')} for tag in tags or []]
+
+def fetch_tags_from_contentful(space=None):
+    """Contentful APIからタグ一覧を取得し、(タグ一覧, ハッシュ) を返す"""
+    space = space or get_space()
+    data = get_space_client(space).get_entries({
+        'limit': 1,
+        'select': 'fields.tags',
+        'content_type': space.tags_content_type
+    })
     
     tags_data = []
     if data.get('items') and len(data['items']) > 0:
-        tags = data['items'][0].get('fields', {}).get('tags', [])
-        for tag in tags:
-            tags_data.append({
-                'id': tag.get('id'),
-                'name': tag.get('name')
-            })
+        tags_data = parse_tags(data['items'][0].get('fields', {}).get('tags', []))
     
-    # ハッシュ生成
-    content_str = json.dumps(tags_data, sort_keys=True)
-    content_hash = hashlib.md5(content_str.encode('utf-8')).hexdigest()
+    return tags_data, get_tags_hash(tags_data)
+
+def sync_tags_from_contentful(sync_token=None, space=None):
+    """Sync APIで前回のsync_token以降の変更を取得
+
+    (タグ一覧, 次のsync_token) を返す。タグエントリに変更がなければタグ一覧はNone。
+    sync_tokenがなければ初回同期（全件）になる
+    """
+    space = space or get_space()
+    client = get_space_client(space)
+    if sync_token:
+        params = {'sync_token': sync_token}
+    else:
+        params = {'initial': 'true', 'type': 'Entry', 'content_type': space.tags_content_type}
     
-    # メモリキャッシュに保存
-    TAGS_CACHE = tags_data
-    TAGS_HASH = content_hash
+    tags_data = None
+    while True:
+        data = client.get_json(f"{client.space_path}/sync", params)
+        for item in data.get('items', []):
+            if item.get('sys', {}).get('type') != 'Entry':
+                continue
+            # Sync APIのフィールドはロケールごと
+            localized = item.get('fields', {}).get('tags', {})
+            tags = localized.get('ja') or next(iter(localized.values()), [])
+            tags_data = parse_tags(tags)
+        
+        next_url = data.get('nextPageUrl') or data.get('nextSyncUrl')
+        params = {'sync_token': parse_qs(urlparse(next_url).query)['sync_token'][0]}
+        if not data.get('nextPageUrl'):
+            return tags_data, params['sync_token']
+
+def fetch_tags_update(sync_token=None, space=None):
+    """タグ一覧の更新を取得し、(タグ一覧, sync_token) を返す（変更がなければタグ一覧はNone）"""
+    if TAGS_SYNC:
+        try:
+            return sync_tags_from_contentful(sync_token, space)
+        except Exception:
+            pass  # Sync APIが使えなければ全件取得
+    tags_data, _ = fetch_tags_from_contentful(space)
+    return tags_data, None
+
+def diff_tags(old_tags, new_tags):
+    """タグ一覧の差分を (追加, 名前変更, 削除) で返す"""
+    old_names = {str(tag.get('id', '')): tag.get('name', '') for tag in old_tags if tag.get('id') and tag.get('name')}
+    new_names = {str(tag.get('id', '')): tag.get('name', '') for tag in new_tags if tag.get('id') and tag.get('name')}
     
-    # ファイルキャッシュに保存
+    added = [(tag_id, name) for tag_id, name in new_names.items() if tag_id not in old_names]
+    renamed = [
+        (tag_id, old_names[tag_id], name)
+        for tag_id, name in new_names.items()
+        if tag_id in old_names and old_names[tag_id] != name
+    ]
+    removed = [(tag_id, name) for tag_id, name in old_names.items() if tag_id not in new_names]
+    return added, renamed, removed
+
+def save_tags_cache(tags_data, tags_hash, fetched_at, sync_token=None, space=None):
+    """タグ一覧をスナップショット形式でスペースのファイルキャッシュに保存
+
+    保存したスナップショットをmmapしたタグ一覧（列ごとの配列）を返す（保存できなければNone）。
+    メモリキャッシュにはdictのリストの代わりにこちらを持つ
+    """
+    space = space or get_space()
+    try:
+        write_tag_snapshot(space.cache_file, tags_data, {
+            'tags_hash': tags_hash,
+            'sync_token': sync_token,
+            'timestamp': fetched_at
+        })
+    except Exception:
+        return None  # 保存エラー時は取得したリストのまま使う
+    return load_tag_snapshot(space.cache_file)
+
+def touch_tags_cache(snapshot, tags_hash, fetched_at, sync_token=None, space=None):
+    """タグ一覧が変わっていない時、スナップショットを書き直さずに取得時刻・sync_tokenだけ更新
+
+    snapshotがファイルキャッシュから読み込んだものでなければ（保存できなかった場合など）全体を保存する。
+    メモリキャッシュに持つタグ一覧を返す
+    """
+    space = space or get_space()
+    if isinstance(snapshot, TagCatalog) and 'snapshot_id' in snapshot.meta:
+        try:
+            update_tag_snapshot_meta(space.cache_file, snapshot, {'sync_token': sync_token, 'timestamp': fetched_at})
+        except Exception:
+            pass  # 保存エラー時は次のコールドスタートで早めに再取得するだけ
+        return snapshot
+    saved = save_tags_cache(snapshot, tags_hash, fetched_at, sync_token, space)
+    return saved if saved is not None else snapshot
+
+def refresh_tags_cache(space=None):
+    """タグ一覧を再取得し、tags_hashが変わった場合だけ差し替える
+
+    変わった場合は、構築済みのマッチャーに変更のあったタグだけを反映してから差し替える。
+    変わらなければスナップショットは書き直さず、取得時刻・sync_tokenだけ更新する
+    """
+    space = space or get_space()
     try:
-        cache_data = {
-            'tags_data': tags_data,
-            'tags_hash': content_hash,
-            'timestamp': time.time()
-        }
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, ensure_ascii=False)
+        tags_data, sync_token = fetch_tags_update(space.sync_token, space)
     except Exception:
-        pass  # 保存エラーは無視
+        return  # 取得エラー時は古い一覧を使い続ける
+    
+    tags_hash = get_tags_hash(tags_data) if tags_data is not None else space.tags_hash
+    if tags_hash != space.tags_hash and space.tags:
+        patch_tag_matchers(space.tags_hash, tags_hash, *diff_tags(space.tags, tags_data))
+    
+    fetched_at = time.time()
+    changed = tags_hash != space.tags_hash
+    if changed:
+        snapshot = save_tags_cache(tags_data, tags_hash, fetched_at, sync_token, space)
+        tags_data = snapshot if snapshot is not None else tags_data
+    else:
+        tags_data = touch_tags_cache(space.tags, tags_hash, fetched_at, sync_token, space)
+    with space.lock:
+        old_hash = space.tags_hash
+        space.tags = tags_data
+        if changed:
+            space.tags_hash = tags_hash
+        space.fetched_at = fetched_at
+        space.sync_token = sync_token
+    if changed and old_hash:
+        release_tag_matchers(old_hash)
+
+def start_tags_refresh(space=None):
+    """期限切れのタグ一覧をバックグラウンドで再取得（スペースごとに同時に1つだけ）"""
+    space = space or get_space()
+    now = time.time()
+    with space.lock:
+        if space.refresh_thread is not None and space.refresh_thread.is_alive():
+            return
+        if now - space.refresh_attempt_at < TAGS_REFRESH_RETRY:
+            return
+        space.refresh_attempt_at = now
+        space.refresh_thread = threading.Thread(target=refresh_tags_cache, args=(space,), daemon=True)
+        space.refresh_thread.start()
+
+def get_cached_tags(space=None):
+    """メモリまたはファイルキャッシュのタグ一覧を (タグ一覧, ハッシュ) で返す（なければNone）
+
+    TAGS_CACHE_TTLを過ぎたキャッシュもそのまま返し、再取得はバックグラウンドで行う
+    """
+    space = space or get_space()
+    
+    # メモリキャッシュをチェック
+    with space.lock:
+        tags_data, tags_hash, fetched_at = space.tags, space.tags_hash, space.fetched_at
+    if tags_data and tags_hash:
+        if time.time() - fetched_at > TAGS_CACHE_TTL:
+            start_tags_refresh(space)
+        return tags_data, tags_hash
+    
+    # ファイルキャッシュをチェック（mmapするだけで、タグは参照された時に読む）
+    snapshot = load_tag_snapshot(space.cache_file)
+    if snapshot is not None:
+        with space.lock:
+            space.tags = snapshot
+            space.tags_hash = snapshot.meta['tags_hash']
+            space.fetched_at = snapshot.meta.get('timestamp', 0)
+            space.sync_token = snapshot.meta.get('sync_token')
+        if time.time() - space.fetched_at > TAGS_CACHE_TTL:
+            start_tags_refresh(space)
+        return snapshot, snapshot.meta['tags_hash']
+    
+    return None
+
+def set_tags_cache(tags_data, sync_token=None, space=None):
+    """取得したタグ一覧をメモリとファイルにキャッシュし、(タグ一覧, ハッシュ) を返す"""
+    space = space or get_space()
+    content_hash = get_tags_hash(tags_data)
+    fetched_at = time.time()
+    
+    # ファイルキャッシュに保存し、メモリにはmmapしたスナップショットを持つ
+    snapshot = save_tags_cache(tags_data, content_hash, fetched_at, sync_token, space)
+    if snapshot is not None:
+        tags_data = snapshot
+    
+    # メモリキャッシュに保存
+    with space.lock:
+        space.tags = tags_data
+        space.tags_hash = content_hash
+        space.fetched_at = fetched_at
+        space.sync_token = sync_token
     
     return tags_data, content_hash
 
-def pre_filter_tags(blog_text, all_tags, max_tags=1000):
-    """記事内容に基づいてタグを事前フィルタリング"""
+def get_tags_from_contentful_cached(space=None):
+    """Contentfulからタグ一覧を取得（ファイルキャッシュ付き）
+
+    TAGS_CACHE_TTLを過ぎたキャッシュもそのまま返し、再取得はバックグラウンドで行う
+    """
+    space = space or get_space()
+    cached = get_cached_tags(space)
+    if cached is not None:
+        return cached
+    
+    # Contentful APIから取得（キャッシュがない初回のみ待つ）
+    tags_data, sync_token = fetch_tags_update(space=space)
+    return set_tags_cache(tags_data or [], sync_token, space)
+
+# 保持しているスペースのタグ一覧のマッチャー・インデックスは破棄しない
+register_live_tags_hashes(get_live_tags_hashes)
+
+def split_tag_words(tag_name):
+    """タグ名を空白区切りの単語に分割"""
+    return [word for word in normalize_tag_name(tag_name).split() if len(word) >= 2]
+
+register_tag_splitter('simple', split_tag_words)
+
+def pre_filter_tags(blog_text, all_tags, max_tags=1000, tags_hash=None):
+    """記事内容に基づいてタグを事前フィルタリング
+
+    記事・タグ名とも全角・半角を統一して照合し、表記の違いだけのタグは1件にまとめる
+    """
+    blog_text = fold_width(blog_text)
     blog_lower = blog_text.lower()
     keywords = re.findall(r'[A-Za-z0-9]+|[ぁ-んァ-ヶ一-龯]+', blog_text)
     keywords = [k.lower() for k in keywords if len(k) >= 2]
+    keyword_counts = Counter(keywords)
     
-    scored_tags = []
-    max_score = 0
+    # tags_hashごとに構築したオートマトンで記事を1回だけ走査
+    matcher = get_tag_matcher(all_tags, tags_hash, 'simple', split_tag_words)
+    found_terms = matcher.find_terms(blog_lower)
     
-    for tag in all_tags:
-        tag_id = str(tag.get('id', ''))
-        tag_name = tag.get('name', '')
-        
-        if not tag_id or not tag_name:
-            continue
-            
-        tag_name_lower = tag_name.lower()
-        
-        score = 0
-        if tag_name_lower in blog_lower:
-            score += 10
-        
-        for keyword in keywords:
-            if keyword in tag_name_lower or tag_name_lower in keyword:
-                score += 5
-        
-        for word in tag_name_lower.split():
-            if len(word) >= 2 and word in blog_lower:
-                score += 2
-        
-        if score > 0:
-            scored_tags.append((score, f"{tag_id}\t{tag_name}", tag_id, tag_name))
-            max_score = max(max_score, score)
+    tag_score_map = defaultdict(int)
+    for term in found_terms:
+        # タグ名が記事に出現（+10点）
+        for index in matcher.name_tags.get(term, ()):
+            tag_score_map[index] += 10
+        # タグ名の単語が記事に出現（+2点）
+        for index in matcher.word_tags.get(term, ()):
+            tag_score_map[index] += 2
     
-    scored_tags.sort(reverse=True, key=lambda x: x[0])
+    # キーワードとタグ名の包含関係（キーワード1件につき+5点）
+    for term, related_keywords in matcher.related_names(keyword_counts).items():
+        count = sum(keyword_counts[keyword] for keyword in related_keywords)
+        for index in matcher.name_tags[term]:
+            tag_score_map[index] += 5 * count
     
-    # タグ情報とスコア情報を分けて返す
-    filtered_tags = [tag for _, tag, _, _ in scored_tags[:max_tags]]
-    tag_scores = []
-    
-    for score, _, tag_id, tag_name in scored_tags[:max_tags]:
-        relevance_percentage = round((score / max_score * 100) if max_score > 0 else 0, 1)
-        tag_scores.append({
-            'id': tag_id,
-            'name': tag_name,
-            'score': score,
-            'relevance_percentage': relevance_percentage
-        })
+    # スコア降順、同点はタグID順（タグ番号のまま持ち、辞書・文字列は参照時に作る）
+    id_ranks = matcher.id_ranks()
+    ranked = sorted(((index, score) for index, score in tag_score_map.items() if score > 0), key=lambda item: (-item[1], id_ranks[item[0]]))
+    tag_scores = RankedTags(matcher, ranked, max_tags)
     
-    return filtered_tags, tag_scores
+    # タグ情報とスコア情報を分けて返す
+    return tag_scores.lines(), tag_scores
 
 def calculate_cost(model_id, cache_info):
     """環境変数ベースのモデル使用料金計算"""
@@ -0,0 +1,163 @@
+import copy
+import json
+import os
+import random
+import threading
+import time
+import urllib3
+
+# Contentful Delivery API（テスト時はローカルのサーバーに向けられる）
+CONTENTFUL_BASE_URL = os.environ.get('CONTENTFUL_BASE_URL', 'https://cdn.contentful.com')
+CONTENTFUL_GRAPHQL_URL = os.environ.get('CONTENTFUL_GRAPHQL_URL', 'https://graphql.contentful.com')
+CONTENTFUL_SPACE_ID = os.environ.get('CONTENTFUL_SPACE_ID', 'ct0aopd36mqt')
+CONTENTFUL_ENVIRONMENT = os.environ.get('CONTENTFUL_ENVIRONMENT') or None  # Noneならmaster
+
+# リトライ設定（429とサーバーエラーのみ）
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRIES = int(os.environ.get('CONTENTFUL_MAX_RETRIES', '3'))
+BACKOFF_BASE = 0.2  # 秒
+BACKOFF_MAX = 5.0  # 秒
+
+# ウォームスタート間で共有するクライアント（接続を使い回す）
+CONTENTFUL_CLIENT = None
+CONTENTFUL_CLIENT_LOCK = threading.Lock()
+
+class ContentfulError(Exception):
+    """リトライしても成功しなかったContentful APIのエラー"""
+
+    def __init__(self, status, message):
+        super().__init__(f"Contentful API error {status}: {message}")
+        self.status = status
+
+class ContentfulClient:
+    """keep-alive・gzip・リトライ付きのContentful APIクライアント（Delivery API・GraphQL Content API）"""
+
+    def __init__(self, base_url=None, space_id=None, access_token=None, max_retries=MAX_RETRIES, timeout=10.0, graphql_url=None,
+                 environment=None):
+        self.base_url = (base_url or CONTENTFUL_BASE_URL).rstrip('/')
+        self.graphql_url = (graphql_url or CONTENTFUL_GRAPHQL_URL).rstrip('/')
+        self.space_id = space_id or CONTENTFUL_SPACE_ID
+        self.environment = environment or CONTENTFUL_ENVIRONMENT
+        self.max_retries = max_retries
+
+        self.headers = urllib3.util.make_headers(keep_alive=True, accept_encoding='gzip')
+        token = access_token or os.environ.get('CONTENTFUL_ACCESS_TOKEN')
+        if token:
+            self.headers['Authorization'] = f"Bearer {token}"
+
+        # リトライはステータスを見て自前で行う（ヘッダーはスペースごとに違うため毎回渡す）
+        self.http = urllib3.PoolManager(
+            maxsize=10,
+            retries=False,
+            timeout=urllib3.Timeout(connect=3.0, read=timeout)
+        )
+
+        # 他のスペース・環境用のクライアント（接続プールを共有）
+        self.space_clients = {}
+        self.space_clients_lock = threading.Lock()
+
+    @property
+    def space_path(self):
+        """スペース（環境の指定があれば環境も）のパス"""
+        if self.environment:
+            return f"/spaces/{self.space_id}/environments/{self.environment}"
+        return f"/spaces/{self.space_id}"
+
+    def for_space(self, space_id=None, environment=None):
+        """別のスペース・環境用のクライアントを取得（接続プールは共有）
+
+        アクセストークンは CONTENTFUL_ACCESS_TOKEN_<スペースID> があればそれを使い、なければ同じトークン
+        """
+        space_id = space_id or self.space_id
+        environment = environment or self.environment
+        if space_id == self.space_id and environment == self.environment:
+            return self
+
+        key = (space_id, environment)
+        with self.space_clients_lock:
+            client = self.space_clients.get(key)
+            if client is None:
+                client = copy.copy(self)
+                client.space_id = space_id
+                client.environment = environment
+                client.headers = dict(self.headers)
+                token = os.environ.get(f"CONTENTFUL_ACCESS_TOKEN_{space_id.upper()}")
+                if token:
+                    client.headers['Authorization'] = f"Bearer {token}"
+                client.space_clients = {}
+                client.space_clients_lock = threading.Lock()
+                self.space_clients[key] = client
+        return client
+
+    def get_backoff(self, attempt, response=None):
+        """次のリトライまでの待ち時間（Retry-Afterがなければ指数バックオフ+ジッター）"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After') or response.headers.get('X-Contentful-RateLimit-Reset')
+            if retry_after:
+                try:
+                    return min(BACKOFF_MAX, float(retry_after))
+                except ValueError:
+                    pass
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def request(self, path, params=None, headers=None, body=None):
+        """GET（bodyがあればPOST）してレスポンスを返す（429/5xxと通信エラーはリトライ、304はそのまま返す）
+
+        pathはbase_urlからの相対パスか完全なURL
+        """
+        url = path if '://' in path else f"{self.base_url}{path}"
+        if headers is None:
+            headers = self.headers
+        for attempt in range(self.max_retries + 1):
+            try:
+                if body is None:
+                    response = self.http.request('GET', url, fields=params, headers=headers)
+                else:
+                    response = self.http.request('POST', url, body=body, headers=headers)
+            except urllib3.exceptions.HTTPError as e:
+                if attempt >= self.max_retries:
+                    raise ContentfulError(None, str(e))
+                time.sleep(self.get_backoff(attempt))
+                continue
+
+            if response.status < 300 or response.status == 304:
+                return response
+            if response.status not in RETRY_STATUSES or attempt >= self.max_retries:
+                raise ContentfulError(response.status, response.data[:200].decode('utf-8', 'replace'))
+            time.sleep(self.get_backoff(attempt, response))
+
+    def get_json(self, path, params=None):
+        """GETしてJSONを返す（バイト列のまま解析）"""
+        return json.loads(self.request(path, params).data)
+
+    def get_entries(self, params):
+        """エントリ一覧を取得"""
+        return self.get_json(f"{self.space_path}/entries", params)
+
+    def get_entries_if_changed(self, params, etag=None):
+        """If-None-Matchで条件付き取得し、(JSON, ETag) を返す（未変更ならJSONはNone）"""
+        headers = dict(self.headers)
+        if etag:
+            headers['If-None-Match'] = etag
+        response = self.request(f"{self.space_path}/entries", params, headers)
+        if response.status == 304:
+            return None, etag
+        return json.loads(response.data), response.headers.get('ETag')
+
+    def query_graphql(self, query, variables=None):
+        """GraphQL Content APIにクエリを送り、dataを返す（エラーがあればContentfulError）"""
+        headers = {**self.headers, 'Content-Type': 'application/json'}
+        body = json.dumps({'query': query, 'variables': variables or {}}).encode('utf-8')
+        response = self.request(f"{self.graphql_url}/content/v1{self.space_path}", headers=headers, body=body)
+        result = json.loads(response.data)
+        if result.get('errors'):
+            raise ContentfulError(response.status, result['errors'][0].get('message', ''))
+        return result.get('data') or {}
+
+def get_contentful_client():
+    """共有クライアントを取得（初回のみ作成）"""
+    global CONTENTFUL_CLIENT
+    with CONTENTFUL_CLIENT_LOCK:
+        if CONTENTFUL_CLIENT is None:
+            CONTENTFUL_CLIENT = ContentfulClient()
+    return CONTENTFUL_CLIENT
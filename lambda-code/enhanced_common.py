@@ -3,31 +3,148 @@ import os
 import json
 import urllib3
 import hashlib
+import glob
+import time
+from functools import partial
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tag_matcher import (
+    INDEX_VERSION, RankedTags, fold_width, get_live_hashes, get_tag_matcher, normalize_tag_name, register_tag_splitter
+)
+from tag_scoring import empty_features, load_tag_stats, rank_tags, score_features_bm25
+from tag_minhash import MIN_PHRASE_LENGTH, get_fuzzy_index, normalize_phrase
 
-# MeCabのインポート（フォールバック付き）
-try:
-    import MeCab
-    # MeCab設定を試行
+# カタログから生成したMeCabユーザー辞書（build_user_dict.pyで作成）
+MECAB_USER_DIC = os.environ.get(
+    'MECAB_USER_DIC',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mecab_user.dic')
+)
+USER_DIC_TAGS_HASH = None  # ユーザー辞書の生成元tags_hash
+USER_DIC_WORDS = None  # ユーザー辞書の語（生成元と異なるtags_hashのタグ一覧で使えるかの判定に使う）
+USER_DIC_COVERAGE = {}  # tags_hash → ユーザー辞書を使うか（辞書の語が全てタグ名に残っているか）
+
+def load_user_dic_version(user_dic):
+    """ユーザー辞書の生成元tags_hashを取得（辞書がなければNone）"""
+    if not os.path.exists(user_dic):
+        return None
+    try:
+        with open(f"{user_dic}.json", 'r', encoding='utf-8') as f:
+            return json.load(f)['tags_hash']
+    except Exception:
+        return None  # バージョン不明の辞書は使わない
+
+def load_user_dic_words(user_dic):
+    """ユーザー辞書に登録した語の集合（語の一覧を記録していない辞書ならNone）"""
+    try:
+        with open(f"{user_dic}.json", 'r', encoding='utf-8') as f:
+            return frozenset(json.load(f)['word_list'])
+    except Exception:
+        return None
+
+def create_tagger(user_dic=None):
+    """分かち書き用のTaggerを作成（作成できなければNone）"""
+    user_dic_option = f' -u {user_dic}' if user_dic else ''
     try:
-        tagger = MeCab.Tagger('-Owakati')
-        MECAB_AVAILABLE = True
+        return MeCab.Tagger('-Owakati' + user_dic_option)
     except:
         try:
             # 辞書パスを明示的に指定
-            tagger = MeCab.Tagger('-Owakati -d /var/lib/mecab/dic/ipadic-utf8')
-            MECAB_AVAILABLE = True
+            return MeCab.Tagger('-Owakati -d /var/lib/mecab/dic/ipadic-utf8' + user_dic_option)
         except:
-            MECAB_AVAILABLE = False
-            tagger = None
+            return None
+
+# MeCabのインポート（フォールバック付き）
+try:
+    import MeCab
+    # システム辞書のみのTagger。ユーザー辞書は生成元と同じtags_hashで解析する時に読み込む
+    tagger = create_tagger()
+    MECAB_AVAILABLE = tagger is not None
+    USER_DIC_TAGS_HASH = load_user_dic_version(MECAB_USER_DIC) if MECAB_AVAILABLE else None
+    USER_DIC_WORDS = load_user_dic_words(MECAB_USER_DIC) if USER_DIC_TAGS_HASH else None
 except ImportError:
     MECAB_AVAILABLE = False
     tagger = None
+user_tagger = None  # ユーザー辞書付きのTagger（作成できなかった場合はFalse）
+
+# ユーザー辞書の語（日本語を含む語。"生成ai" のような英数字との複合語も1語）
+USER_DIC_CHARS = 'ぁ-んァ-ヶー一-龯々'
+JAPANESE_CHAR_PATTERN = re.compile(f'[{USER_DIC_CHARS}]')
+# 日本語を含む部分を登録（英数字との複合語も。英数字だけの部分はMeCabに渡さないため除く）
+USER_DIC_WORD_PATTERN = re.compile(f'(?=.*[{USER_DIC_CHARS}])[{USER_DIC_CHARS}a-z0-9]{{2,}}')
+
+# タグ名の分割結果キャッシュ（(tags_hash, 分割方式) → 分割結果。保持しているスペースのタグ一覧ごと）
+TAG_WORDS_CACHE = {}
+TAG_WORDS_CACHE_DIR = '/tmp'
+
+# 長い記事の並列形態素解析（Lambdaはプロセスプールが使えないためEC2向け、デフォルト無効）
+TOKENIZE_WORKERS = int(os.environ.get('TOKENIZE_WORKERS', '1'))
+TOKENIZE_PARALLEL_CHARS = int(os.environ.get('TOKENIZE_PARALLEL_CHARS', '50000'))  # これより長い記事を分割
+TOKENIZE_CHUNK_CHARS = int(os.environ.get('TOKENIZE_CHUNK_CHARS', '20000'))  # 1チャンクの目安の文字数
+TOKENIZE_POOL = None
+
+def get_user_dict_words(all_tags):
+    """ユーザー辞書に登録するタグ名の日本語部分"""
+    words = set()
+    for tag in all_tags:
+        # 記事・タグ名と同じく全角・半角を統一した形で登録
+        for part in normalize_tag_name(tag.get('name', '')).split():
+            if USER_DIC_WORD_PATTERN.fullmatch(part):
+                words.add(part)
+    return sorted(words)
+
+def uses_user_dic(tags_hash):
+    """tags_hashのタグ一覧でユーザー辞書を使うか（生成元のtags_hash、またはcheck_user_dic_coverageで判定済み）"""
+    if not tags_hash or not USER_DIC_TAGS_HASH:
+        return False
+    return tags_hash == USER_DIC_TAGS_HASH or USER_DIC_COVERAGE.get(tags_hash, False)
+
+def check_user_dic_coverage(all_tags, tags_hash):
+    """tags_hashのタグ一覧でユーザー辞書を使えるか判定（tags_hashごとに1回）
+
+    タグ一覧の更新（期限切れの再取得・差分更新）でtags_hashが変わっても、辞書の語が全て
+    今のタグ名に残っていれば使い続ける。削除・改名で残っていない語があれば、タグ名にない語を
+    1語にしてしまうため使わず、その旨をログに出す（build_user_dict.pyで作り直す）
+    """
+    if not tags_hash or not USER_DIC_TAGS_HASH or tags_hash == USER_DIC_TAGS_HASH or tags_hash in USER_DIC_COVERAGE:
+        return
+    missing = None if USER_DIC_WORDS is None else USER_DIC_WORDS - set(get_user_dict_words(all_tags))
+    live_hashes = get_live_hashes(tags_hash)
+    for key in [key for key in USER_DIC_COVERAGE if key not in live_hashes]:
+        USER_DIC_COVERAGE.pop(key, None)
+    USER_DIC_COVERAGE[tags_hash] = missing is not None and not missing
+    if missing is None:
+        print(f"MeCab user dictionary not used for tags_hash {tags_hash[:8]}: the dictionary has no word list")
+    elif missing:
+        print(f"MeCab user dictionary not used for tags_hash {tags_hash[:8]}: "
+              f"{len(missing)} words are no longer in tag names (e.g. {sorted(missing)[:3]})")
+
+def get_tagger(tags_hash=None):
+    """tags_hashのタグ一覧に使うTagger（ユーザー辞書を使うタグ一覧ならユーザー辞書付き）
+
+    辞書の語が残っていないカタログでは、タグ名にない語を1語にしてしまうため使わない
+    """
+    global user_tagger
+    if not (MECAB_AVAILABLE and tagger):
+        return None
+    if not uses_user_dic(tags_hash):
+        return tagger
+    if user_tagger is None:
+        user_tagger = create_tagger(MECAB_USER_DIC) or False
+    return user_tagger or tagger
+
+def get_tokenizer_id(tags_hash=None):
+    """分割結果のキャッシュを区別するためのトークナイザー識別子（ユーザー辞書の版を含む）"""
+    current_tagger = get_tagger(tags_hash)
+    if current_tagger is None:
+        return 'simple'
+    return 'mecab' if current_tagger is tagger else f'mecab_{USER_DIC_TAGS_HASH[:8]}'
 
-def tokenize_japanese(text):
+def tokenize_japanese(text, tags_hash=None):
     """日本語テキストの形態素解析"""
-    if MECAB_AVAILABLE and tagger:
+    current_tagger = get_tagger(tags_hash)
+    if current_tagger:
         try:
-            result = tagger.parse(text).strip()
+            result = current_tagger.parse(text).strip()
             return result.split()
         except:
             pass
@@ -35,60 +152,86 @@ def tokenize_japanese(text):
     # フォールバック: 簡易分割
     return simple_japanese_split(text)
 
+# 文字種（ひらがな・カタカナ・漢字・英数字）ごとの連続部分（それ以外の文字の連続も1つの塊）
+CHAR_RUN_PATTERN = re.compile(r'[ぁ-ん]+|[ァ-ヶ]+|[一-龯]+|[A-Za-z0-9]+|[^ぁ-んァ-ヶ一-龯A-Za-z0-9]+')
+
 def simple_japanese_split(text):
-    """MeCabなしでの簡易日本語分割"""
-    tokens = []
-    current_token = ""
-    current_type = None
-    
-    for char in text:
-        char_type = get_char_type(char)
-        
-        if char_type != current_type:
-            if current_token and len(current_token) >= 2:
-                tokens.append(current_token)
-            current_token = char
-            current_type = char_type
-        else:
-            current_token += char
-    
-    if current_token and len(current_token) >= 2:
-        tokens.append(current_token)
-    
-    return tokens
-
-def get_char_type(char):
-    """文字種別を判定"""
-    if re.match(r'[ぁ-ん]', char):
-        return 'hiragana'
-    elif re.match(r'[ァ-ヶ]', char):
-        return 'katakana'
-    elif re.match(r'[一-龯]', char):
-        return 'kanji'
-    elif re.match(r'[A-Za-z0-9]', char):
-        return 'ascii'
-    else:
-        return 'other'
+    """MeCabなしでの簡易日本語分割（文字種が変わる位置で区切る）"""
+    return [token for token in CHAR_RUN_PATTERN.findall(text) if len(token) >= 2]
 
-def extract_keywords_with_mecab(text):
+# 日本語に隣接しない英数字（MeCabに渡さない。"生成AI" のように隣接するものはユーザー辞書の語になり得る）
+SEPARATE_ASCII_PATTERN = re.compile(f'(?<![{USER_DIC_CHARS}])[A-Za-z0-9]+(?![{USER_DIC_CHARS}])')
+
+def extract_keywords_with_mecab(text, tags_hash=None):
     """MeCabを使用してキーワードを抽出"""
     # 英数字キーワード
     english_keywords = re.findall(r'[A-Za-z0-9]+', text)
     english_keywords = [k.lower() for k in english_keywords if len(k) >= 2]
     
-    # 日本語キーワード（MeCab処理）
-    japanese_text = re.sub(r'[A-Za-z0-9\s]+', '', text)
-    japanese_keywords = tokenize_japanese(japanese_text)
-    japanese_keywords = [k.lower() for k in japanese_keywords if len(k) >= 2]
+    # 日本語キーワード（MeCab処理）。英数字だけの語は英数字キーワードと重複するため除く
+    japanese_text = re.sub(r'\s+', '', SEPARATE_ASCII_PATTERN.sub('', text.lower()))
+    japanese_keywords = tokenize_japanese(japanese_text, tags_hash)
+    japanese_keywords = [k for k in japanese_keywords if len(k) >= 2 and JAPANESE_CHAR_PATTERN.search(k)]
     
     return english_keywords + japanese_keywords
 
-def split_tag_name(tag_name):
+def split_text_chunks(text, chunk_chars=TOKENIZE_CHUNK_CHARS):
+    """段落の境界（空行）でchunk_chars程度のチャンクに分割"""
+    chunks = []
+    current = []
+    current_length = 0
+    for piece in re.split(r'(\n\s*\n)', text):
+        current.append(piece)
+        current_length += len(piece)
+        if current_length >= chunk_chars:
+            chunks.append(''.join(current))
+            current = []
+            current_length = 0
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+def init_tokenize_worker():
+    """ワーカープロセスごとにTaggerを作り直す（親プロセスのTaggerは共有しない）"""
+    global tagger, user_tagger
+    if MECAB_AVAILABLE:
+        tagger = create_tagger()
+        user_tagger = None
+
+def count_chunk_keywords(chunk, tags_hash=None):
+    """チャンク1つ分のキーワード出現回数（ワーカーで実行）"""
+    return Counter(extract_keywords_with_mecab(chunk, tags_hash))
+
+def get_tokenize_pool(workers):
+    """形態素解析用のプロセスプール（ウォームスタート時は再利用）"""
+    global TOKENIZE_POOL
+    if TOKENIZE_POOL is None:
+        TOKENIZE_POOL = ProcessPoolExecutor(max_workers=workers, initializer=init_tokenize_worker)
+    return TOKENIZE_POOL
+
+def extract_keyword_counts(text, workers=None, tags_hash=None):
+    """キーワードの出現回数を抽出
+
+    TOKENIZE_PARALLEL_CHARSより長い記事は段落単位のチャンクに分け、
+    プロセスプールで解析した結果を完了順に合算する
+    """
+    workers = workers or TOKENIZE_WORKERS
+    if workers <= 1 or len(text) <= TOKENIZE_PARALLEL_CHARS:
+        return Counter(extract_keywords_with_mecab(text, tags_hash))
+    
+    keyword_counts = Counter()
+    pool = get_tokenize_pool(workers)
+    futures = [pool.submit(count_chunk_keywords, chunk, tags_hash) for chunk in split_text_chunks(text)]
+    for future in as_completed(futures):
+        keyword_counts.update(future.result())
+    return keyword_counts
+
+def split_tag_name(tag_name, tags_hash=None):
     """タグ名を適切に分割（日本語・英語対応）"""
     words = []
     
-    # スペース区切りで分割
-    space_parts = tag_name.split()
+    # 全角・半角を統一してスペース区切りで分割
+    space_parts = normalize_tag_name(tag_name).split()
     
     for part in space_parts:
         if re.match(r'^[A-Za-z0-9]+$', part):
@@ -96,76 +239,228 @@ def split_tag_name(tag_name):
             words.append(part.lower())
         else:
             # 日本語を含む場合
-            japanese_words = tokenize_japanese(part)
+            japanese_words = tokenize_japanese(part, tags_hash)
             words.extend([w.lower() for w in japanese_words])
     
     return [w for w in words if len(w) >= 2]
 
-def enhanced_pre_filter_tags(blog_text, all_tags, max_tags=200):
+def split_tag_names(tag_names, tags_hash=None):
+    """複数のタグ名をまとめて分割
+
+    同じ日本語部分は1回だけ解析する。MeCabは空白をまたいで連接コストを
+    考慮するため、連結して1回で解析するとsplit_tag_nameと結果が変わる。
+    そのため部分ごとに解析し、結果はtags_hash単位でキャッシュする
+    """
+    japanese_parts = {}
+    for tag_name in tag_names:
+        for part in normalize_tag_name(tag_name).split():
+            if not re.match(r'^[A-Za-z0-9]+$', part):
+                japanese_parts.setdefault(part, None)
+    
+    for part in japanese_parts:
+        japanese_parts[part] = [w.lower() for w in tokenize_japanese(part, tags_hash)]
+    
+    tag_words = {}
+    for tag_name in tag_names:
+        words = []
+        for part in normalize_tag_name(tag_name).split():
+            if re.match(r'^[A-Za-z0-9]+$', part):
+                words.append(part.lower())
+            else:
+                words.extend(japanese_parts[part])
+        tag_words[tag_name] = [w for w in words if len(w) >= 2]
+    
+    return tag_words
+
+def get_tag_words_cache_file(tags_hash):
+    """タグ名の分割結果のファイルキャッシュのパス（tags_hashごと）"""
+    return os.path.join(TAG_WORDS_CACHE_DIR, f"contentful_tag_words_cache.{tags_hash}.json")
+
+def remove_stale_tag_words(live_hashes):
+    """どのスペースも使っていないtags_hashの分割結果（メモリ・ファイル）を破棄"""
+    for key in [key for key in TAG_WORDS_CACHE if key[0] not in live_hashes]:
+        del TAG_WORDS_CACHE[key]
+    prefix = 'contentful_tag_words_cache.'
+    for path in glob.glob(os.path.join(TAG_WORDS_CACHE_DIR, glob.escape(prefix) + '*.json')):
+        if os.path.basename(path)[len(prefix):-len('.json')] not in live_hashes:
+            try:
+                os.remove(path)
+            except Exception:
+                pass  # 削除エラーは無視
+
+def get_tag_name_words(all_tags, tags_hash=None):
+    """タグ名の分割結果を取得（メモリ → ファイル → 一括解析の順）"""
+    check_user_dic_coverage(all_tags, tags_hash)
+    tokenizer_id = get_tokenizer_id(tags_hash)
+    cache_key = (tags_hash, tokenizer_id)
+    
+    # メモリキャッシュをチェック
+    if tags_hash and cache_key in TAG_WORDS_CACHE:
+        return TAG_WORDS_CACHE[cache_key]
+    
+    # ファイルキャッシュをチェック
+    cache_file = get_tag_words_cache_file(tags_hash)
+    if tags_hash and os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cache_data = json.load(f)
+            if (cache_data.get('tags_hash') == tags_hash and cache_data.get('tokenizer') == tokenizer_id
+                    and cache_data.get('version') == INDEX_VERSION):
+                TAG_WORDS_CACHE[cache_key] = cache_data['tag_words']
+                return TAG_WORDS_CACHE[cache_key]
+        except Exception:
+            pass  # ファイル読み込みエラー時は再解析
+    
+    tag_names = [tag.get('name') for tag in all_tags if tag.get('name')]
+    tag_words = split_tag_names(tag_names, tags_hash)
+    
+    if tags_hash:
+        remove_stale_tag_words(get_live_hashes(tags_hash))
+        TAG_WORDS_CACHE[cache_key] = tag_words
+        try:
+            cache_data = {
+                'tags_hash': tags_hash,
+                'tokenizer': tokenizer_id,
+                'version': INDEX_VERSION,
+                'tag_words': tag_words,
+                'timestamp': time.time()
+            }
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump(cache_data, f, ensure_ascii=False)
+        except Exception:
+            pass  # 保存エラーは無視
+    
+    return tag_words
+
+def get_enhanced_tag_matcher(all_tags, tags_hash=None):
+    """MeCab分割のタグ名でマッチャーを取得（tags_hashごとに1回だけ構築）"""
+    check_user_dic_coverage(all_tags, tags_hash)
+    kind = f"enhanced_{get_tokenizer_id(tags_hash)}"
+    # 差分更新では同じTagger（ユーザー辞書の有無）で追加・改名したタグ名を分割
+    register_tag_splitter(kind, partial(split_tag_name, tags_hash=tags_hash))
+
+    # 分割結果はマッチャーの構築が必要になった時だけ取得
+    tag_words = {}
+    def split_words(tag_name):
+        if not tag_words:
+            tag_words.update(get_tag_name_words(all_tags, tags_hash))
+        return tag_words[tag_name]
+    
+    return get_tag_matcher(all_tags, tags_hash, kind, split_words)
+
+def extract_fuzzy_phrases(blog_text, keywords):
+    """表記揺れ照合に使う記事中の語句（キーワードと、隣接する語の連結）"""
+    phrases = {normalize_phrase(keyword) for keyword in keywords}
+    
+    # "Cloud Formation" や "Lambda 関数" のように区切られた語の連結
+    for match in re.finditer(r'[A-Za-z0-9]+(?:[ \-_][A-Za-z0-9]+)+', blog_text):
+        words = re.split(r'[ \-_]', match.group(0))
+        for first, second in zip(words, words[1:]):
+            phrases.add(f"{first}{second}".lower())
+    for match in re.findall(r'[A-Za-z0-9]+[ \-_]?[ぁ-んァ-ヶ一-龯]+|[ぁ-んァ-ヶ一-龯]+[ \-_]?[A-Za-z0-9]+', blog_text):
+        phrases.add(normalize_phrase(match))
+    
+    return [phrase for phrase in phrases if len(phrase) >= MIN_PHRASE_LENGTH]
+
+def extract_tag_features(blog_text, matcher, with_counts=False, fuzzy=False, tags_hash=None):
+    """記事から採点用の特徴（出現したタグ名・タグ単語の語番号）を抽出
+
+    with_counts=Trueの場合はBM25用に出現回数と記事長も求める
+    fuzzy=Trueの場合はMinHashで表記揺れのタグ名も拾う
+    tags_hashはタグ名の分割と同じTagger（ユーザー辞書）を使うために渡す
+    """
+    # キーワード抽出（MeCab使用）。全角・半角はタグ名と同じく統一してから照合
+    blog_text = fold_width(blog_text)
+    keyword_counts = extract_keyword_counts(blog_text, tags_hash=tags_hash)
+    blog_lower = blog_text.lower()
+    
+    features = empty_features()
+    if with_counts:
+        features['tf'] = matcher.count_terms(blog_lower)
+        features['length'] = sum(keyword_counts.values())
+        found_terms = set(features['tf'])
+    else:
+        found_terms = matcher.find_terms(blog_lower)
+    
+    # 1. 完全一致チェック
+    features['exact'] = {term for term in found_terms if term in matcher.name_tags}
+    
+    # 2. キーワードマッチング / 4. 部分マッチング（3文字以上のキーワード）
+    for term, related_keywords in matcher.related_names(keyword_counts).items():
+        features['keyword'].add(term)
+        partial_count = sum(keyword_counts[keyword] for keyword in related_keywords if len(keyword) >= 3)
+        if partial_count:
+            features['partial'][term] = partial_count
+    
+    # 3. 単語レベルマッチング（MeCab処理）
+    features['word'] = {term for term in found_terms if term in matcher.word_tags}
+    for keyword in keyword_counts:
+        term = matcher.terms.get(keyword)
+        if term is not None and term in matcher.word_tags:
+            features['word'].add(term)
+            if with_counts:
+                features['tf'][term] = max(features['tf'].get(term, 0), keyword_counts[keyword])
+    
+    # 5. 表記揺れマッチング（完全一致したタグ名は除く）
+    if fuzzy:
+        phrases = extract_fuzzy_phrases(blog_text, keyword_counts)
+        features['fuzzy'] = get_fuzzy_index(matcher).similar_names(phrases) - features['exact']
+    
+    return features
+
+def enhanced_pre_filter_tags(blog_text, all_tags, max_tags=200, tags_hash=None, scoring=None, fuzzy=None):
     """
     MeCabを使用した改良版タグフィルタリング
     200個まで絞り込み
     """
-    # キーワード抽出（MeCab使用）
-    keywords = extract_keywords_with_mecab(blog_text)
-    blog_lower = blog_text.lower()
+    return enhanced_pre_filter_tags_batch([blog_text], all_tags, max_tags, tags_hash, scoring, fuzzy)[0]
+
+def enhanced_pre_filter_tags_batch(blog_texts, all_tags, max_tags=200, tags_hash=None, scoring=None, fuzzy=None):
+    """
+    複数記事をまとめてタグフィルタリング
+    採点はタグ×語の疎行列と記事の特徴行列の積1回で行う。
+    まとめて減るのは採点の時間だけで、1記事あたりの時間の大半を占める特徴抽出
+    （形態素解析・オートマトン照合）は記事ごとにかかる（100記事で全体の5%程度の短縮）
     
-    scored_tags = []
-    max_score = 0
+    scoring='bm25'（または環境変数PREFILTER_SCORING=bm25）の場合は
+    記事コーパスの文書頻度を使ったBM25で採点する（統計ファイルがなければ従来の採点）
     
-    for tag in all_tags:
-        tag_id = str(tag.get('id', ''))
-        tag_name = tag.get('name', '')
-        
-        if not tag_id or not tag_name:
-            continue
-            
-        tag_name_lower = tag_name.lower()
-        score = 0
-        
-        # 1. 完全一致チェック（+15点）
-        if tag_name_lower in blog_lower:
-            score += 15
-        
-        # 2. キーワードマッチング（+10点）
-        for keyword in keywords:
-            if keyword in tag_name_lower or tag_name_lower in keyword:
-                score += 10
-                break
-        
-        # 3. 単語レベルマッチング（MeCab処理、+5点）
-        tag_words = split_tag_name(tag_name)
-        for word in tag_words:
-            if word in keywords or word in blog_lower:
-                score += 5
-        
-        # 4. 部分マッチング（+2点）
-        for keyword in keywords:
-            if len(keyword) >= 3:
-                if keyword in tag_name_lower or tag_name_lower in keyword:
-                    score += 2
-        
-        if score > 0:
-            scored_tags.append((score, f"{tag_id}\t{tag_name}", tag_id, tag_name))
-            max_score = max(max_score, score)
-    
-    # スコア順でソート
-    scored_tags.sort(reverse=True, key=lambda x: x[0])
-    
-    # 上位200個に絞り込み
-    filtered_tags = [tag for _, tag, _, _ in scored_tags[:max_tags]]
-    tag_scores = []
-    
-    for score, _, tag_id, tag_name in scored_tags[:max_tags]:
-        relevance_percentage = round((score / max_score * 100) if max_score > 0 else 0, 1)
-        tag_scores.append({
-            'id': tag_id,
-            'name': tag_name,
-            'score': score,
-            'relevance_percentage': relevance_percentage
-        })
-    
-    return filtered_tags, tag_scores
+    fuzzy=True（または環境変数PREFILTER_FUZZY=1）で表記揺れの加点を有効化。
+    文字2-gramの類似度は短い語や共通部分の多いタグ名で誤検出があり、時間もかかるためデフォルトは無効
+    """
+    matcher = get_enhanced_tag_matcher(all_tags, tags_hash)
+    scoring = scoring or os.environ.get('PREFILTER_SCORING', 'heuristic')
+    stats = load_tag_stats() if scoring == 'bm25' else None
+    if fuzzy is None:
+        fuzzy = os.environ.get('PREFILTER_FUZZY', '0') == '1'
+    
+    features_list = [
+        extract_tag_features(blog_text, matcher, with_counts=stats is not None, fuzzy=fuzzy and stats is None,
+                             tags_hash=tags_hash)
+        for blog_text in blog_texts
+    ]
+    if stats is not None:
+        ranked_list = [score_features_bm25(matcher, features, stats) for features in features_list]
+    else:
+        ranked_list = rank_tags(matcher, features_list)
+    
+    results = []
+    for ranked_tags in ranked_list:
+        # 上位200個に絞り込み（表記の違いだけのタグは1件にまとめ、タグ番号のまま持つ）
+        tag_scores = RankedTags(matcher, ranked_tags, max_tags)
+        results.append((tag_scores.lines(), tag_scores))
+    
+    return results
 
 # 既存の関数もインポート
-from common import get_article_from_contentful, get_tags_from_contentful_cached, calculate_cost
+from common import (
+    get_article_from_contentful,
+    get_article_revision_from_contentful,
+    get_articles_from_contentful,
+    get_tags_from_contentful_cached,
+    fetch_article_and_tags,
+    get_bedrock_client,
+    get_cached_result,
+    save_cached_result,
+    calculate_cost
+)
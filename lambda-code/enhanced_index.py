@@ -1,12 +1,16 @@
 import json
 import os
 from enhanced_common import (
-    get_article_from_contentful,
-    get_tags_from_contentful_cached,
+    fetch_article_and_tags,
+    get_bedrock_client,
+    get_cached_result,
+    save_cached_result,
     enhanced_pre_filter_tags,
     calculate_cost
 )
+from bedrock_client import invoke_model_json
 from model_router import create_summary, select_tags_with_model
+from space_cache import get_space
 
 def lambda_handler(event, context):
     try:
@@ -24,16 +28,35 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'slug is required'})
             }
         
-        # 記事取得
-        blog_text = get_article_from_contentful(slug)
+        # スペース・環境・コンテンツタイプ（省略時はデフォルト）。キャッシュはスペースごと
+        try:
+            space = get_space(
+                body.get('space_id'),
+                body.get('environment'),
+                body.get('content_type'),
+                body.get('tags_content_type')
+            )
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
+        
+        # 記事・タグデータを並行して取得（その間にBedrockクライアントも準備）
+        blog_text, revision, tags_data, tags_hash = fetch_article_and_tags(slug, space)
         if not blog_text:
             return {
                 'statusCode': 404,
                 'body': json.dumps({'error': 'Article not found'})
             }
         
-        # タグデータ取得
-        tags_data, tags_hash = get_tags_from_contentful_cached()
+        # 記事が前回から変わっていなければ前回の結果を返す（要約・LLM評価を省略）
+        cached_body = get_cached_result(slug, revision, model_id, tags_hash, space=space)
+        if cached_body:
+            return {
+                'statusCode': 200,
+                'body': cached_body
+            }
         
         # 長文判定（2000文字超）
         is_long_article = len(blog_text) > 2000
@@ -46,9 +69,10 @@ def lambda_handler(event, context):
             processing_text = blog_text
             summary_cache_info = {'input_tokens': 0, 'output_tokens': 0}
         
-        # 2. MeCabでキーワード抽出 + タグを200個に絞り込み
+        # 2. MeCabでキーワード抽出 + タグを200個（PREFILTER_MAX_TAGS）に絞り込み
+        max_tags = int(os.environ.get('PREFILTER_MAX_TAGS', '200'))
         filtered_tags, tag_scores = enhanced_pre_filter_tags(
-            processing_text, tags_data, max_tags=200
+            processing_text, tags_data, max_tags=max_tags, tags_hash=tags_hash
         )
         
         # 3. LLMでタグランキング評価
@@ -71,26 +95,29 @@ def lambda_handler(event, context):
         
         cost_info = calculate_cost(model_id, combined_cache_info)
         
+        response_body = json.dumps({
+            'slug': slug,
+            'model': model_id,
+            'selected_tags': final_tags[:20],  # 上位20個を表示
+            'tags_hash': tags_hash[:8],
+            'filtered_count': len(filtered_tags),
+            'total_tags_count': len(tags_data),
+            'is_long_article': is_long_article,
+            'article_length': len(blog_text),
+            'cache_info': combined_cache_info,
+            'cost_jpy': cost_info,
+            'processing_flow': {
+                'step1': 'Article retrieved',
+                'step2': f'Summary created (long article: {is_long_article})',
+                'step3': f'MeCab processing + filtered to {len(filtered_tags)} tags',
+                'step4': f'LLM ranking completed, top 20 selected'
+            }
+        }, ensure_ascii=False)
+        save_cached_result(slug, revision, response_body, model_id, tags_hash, space=space)
+        
         return {
             'statusCode': 200,
-            'body': json.dumps({
-                'slug': slug,
-                'model': model_id,
-                'selected_tags': final_tags[:20],  # 上位20個を表示
-                'tags_hash': tags_hash[:8],
-                'filtered_count': len(filtered_tags),
-                'total_tags_count': len(tags_data),
-                'is_long_article': is_long_article,
-                'article_length': len(blog_text),
-                'cache_info': combined_cache_info,
-                'cost_jpy': cost_info,
-                'processing_flow': {
-                    'step1': 'Article retrieved',
-                    'step2': f'Summary created (long article: {is_long_article})',
-                    'step3': f'MeCab processing + filtered to {len(filtered_tags)} tags',
-                    'step4': f'LLM ranking completed, top 20 selected'
-                }
-            }, ensure_ascii=False)
+            'body': response_body
         }
         
     except Exception as e:
@@ -101,12 +128,11 @@ def lambda_handler(event, context):
 
 def evaluate_tags_with_llm(text, tag_scores, model_id):
     """LLMを使用してタグの適合度をランキング評価"""
-    import boto3
     
     # タグリストを作成
     tag_list = []
-    for i, tag in enumerate(tag_scores, 1):
-        tag_list.append(f"{i}. {tag['name']} (ID: {tag['id']})")
+    for position in range(len(tag_scores)):
+        tag_list.append(f"{position + 1}. {tag_scores.tag_name(position)} (ID: {tag_scores.tag_id(position)})")
     
     tags_text = '\n'.join(tag_list)
     
@@ -126,7 +152,7 @@ def evaluate_tags_with_llm(text, tag_scores, model_id):
 
 {{"tags": [{{"id": "123", "name": "タグ名", "score": 85}}]}}"""
 
-    bedrock = boto3.client('bedrock-runtime')
+    bedrock = get_bedrock_client()
     
     if 'anthropic' in model_id:
         body = {
@@ -146,8 +172,8 @@ def evaluate_tags_with_llm(text, tag_scores, model_id):
             "temperature": 0.1
         }
     
-    response = bedrock.invoke_model(modelId=model_id, body=json.dumps(body))
-    response_body = json.loads(response['body'].read())
+    # ストリーミングで受け取り、"tags" のJSONが揃ったら打ち切る
+    response_body = invoke_model_json(model_id, body, 'tags', bedrock)
     
     # レスポンス解析
     if 'anthropic' in model_id:
@@ -175,9 +201,14 @@ def evaluate_tags_with_llm(text, tag_scores, model_id):
     return ranked_tags, cache_info
 
 def parse_llm_ranking(result_text, original_tags):
-    """LLMの評価結果をパース（JSON形式対応）"""
+    """LLMの評価結果をパース（JSON形式対応）
+
+    original_tagsは事前フィルタの結果（RankedTags）。LLMが選んだタグだけ辞書にする。
+    表記の違いだけで1件にまとめたタグは、選ばれたタグの直後に元のタグIDで展開する。
+    代表とまとめられた側のIDを両方返されても、同じタグは1回だけ出す
+    """
     ranked_tags = []
-    tag_dict = {tag['id']: tag for tag in original_tags}
+    emitted_ids = set()
     
     try:
         # JSON形式の解析を試行
@@ -199,12 +230,12 @@ def parse_llm_ranking(result_text, original_tags):
                 else:
                     score = int(score)
                 
-                if tag_id in tag_dict:
-                    original_tag = tag_dict[tag_id]
-                    ranked_tag = original_tag.copy()
+                position = original_tags.find(tag_id)
+                if position >= 0 and original_tags.tag_id(position) not in emitted_ids:
+                    ranked_tag = original_tags[position]
                     ranked_tag['llm_score'] = score
-                    ranked_tag['final_score'] = original_tag['score'] + score
-                    ranked_tags.append(ranked_tag)
+                    ranked_tag['final_score'] = ranked_tag['score'] + score
+                    ranked_tags.extend(expand_duplicates(ranked_tag, original_tags, position, emitted_ids))
             
             # スコア順でソート
             ranked_tags.sort(key=lambda x: x['llm_score'], reverse=True)
@@ -223,11 +254,12 @@ def parse_llm_ranking(result_text, original_tags):
                     tag_id = parts[0].strip()
                     llm_score = int(parts[1].strip())
                     
-                    if tag_id in tag_dict:
-                        tag_info = tag_dict[tag_id].copy()
+                    position = original_tags.find(tag_id)
+                    if position >= 0 and original_tags.tag_id(position) not in emitted_ids:
+                        tag_info = original_tags[position]
                         tag_info['llm_score'] = llm_score
                         tag_info['final_score'] = tag_info['score'] + (llm_score * 10)
-                        ranked_tags.append(tag_info)
+                        ranked_tags.extend(expand_duplicates(tag_info, original_tags, position, emitted_ids))
                 except:
                     continue
     
@@ -235,3 +267,14 @@ def parse_llm_ranking(result_text, original_tags):
     ranked_tags.sort(key=lambda x: x.get('llm_score', 0), reverse=True)
     
     return ranked_tags
+
+def expand_duplicates(ranked_tag, original_tags, position, emitted_ids):
+    """選ばれたタグと、表記の違いだけでまとめたタグ（同じスコア）を返す
+
+    返したタグIDはemitted_idsに記録する
+    """
+    expanded = [ranked_tag]
+    for tag_id, tag_name in original_tags.duplicates(position):
+        expanded.append(dict(ranked_tag, id=tag_id, name=tag_name))
+    emitted_ids.update(tag['id'] for tag in expanded)
+    return expanded
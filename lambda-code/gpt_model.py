@@ -1,10 +1,10 @@
 import json
-import boto3
+from bedrock_client import get_bedrock_client, invoke_model_json
 from common import extract_tags_from_response
 
 def invoke_gpt_model(blog_text, filtered_tags, tags_hash, model_id):
     """OpenAI GPT-OSSモデルを呼び出し"""
-    bedrock = boto3.client('bedrock-runtime')
+    bedrock = get_bedrock_client()
     tags_text = '\n'.join(filtered_tags)
     
     system_content = f"あなたはブログ記事の内容分析とタグ付けの専門家です。タグデータハッシュ: {tags_hash} 以下のタグリストから、ブログ記事に最も関連するタグを最大5個選択してください： {tags_text} 選択基準：1.記事の主要テーマとの関連性 2.技術的内容との一致度 3.読者にとっての有用性 <thinking>タグ内で推論を行い、最終的に以下の形式でJSONのみを出力してください: {{\"tags\": [{{\"id\": \"123\", \"name\": \"タグ名\"}}]}}"
@@ -18,8 +18,8 @@ def invoke_gpt_model(blog_text, filtered_tags, tags_hash, model_id):
         "temperature": 0
     }
     
-    response = bedrock.invoke_model(modelId=model_id, body=json.dumps(body))
-    response_body = json.loads(response['body'].read())
+    # ストリーミングで受け取り、"tags" のJSONが揃ったら打ち切る
+    response_body = invoke_model_json(model_id, body, 'tags', bedrock)
     
     result_text = response_body['choices'][0]['message']['content']
     usage = response_body.get('usage', {})
@@ -28,7 +28,10 @@ def invoke_gpt_model(blog_text, filtered_tags, tags_hash, model_id):
         'cache_creation_input_tokens': 0,
         'cache_read_input_tokens': 0,
         'input_tokens': usage.get('prompt_tokens', 0),
-        'output_tokens': usage.get('completion_tokens', 0)
+        'output_tokens': usage.get('completion_tokens', 0),
+        'stream_stopped_early': response_body.get('stream_stopped_early', False),
+        'hedged': response_body.get('hedged', False),
+        'usage_estimated': response_body.get('usage_estimated', False)
     }
     
     tags = extract_tags_from_response(result_text, model_id)
@@ -36,7 +39,7 @@ def invoke_gpt_model(blog_text, filtered_tags, tags_hash, model_id):
 
 def create_summary_with_gpt(blog_text, model_id):
     """GPT-OSSモデルで記事要約を作成"""
-    bedrock = boto3.client('bedrock-runtime')
+    bedrock = get_bedrock_client()
     
     body = {
         "messages": [
@@ -1,12 +1,16 @@
 import json
 import os
 from common import (
-    get_article_from_contentful,
-    get_tags_from_contentful_cached,
+    fetch_article_and_tags,
+    get_bedrock_client,
+    get_cached_result,
+    save_cached_result,
     pre_filter_tags,
     calculate_cost
 )
-from model_router import create_summary, select_tags_with_model
+from bedrock_client import invoke_model_json
+from model_router import create_summary, select_tags_with_model, select_tags_with_models
+from space_cache import get_space
 
 def lambda_handler(event, context):
     try:
@@ -24,43 +28,81 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'slug is required'})
             }
         
-        blog_text = get_article_from_contentful(slug)
+        # スペース・環境・コンテンツタイプ（省略時はデフォルト）。キャッシュはスペースごと
+        try:
+            space = get_space(
+                body.get('space_id'),
+                body.get('environment'),
+                body.get('content_type'),
+                body.get('tags_content_type')
+            )
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
+        
+        # 記事とタグ一覧を並行して取得（その間にBedrockクライアントも準備）
+        blog_text, revision, tags_data, tags_hash = fetch_article_and_tags(slug, space)
         if not blog_text:
             return {
                 'statusCode': 404,
                 'body': json.dumps({'error': 'Article not found'})
             }
         
-        tags_data, tags_hash = get_tags_from_contentful_cached()
-        filtered_tags, tag_scores = pre_filter_tags(blog_text, tags_data, max_tags=1000)
-        
-        # 文字数チェック
-        is_long_article = len(blog_text) > 2000
-        
         # modelパラメータが指定されていない場合はデフォルトでHaikuを使用
         if not model_id:
             model_id = 'us.anthropic.claude-haiku-4-5-20251001-v1:0'
         
+        # 複数モデルで同時にタグ選択（models: モデルIDのリスト、ensemble: rrf または first）
+        model_ids = body.get('models') or []
+        ensemble = body.get('ensemble', 'rrf')
+        if model_ids:
+            if not isinstance(model_ids, list) or ensemble not in ('rrf', 'first'):
+                return {
+                    'statusCode': 400,
+                    'body': json.dumps({'error': 'models must be a list and ensemble must be rrf or first'})
+                }
+            return process_article_with_models(
+                slug, revision, blog_text, tags_data, tags_hash, model_ids, ensemble, space
+            )
+        
+        # 記事が前回から変わっていなければ前回の結果を返す
+        cached_body = get_cached_result(slug, revision, model_id, tags_hash, space=space)
+        if cached_body:
+            return {
+                'statusCode': 200,
+                'body': cached_body
+            }
+        
+        filtered_tags, tag_scores = pre_filter_tags(blog_text, tags_data, max_tags=1000, tags_hash=tags_hash)
+        
+        # 文字数チェック
+        is_long_article = len(blog_text) > 2000
+        
         # AIによる適合度評価
         ai_scored_tags, cache_info = evaluate_tags_with_ai(
-            blog_text, tag_scores, model_id, is_long_article
+            blog_text, tag_scores, model_id, is_long_article, max_results=20
         )
         cost_info = calculate_cost(model_id, cache_info)
         
+        response_body = json.dumps({
+            'slug': slug,
+            'model': model_id,
+            'tag_candidates': ai_scored_tags[:20],  # AI評価による上位20個
+            'tags_hash': tags_hash[:8],
+            'filtered_count': len(filtered_tags),
+            'total_tags_count': len(tags_data),
+            'is_long_article': is_long_article,
+            'article_length': len(blog_text),
+            'cache_info': cache_info,
+            'cost_jpy': cost_info
+        }, ensure_ascii=False)
+        save_cached_result(slug, revision, response_body, model_id, tags_hash, space=space)
+        
         return {
             'statusCode': 200,
-            'body': json.dumps({
-                'slug': slug,
-                'model': model_id,
-                'tag_candidates': ai_scored_tags[:20],  # AI評価による上位20個
-                'tags_hash': tags_hash[:8],
-                'filtered_count': len(filtered_tags),
-                'total_tags_count': len(tags_data),
-                'is_long_article': is_long_article,
-                'article_length': len(blog_text),
-                'cache_info': cache_info,
-                'cost_jpy': cost_info
-            }, ensure_ascii=False)
+            'body': response_body
         }
         
     except Exception as e:
@@ -69,6 +111,61 @@ def lambda_handler(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
+def process_article_with_models(slug, revision, blog_text, tags_data, tags_hash, model_ids, ensemble, space):
+    """複数モデルのタグ選択を同時に実行し、順位を統合した結果を返す（長文記事は先頭のモデルで要約）"""
+    cached_body = get_cached_result(slug, revision, tuple(model_ids), ensemble, tags_hash, space=space)
+    if cached_body:
+        return {
+            'statusCode': 200,
+            'body': cached_body
+        }
+    
+    filtered_tags, _ = pre_filter_tags(blog_text, tags_data, tags_hash=tags_hash)
+    is_long_article = len(blog_text) > 2000
+    summary_cache_info = {'input_tokens': 0, 'output_tokens': 0}
+    processing_text = blog_text
+    if is_long_article:
+        processing_text, summary_cache_info = create_summary(blog_text, model_ids[0])
+    
+    selected_tags, tag_cache_info, model_results = select_tags_with_models(
+        processing_text, filtered_tags, tags_hash, model_ids, ensemble
+    )
+    
+    # キャッシュ情報を統合（タグ選択は全モデルの合計）
+    combined_cache_info = {
+        'summary_input_tokens': summary_cache_info.get('input_tokens', 0),
+        'summary_output_tokens': summary_cache_info.get('output_tokens', 0),
+        'tag_input_tokens': tag_cache_info['input_tokens'],
+        'tag_output_tokens': tag_cache_info['output_tokens'],
+        'input_tokens': summary_cache_info.get('input_tokens', 0) + tag_cache_info['input_tokens'],
+        'output_tokens': summary_cache_info.get('output_tokens', 0) + tag_cache_info['output_tokens'],
+        'cache_creation_input_tokens': tag_cache_info['cache_creation_input_tokens'],
+        'cache_read_input_tokens': tag_cache_info['cache_read_input_tokens'],
+        'used_summary': is_long_article
+    }
+    cost_info = calculate_cost(model_ids[0], combined_cache_info)
+    
+    response_body = json.dumps({
+        'slug': slug,
+        'models': model_ids,
+        'ensemble': ensemble,
+        'tags': selected_tags,
+        'model_results': model_results,
+        'tags_hash': tags_hash[:8],
+        'filtered_count': len(filtered_tags),
+        'total_tags_count': len(tags_data),
+        'is_long_article': is_long_article,
+        'article_length': len(blog_text),
+        'cache_info': combined_cache_info,
+        'cost_jpy': cost_info
+    }, ensure_ascii=False)
+    save_cached_result(slug, revision, response_body, tuple(model_ids), ensemble, tags_hash, space=space)
+    
+    return {
+        'statusCode': 200,
+        'body': response_body
+    }
+
 def process_article_with_model(blog_text, filtered_tags, tags_hash, model_id, is_long_article):
     """記事の長さに応じて要約処理を分岐"""
     if is_long_article:
@@ -97,8 +194,9 @@ def process_article_with_model(blog_text, filtered_tags, tags_hash, model_id, is
         selected_tags, cache_info = select_tags_with_model(
             blog_text, filtered_tags, tags_hash, model_id
         )
-def evaluate_tags_with_ai(blog_text, tag_scores, model_id, is_long_article):
-    """AIを使ってタグの適合度を評価"""
+
+def evaluate_tags_with_ai(blog_text, tag_scores, model_id, is_long_article, max_results=None):
+    """AIを使ってタグの適合度を評価（max_resultsを指定すると上位だけを返す）"""
     from model_router import create_summary, select_tags_with_model
     import json
     
@@ -111,43 +209,44 @@ def evaluate_tags_with_ai(blog_text, tag_scores, model_id, is_long_article):
         summary_cache_info = {'input_tokens': 0, 'output_tokens': 0}
     
     # タグリストを作成（上位1000個）
-    tag_list = []
-    for tag in tag_scores:
-        tag_list.append(f"{tag['id']}\t{tag['name']}")
-    
-    tags_text = '\n'.join(tag_list)
+    tags_text = '\n'.join(tag_scores.lines())
     
     # AIによる適合度評価
     ai_scores, eval_cache_info = evaluate_tag_relevance(
         evaluation_text, tags_text, model_id
     )
     
-    # スコアを統合
-    enhanced_tags = []
-    for tag in tag_scores:
-        tag_id = tag['id']
-        ai_score = ai_scores.get(tag_id, 0)
-        
-        # 基本スコア + AI評価スコア
-        combined_score = tag['score'] + (ai_score * 10)  # AI評価を10倍重み付け
-        
-        enhanced_tags.append({
-            'id': tag['id'],
-            'name': tag['name'],
-            'basic_score': tag['score'],
-            'ai_score': ai_score,
-            'combined_score': combined_score,
-            'relevance_percentage': round((combined_score / max([t['combined_score'] for t in enhanced_tags] + [combined_score])) * 100, 1) if combined_score > 0 else 0
-        })
+    # スコアを統合（順位のまま並べ替え、返すタグだけ辞書にする）
+    combined_scores = []
+    for position in range(len(tag_scores)):
+        ai_score = ai_scores.get(tag_scores.tag_id(position), 0)
+        # 基本スコア + AI評価スコア（AI評価を10倍重み付け）
+        combined_scores.append(tag_scores.score(position) + (ai_score * 10))
     
     # AI評価スコアでソート
-    enhanced_tags.sort(key=lambda x: x['combined_score'], reverse=True)
+    order = sorted(range(len(tag_scores)), key=lambda position: combined_scores[position], reverse=True)
+    if max_results is not None:
+        order = order[:max_results]
+    max_combined_score = combined_scores[order[0]] if order else 0
     
-    # 適合度パーセンテージを再計算
-    if enhanced_tags:
-        max_combined_score = enhanced_tags[0]['combined_score']
-        for tag in enhanced_tags:
-            tag['relevance_percentage'] = round((tag['combined_score'] / max_combined_score * 100) if max_combined_score > 0 else 0, 1)
+    enhanced_tags = []
+    for position in order:
+        tag_id = tag_scores.tag_id(position)
+        combined_score = combined_scores[position]
+        enhanced_tag = {
+            'id': tag_id,
+            'name': tag_scores.tag_name(position),
+            'basic_score': tag_scores.score(position),
+            'ai_score': ai_scores.get(tag_id, 0),
+            'combined_score': combined_score,
+            'relevance_percentage': round((combined_score / max_combined_score * 100) if max_combined_score > 0 else 0, 1)
+        }
+        enhanced_tags.append(enhanced_tag)
+        # 表記の違いだけでまとめたタグを元のタグIDで展開
+        for duplicate_id, duplicate_name in tag_scores.duplicates(position):
+            enhanced_tags.append(dict(enhanced_tag, id=duplicate_id, name=duplicate_name))
+    if max_results is not None:
+        enhanced_tags = enhanced_tags[:max_results]
     
     # キャッシュ情報を統合
     combined_cache_info = {
@@ -167,11 +266,10 @@ def evaluate_tags_with_ai(blog_text, tag_scores, model_id, is_long_article):
 def evaluate_tag_relevance(text, tags_text, model_id):
     """AIモデルを使ってタグの適合度を評価"""
     from model_router import select_tags_with_model
-    import boto3
     import json
     import re
     
-    bedrock = boto3.client('bedrock-runtime')
+    bedrock = get_bedrock_client()
     
     if 'anthropic' in model_id:
         system_text = f"あなたはブログ記事の内容分析とタグ適合度評価の専門家です。以下のタグリストの各タグについて、記事内容との適合度を0-10のスコアで評価してください。\n\nタグリスト:\n{tags_text}\n\n評価基準:\n10: 完全に一致、記事の核心的内容\n8-9: 高い関連性、重要な要素\n6-7: 中程度の関連性\n4-5: 低い関連性\n1-3: わずかな関連性\n0: 関連性なし\n\n回答は必ずこのJSON形式で出力してください: {{\"scores\": {{\"タグID\": スコア, \"タグID\": スコア}}}}"
@@ -202,8 +300,8 @@ def evaluate_tag_relevance(text, tags_text, model_id):
             "temperature": 0
         }
     
-    response = bedrock.invoke_model(modelId=model_id, body=json.dumps(body))
-    response_body = json.loads(response['body'].read())
+    # ストリーミングで受け取り、"scores" のJSONが揃ったら打ち切る
+    response_body = invoke_model_json(model_id, body, 'scores', bedrock)
     
     if 'anthropic' in model_id:
         result_text = response_body['content'][0]['text']
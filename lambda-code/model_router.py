@@ -1,7 +1,15 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from bedrock_client import BEDROCK_ATTEMPTS, BEDROCK_CANCEL, get_attempts_usage
 from claude_model import invoke_claude_model, create_summary_with_claude
 from nova_model import invoke_nova_model, create_summary_with_nova
 from gpt_model import invoke_gpt_model, create_summary_with_gpt
 
+# Reciprocal Rank Fusionの定数（大きいほど下位の順位も効く）
+RRF_K = int(os.environ.get('RRF_K', '60'))
+
 def select_tags_with_model(blog_text, filtered_tags, tags_hash, model_id):
     """モデルに応じてタグ選択を実行"""
     if 'anthropic' in model_id:
@@ -13,6 +21,110 @@ def select_tags_with_model(blog_text, filtered_tags, tags_hash, model_id):
     else:
         raise ValueError(f"Unsupported model: {model_id}")
 
+def run_tag_selection(blog_text, filtered_tags, tags_hash, model_id, cancel, attempts):
+    """1モデルのタグ選択（エラーも結果として返す）。cancelが設定されたら打ち切る
+
+    送信した呼び出しの受け取り中の内容はattempts（リスト）に入る（打ち切った時のトークン数の見積もり用）
+    """
+    token = BEDROCK_CANCEL.set(cancel)
+    attempts_token = BEDROCK_ATTEMPTS.set(attempts)
+    start_time = time.perf_counter()
+    try:
+        tags, cache_info = select_tags_with_model(blog_text, filtered_tags, tags_hash, model_id)
+        result = {'model': model_id, 'tags': tags, 'cache_info': cache_info}
+    except Exception as e:
+        result = {'model': model_id, 'tags': [], 'cache_info': {}, 'error': str(e)}
+    finally:
+        BEDROCK_ATTEMPTS.reset(attempts_token)
+        BEDROCK_CANCEL.reset(token)
+    result['latency_ms'] = round((time.perf_counter() - start_time) * 1000)
+    return result
+
+def is_good_answer(result, candidate_ids):
+    """エラーがなく、候補にあるタグを1つ以上選んだ結果"""
+    return 'error' not in result and any(str(tag.get('id')) in candidate_ids for tag in result['tags'])
+
+def fuse_rankings(rankings, k=None):
+    """複数モデルの順位をReciprocal Rank Fusionで統合（各モデルの順位rに 1 / (k + r) を加算）
+
+    同点は先に現れたタグを上位にする
+    """
+    k = RRF_K if k is None else k
+    scores = {}
+    names = {}
+    votes = {}
+    for ranking in rankings:
+        seen = set()
+        for rank, tag in enumerate(ranking, 1):
+            tag_id = str(tag.get('id', ''))
+            if not tag_id or tag_id in seen:
+                continue
+            seen.add(tag_id)
+            scores[tag_id] = scores.get(tag_id, 0) + 1 / (k + rank)
+            names.setdefault(tag_id, tag.get('name', ''))
+            votes[tag_id] = votes.get(tag_id, 0) + 1
+
+    ordered = sorted(scores, key=lambda tag_id: scores[tag_id], reverse=True)
+    return [
+        {'id': tag_id, 'name': names[tag_id], 'rrf_score': round(scores[tag_id], 6), 'votes': votes[tag_id]}
+        for tag_id in ordered
+    ]
+
+def select_tags_with_models(blog_text, filtered_tags, tags_hash, model_ids, ensemble='rrf'):
+    """複数モデルで同時にタグ選択し、(タグ一覧, キャッシュ情報, モデルごとの結果) を返す
+
+    ensemble='rrf': 全モデルの結果をReciprocal Rank Fusionで統合（最も遅いモデルの待ち時間で返る）
+    ensemble='first': 最初に届いた有効な結果を使い、残りのモデルは打ち切る
+    （ストリーミング中の呼び出しは次のイベントで閉じる。打ち切ったモデルも送信済みの呼び出しは課金されるため、
+    受け取ったところまでのトークン数を見積もって含め、結果の 'usage_estimated' をTrueにする）
+    """
+    if ensemble not in ('rrf', 'first'):
+        raise ValueError(f"Unsupported ensemble: {ensemble}")
+
+    candidate_ids = {line.split('\t', 1)[0] for line in filtered_tags}
+    cancel = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(model_ids))
+    attempts = [[] for _ in model_ids]
+    futures = [
+        executor.submit(run_tag_selection, blog_text, filtered_tags, tags_hash, model_id, cancel, attempts[index])
+        for index, model_id in enumerate(model_ids)
+    ]
+    try:
+        if ensemble == 'rrf':
+            results = [future.result() for future in futures]
+            good = [result for result in results if is_good_answer(result, candidate_ids)]
+            tags = fuse_rankings([result['tags'] for result in good])
+        else:
+            results = []
+            winner = None
+            pending = set(futures)
+            while pending and winner is None:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    results.append(result)
+                    if winner is None and is_good_answer(result, candidate_ids):
+                        winner = result
+            for future in pending:
+                index = futures.index(future)
+                cache_info = get_attempts_usage(attempts[index])
+                cache_info['usage_estimated'] = True
+                results.append({'model': model_ids[index], 'cancelled': True, 'cache_info': cache_info})
+            tags = winner['tags'] if winner else []
+    finally:
+        cancel.set()
+        executor.shutdown(wait=False)
+
+    # 全モデルのトークン数を合計（打ち切ったモデルは見積もり）
+    cache_info = {'input_tokens': 0, 'output_tokens': 0, 'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0}
+    for result in results:
+        for key in cache_info:
+            cache_info[key] += result.get('cache_info', {}).get(key, 0)
+
+    order = {model_id: index for index, model_id in enumerate(model_ids)}
+    results.sort(key=lambda result: order[result['model']])
+    return tags, cache_info, results
+
 def create_summary(blog_text, model_id):
     """モデルに応じて要約を作成"""
     if 'anthropic' in model_id:
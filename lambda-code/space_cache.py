@@ -0,0 +1,176 @@
+import os
+import re
+import threading
+
+# リクエストで指定がなければ使うスペース・環境・コンテンツタイプ
+DEFAULT_SPACE_ID = os.environ.get('CONTENTFUL_SPACE_ID', 'ct0aopd36mqt')
+DEFAULT_ENVIRONMENT = os.environ.get('CONTENTFUL_ENVIRONMENT') or None  # Noneならmaster（パスに含めない）
+DEFAULT_CONTENT_TYPE = os.environ.get('CONTENTFUL_CONTENT_TYPE', 'blogPost')
+DEFAULT_TAGS_CONTENT_TYPE = os.environ.get('CONTENTFUL_TAGS_CONTENT_TYPE', 'blogTags')
+
+# デフォルト以外に受け付けるスペースID（カンマ区切り、空ならデフォルトのスペースだけ）
+ALLOWED_SPACE_IDS = {space_id for space_id in os.environ.get('CONTENTFUL_SPACE_IDS', '').split(',') if space_id}
+
+# スペースID・環境・コンテンツタイプに使える文字（ファイルパス・URL・GraphQLのクエリに埋め込むため）
+IDENTIFIER_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+
+# 保持するスペース数の上限（受け付けるスペースが全て1つずつ入る数以上。デフォルトのスペースは残す）
+SPACE_CACHE_MAX = int(os.environ.get('SPACE_CACHE_MAX', str(max(8, len(ALLOWED_SPACE_IDS) + 1))))
+
+# 1つのスペースIDで保持する環境・コンテンツタイプの組み合わせ数の上限
+# （超えたらそのスペースの中で最も長く使われていないものを破棄し、他のスペースを追い出さない）
+SPACE_VARIANTS_MAX = int(os.environ.get('SPACE_VARIANTS_MAX', '2'))
+
+# スペースごとの記事・処理結果キャッシュの上限（件数と本文の合計文字数）
+# プロセス全体では最大 SPACE_CACHE_MAX × ARTICLE_CACHE_CHARS 文字まで保持する
+ARTICLE_CACHE_SIZE = int(os.environ.get('ARTICLE_CACHE_SIZE', '100'))
+ARTICLE_CACHE_CHARS = int(os.environ.get('ARTICLE_CACHE_CHARS', '5000000'))
+
+# タグ一覧のファイルキャッシュの置き場所
+TAGS_CACHE_DIR = '/tmp'
+
+# (スペースID, 環境, 記事のコンテンツタイプ, タグのコンテンツタイプ) → ContentfulSpace
+SPACES = {}
+SPACES_LOCK = threading.Lock()
+
+class ContentfulSpace:
+    """スペース（と環境・コンテンツタイプ）ごとのタグ一覧・記事・処理結果のキャッシュ
+
+    記事と処理結果はスペースごとに上限を持つため、
+    リクエストの多いスペースが他のスペースのキャッシュを追い出すことはない
+    （その分、本文の合計文字数は保持するスペース数に比例して増える）
+    """
+
+    def __init__(self, space_id, environment, content_type, tags_content_type):
+        self.space_id = space_id
+        self.environment = environment
+        self.content_type = content_type
+        self.tags_content_type = tags_content_type
+        self.key = (space_id, environment, content_type, tags_content_type)
+
+        # タグ一覧（期限切れでも古い一覧を返しつつ裏で再取得）
+        self.tags = None
+        self.tags_hash = None
+        self.fetched_at = 0
+        self.refresh_attempt_at = 0
+        self.refresh_thread = None
+        self.sync_token = None
+        self.lock = threading.Lock()
+        self.cache_file = get_tags_cache_file(self.key)
+
+        # 記事キャッシュ（slug → 本文・リビジョン・ETag）と処理結果キャッシュ。末尾が最近使ったもの
+        self.articles = {}
+        self.article_chars = 0
+        self.results = {}
+        self.cache_lock = threading.RLock()
+
+    def get_article(self, slug):
+        with self.cache_lock:
+            entry = self.articles.pop(slug, None)
+            if entry is not None:
+                self.articles[slug] = entry
+            return entry
+
+    def cache_article(self, slug, entry):
+        """記事をキャッシュ（件数・文字数の上限を超えたら最も長く使われていないものから破棄）"""
+        with self.cache_lock:
+            self.discard_article(slug)
+            text_length = len(entry['text'] or '')
+            while self.articles and (len(self.articles) >= ARTICLE_CACHE_SIZE
+                                     or self.article_chars + text_length > ARTICLE_CACHE_CHARS):
+                self.discard_article(next(iter(self.articles)))
+            self.articles[slug] = entry
+            self.article_chars += text_length
+
+    def discard_article(self, slug):
+        with self.cache_lock:
+            entry = self.articles.pop(slug, None)
+            if entry is not None:
+                self.article_chars -= len(entry['text'] or '')
+
+    def clear_articles(self):
+        with self.cache_lock:
+            self.articles.clear()
+            self.article_chars = 0
+
+    def get_result(self, key):
+        with self.cache_lock:
+            result = self.results.pop(key, None)
+            if result is not None:
+                self.results[key] = result
+            return result
+
+    def cache_result(self, key, result):
+        """処理結果をキャッシュ（key は (slug, リビジョン, 条件...)。slugごとに最新のリビジョンだけ保持）"""
+        slug, revision = key[:2]
+        with self.cache_lock:
+            for old_key in [old_key for old_key in self.results if old_key[0] == slug and old_key[1] != revision]:
+                del self.results[old_key]
+            while len(self.results) >= ARTICLE_CACHE_SIZE:
+                del self.results[next(iter(self.results))]
+            self.results[key] = result
+
+def get_tags_cache_file(key):
+    """タグ一覧のファイルキャッシュのパス（デフォルトのスペースは従来のパス）"""
+    if key == get_default_key():
+        return os.path.join(TAGS_CACHE_DIR, 'contentful_tags_cache.bin')
+    name = '_'.join(part or 'master' for part in key)
+    return os.path.join(TAGS_CACHE_DIR, f"contentful_tags_cache_{name}.bin")
+
+def get_default_key():
+    return (DEFAULT_SPACE_ID, DEFAULT_ENVIRONMENT, DEFAULT_CONTENT_TYPE, DEFAULT_TAGS_CONTENT_TYPE)
+
+def get_space(space_id=None, environment=None, content_type=None, tags_content_type=None):
+    """スペースのキャッシュを取得（初回のみ作成）
+
+    指定のないものはデフォルト。使えない文字を含む指定と、
+    デフォルトでもCONTENTFUL_SPACE_IDSにもないスペースはValueError
+    """
+    for name, value in (('space_id', space_id), ('environment', environment),
+                        ('content_type', content_type), ('tags_content_type', tags_content_type)):
+        if value in (None, ''):
+            continue  # 省略時はデフォルト
+        if not isinstance(value, str) or not IDENTIFIER_PATTERN.fullmatch(value):
+            raise ValueError(f"invalid {name}")
+    key = (
+        space_id or DEFAULT_SPACE_ID,
+        environment or DEFAULT_ENVIRONMENT,
+        content_type or DEFAULT_CONTENT_TYPE,
+        tags_content_type or DEFAULT_TAGS_CONTENT_TYPE
+    )
+    if key[0] != DEFAULT_SPACE_ID and key[0] not in ALLOWED_SPACE_IDS:
+        raise ValueError(f"space is not allowed: {key[0]}")
+
+    with SPACES_LOCK:
+        space = SPACES.pop(key, None)
+        if space is None:
+            space = ContentfulSpace(*key)
+            evict_spaces(key[0])
+        SPACES[key] = space  # 末尾が最近使ったスペース
+    return space
+
+def evict_spaces(space_id):
+    """space_idのスペースを追加する前に上限を超える分を破棄（SPACES_LOCKを取得して呼ぶ）
+
+    同じスペースIDの組み合わせが上限に達していればその中で、全体の上限に達していれば
+    最も多く保持しているスペースIDの中で、最も長く使われていないものを破棄する
+    """
+    default_key = get_default_key()
+    variants = [old_key for old_key in SPACES if old_key[0] == space_id and old_key != default_key]
+    while len(variants) >= SPACE_VARIANTS_MAX:
+        del SPACES[variants.pop(0)]
+
+    while len(SPACES) >= SPACE_CACHE_MAX:
+        counts = {}
+        for old_key in SPACES:
+            counts[old_key[0]] = counts.get(old_key[0], 0) + 1
+        candidates = [old_key for old_key in SPACES if old_key != default_key]
+        if not candidates:
+            break
+        busiest = max(counts[old_key[0]] for old_key in candidates)
+        del SPACES[next(old_key for old_key in candidates if counts[old_key[0]] == busiest)]
+
+def get_live_tags_hashes():
+    """保持しているスペースのtags_hash（マッチャーを残す対象）"""
+    with SPACES_LOCK:
+        return {space.tags_hash for space in SPACES.values() if space.tags_hash}
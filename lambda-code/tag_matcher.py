@@ -0,0 +1,687 @@
+import glob
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import Counter, deque
+from collections.abc import Sequence
+
+# tags_hashごとに構築済みのマッチャーを保持（バックグラウンドの再取得スレッドも更新するためMATCHER_LOCKで保護）
+MATCHER_CACHE = {}
+MATCHER_LOCK = threading.Lock()
+
+# kind → タグ名1件を単語に分割する関数（差分更新で変更のあったタグだけ分割する）
+TAG_SPLITTERS = {}
+
+# 逆方向の部分一致検索に使う文字n-gramの長さ
+NGRAM_SIZES = (2, 3)
+
+# タグ名の正規化を変えたら上げる（古いファイルキャッシュは使わない）
+INDEX_VERSION = 2
+
+# 使用中のtags_hashの集合を返す関数（複数スペースのマッチャーを残す。未登録なら最新の1つだけ残す）
+LIVE_TAGS_HASHES = None
+
+# 転置インデックスのファイルキャッシュの置き場所
+INDEX_CACHE_DIR = '/tmp'
+
+def fold_width(text):
+    """NFKCで全角・半角などの表記の違いを統一"""
+    return unicodedata.normalize('NFKC', text)
+
+def normalize_tag_name(tag_name):
+    """照合用のタグ名（全角・半角を統一して小文字化し、空白を1つにまとめる）"""
+    return ' '.join(fold_width(tag_name).lower().split())
+
+def get_cluster_keys(name_terms):
+    """正規化したタグ名から空白・区切り記号を除いたもの（同じなら表記の違いだけのタグ）
+
+    タグ名は改行を含まないので、連結して一括で置換する
+    """
+    joined = '\n'.join(name_terms)
+    for separator in (' ', '-', '_', '・'):
+        joined = joined.replace(separator, '')
+    return joined.split('\n')
+
+class AhoCorasick:
+    """複数パターンを1パスで検索するAho-Corasickオートマトン"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [-1]  # このノードで終わるパターン番号
+        self.dict_link = [0]  # failリンク上で次に出力を持つノード
+
+        for index, pattern in enumerate(self.patterns):
+            self._insert(pattern, index)
+        self._build_links()
+
+    def _insert(self, pattern, index):
+        if not pattern:
+            return
+
+        node = 0
+        for char in pattern:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(-1)
+                self.dict_link.append(0)
+            node = next_node
+        self.output[node] = index
+
+    def _build_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+
+                self.fail[child] = fail
+                self.dict_link[child] = fail if self.output[fail] >= 0 else self.dict_link[fail]
+
+    def copy(self):
+        """同じパターンを持つ別のオートマトン（元のオートマトンは変更しない）"""
+        automaton = AhoCorasick.__new__(AhoCorasick)
+        automaton.patterns = list(self.patterns)
+        automaton.goto = [dict(edges) for edges in self.goto]
+        automaton.fail = list(self.fail)
+        automaton.output = list(self.output)
+        automaton.dict_link = list(self.dict_link)
+        return automaton
+
+    def add_patterns(self, patterns):
+        """パターンを追加（トライに挿入し、failリンクだけ張り直す）"""
+        for pattern in patterns:
+            self.patterns.append(pattern)
+            self._insert(pattern, len(self.patterns) - 1)
+        self._build_links()
+
+    def find_all(self, text):
+        """text中に出現するパターン番号の集合を返す"""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        dict_link = self.dict_link
+
+        node = 0
+        hit_nodes = set()
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node] >= 0 or dict_link[node]:
+                hit_nodes.add(node)
+
+        # 出力リンクを辿って、途中で終わるパターンも回収
+        found = set()
+        visited = set()
+        for node in hit_nodes:
+            while node and node not in visited:
+                visited.add(node)
+                if output[node] >= 0:
+                    found.add(output[node])
+                node = dict_link[node]
+
+        return found
+
+    def count_all(self, text):
+        """text中のパターン番号ごとの出現回数を返す"""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        dict_link = self.dict_link
+
+        node = 0
+        node_counts = {}
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node] >= 0 or dict_link[node]:
+                node_counts[node] = node_counts.get(node, 0) + 1
+
+        # 到達したノードの回数を出力リンク上の全パターンに加算
+        counts = {}
+        for node, count in node_counts.items():
+            match = node if output[node] >= 0 else dict_link[node]
+            while match:
+                index = output[match]
+                counts[index] = counts.get(index, 0) + count
+                match = dict_link[match]
+
+        return counts
+
+    def iter_matches(self, text):
+        """全出現位置を (終了位置, パターン番号) で返す"""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        dict_link = self.dict_link
+
+        node = 0
+        for pos, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            match = node if output[node] >= 0 else dict_link[node]
+            while match:
+                yield pos + 1, output[match]
+                match = dict_link[match]
+
+class TagMatcher:
+    """タグカタログから構築する検索用インデックス
+
+    語（タグ名・タグ単語）→ タグ番号の転置インデックスを持ち、
+    記事側はオートマトンで出現語を拾ってから該当タグだけを採点する
+    """
+
+    def __init__(self, tag_ids, tag_names, term_list, name_tags, word_tags):
+        self.tag_ids = tag_ids
+        self.tag_names = tag_names
+        self.term_list = term_list
+        self.terms = {word: term for term, word in enumerate(term_list)}  # 語 → 語番号
+        self.name_tags = name_tags  # 語番号 → タグ名がその語と一致するタグ番号
+        self.word_tags = word_tags  # 語番号 → その語を含むタグ番号（重複あり）
+        self.automaton = AhoCorasick(term_list)
+
+        # 逆方向（キーワードがタグ名に含まれる）検索用の文字n-gramインデックス
+        self.name_terms = []
+        self.name_grams = {}  # 2-gram/3-gram → name_termsの位置
+        for term in sorted(name_tags):
+            self._add_name_term(term)
+
+    def _add_name_term(self, term):
+        pos = len(self.name_terms)
+        self.name_terms.append(term)
+        name = self.term_list[term]
+        grams = set()
+        for size in NGRAM_SIZES:
+            for start in range(len(name) - size + 1):
+                grams.add(name[start:start + size])
+        for gram in grams:
+            self.name_grams.setdefault(gram, []).append(pos)
+
+    @classmethod
+    def from_tags(cls, all_tags, split_words):
+        """タグ一覧から転置インデックスを構築"""
+        tag_ids = []
+        tag_names = []
+        terms = {}
+        name_tags = {}
+        word_tags = {}
+
+        def term_of(word):
+            return terms.setdefault(word, len(terms))
+
+        # スナップショットのタグ一覧は正規化したタグ名を持っている
+        normalized_name = getattr(all_tags, 'normalized_name', None)
+
+        for position, tag in enumerate(all_tags):
+            tag_id = str(tag.get('id', ''))
+            tag_name = tag.get('name', '')
+
+            if not tag_id or not tag_name:
+                continue
+
+            index = len(tag_ids)
+            tag_ids.append(tag_id)
+            tag_names.append(tag_name)
+
+            name_term = normalized_name(position) if normalized_name else normalize_tag_name(tag_name)
+            name_tags.setdefault(term_of(name_term), []).append(index)
+            for word in split_words(tag_name):
+                word_tags.setdefault(term_of(word), []).append(index)
+
+        term_list = list(terms)
+        return cls(tag_ids, tag_names, term_list, name_tags, word_tags)
+
+    @classmethod
+    def from_dict(cls, data):
+        """ファイルキャッシュの内容から復元"""
+        return cls(
+            data['tag_ids'],
+            data['tag_names'],
+            data['terms'],
+            {term: tags for term, tags in data['name_tags']},
+            {term: tags for term, tags in data['word_tags']}
+        )
+
+    def to_dict(self):
+        """ファイルキャッシュ用にJSON化できる形へ変換"""
+        return {
+            'tag_ids': self.tag_ids,
+            'tag_names': self.tag_names,
+            'terms': self.term_list,
+            'name_tags': list(self.name_tags.items()),
+            'word_tags': list(self.word_tags.items())
+        }
+
+    def patched(self, added, renamed, removed, split_words):
+        """タグの追加・名前変更・削除を反映したマッチャーを返す
+
+        added: [(タグID, タグ名)]、renamed: [(タグID, 旧タグ名, 新タグ名)]、removed: [(タグID, タグ名)]
+        変更のあったタグだけを分割し、転置インデックス・n-gram・オートマトンに差分を反映する。
+        処理中の記事が参照している元のマッチャーは変更しない
+        """
+        matcher = TagMatcher.__new__(TagMatcher)
+        matcher.tag_ids = list(self.tag_ids)
+        matcher.tag_names = list(self.tag_names)
+        matcher.term_list = list(self.term_list)
+        matcher.terms = dict(self.terms)
+        matcher.name_tags = {term: list(indexes) for term, indexes in self.name_tags.items()}
+        matcher.word_tags = {term: list(indexes) for term, indexes in self.word_tags.items()}
+        matcher.name_terms = list(self.name_terms)
+        matcher.name_grams = {gram: list(posting) for gram, posting in self.name_grams.items()}
+        matcher.automaton = self.automaton.copy()
+        # 疎行列・MinHash索引は必要になった時に作り直す
+        
+        positions = {tag_id: index for index, tag_id in enumerate(self.tag_ids) if tag_id}
+        new_terms = []
+        
+        for tag_id, tag_name in removed:
+            index = positions[tag_id]
+            matcher._unlink_tag(index, tag_name, split_words)
+            # 番号は詰めずに空けておく
+            matcher.tag_ids[index] = ''
+            matcher.tag_names[index] = ''
+        
+        for tag_id, old_name, new_name in renamed:
+            index = positions[tag_id]
+            matcher._unlink_tag(index, old_name, split_words)
+            matcher._link_tag(index, new_name, split_words, new_terms)
+            matcher.tag_names[index] = new_name
+        
+        for tag_id, tag_name in added:
+            index = len(matcher.tag_ids)
+            matcher.tag_ids.append(tag_id)
+            matcher.tag_names.append(tag_name)
+            matcher._link_tag(index, tag_name, split_words, new_terms)
+        
+        matcher.automaton.add_patterns(new_terms)
+        return matcher
+
+    def _term_of(self, word, new_terms):
+        term = self.terms.get(word)
+        if term is None:
+            term = len(self.term_list)
+            self.terms[word] = term
+            self.term_list.append(word)
+            new_terms.append(word)
+        return term
+
+    def _link_tag(self, index, tag_name, split_words, new_terms):
+        term = self._term_of(normalize_tag_name(tag_name), new_terms)
+        if term not in self.name_tags:
+            self.name_tags[term] = []
+            self._add_name_term(term)
+        self.name_tags[term].append(index)
+        for word in split_words(tag_name):
+            self.word_tags.setdefault(self._term_of(word, new_terms), []).append(index)
+
+    def _unlink_tag(self, index, tag_name, split_words):
+        # 語がなくなっても空のリストとして残す（オートマトン・n-gramはそのまま）
+        self.name_tags[self.terms[normalize_tag_name(tag_name)]].remove(index)
+        for word in split_words(tag_name):
+            self.word_tags[self.terms[word]].remove(index)
+
+    def index_of(self, tag_id):
+        """タグIDのタグ番号（なければNone）"""
+        id_index = getattr(self, 'id_index', None)
+        if id_index is None:
+            # 初回だけ作り、以降はマッチャーと一緒に使い回す
+            id_index = {tag_id: index for index, tag_id in enumerate(self.tag_ids) if tag_id}
+            self.id_index = id_index
+        return id_index.get(str(tag_id))
+
+    def id_ranks(self):
+        """タグ番号 → タグIDの順位（同点のタグをタグIDの順に並べるためのキー）
+
+        差分更新したマッチャーは追加したタグを末尾に、削除したタグを空きとして持つため、
+        タグ番号の順は再構築したマッチャーと一致しない。同点の並びはタグIDで決める
+        """
+        id_ranks = getattr(self, 'tag_id_ranks', None)
+        if id_ranks is None:
+            # 初回だけ作り、以降はマッチャーと一緒に使い回す
+            id_ranks = [0] * len(self.tag_ids)
+            for rank, index in enumerate(sorted(range(len(self.tag_ids)), key=self.tag_ids.__getitem__)):
+                id_ranks[index] = rank
+            self.tag_id_ranks = id_ranks
+        return id_ranks
+
+    def clusters(self):
+        """表記の違い（全角・半角、大文字・小文字、空白・区切り記号）だけのタグのまとまり
+
+        2件以上のまとまりについて {タグ番号: まとまりのタグ番号（タグID順）} を返す
+        """
+        clusters = getattr(self, 'tag_clusters', None)
+        if clusters is None:
+            # 初回だけ作り、以降はマッチャーと一緒に使い回す
+            terms = [term for term, indexes in self.name_tags.items() if indexes]
+            keys = get_cluster_keys([self.term_list[term] for term in terms])
+            key_counts = Counter(keys)
+            members = {}
+            for term, key in zip(terms, keys):
+                if key_counts[key] > 1 or len(self.name_tags[term]) > 1:
+                    members.setdefault(key, []).extend(self.name_tags[term])
+            clusters = {}
+            for indexes in members.values():
+                if len(indexes) > 1:
+                    indexes = sorted(indexes, key=self.id_ranks().__getitem__)
+                    for index in indexes:
+                        clusters[index] = indexes
+            self.tag_clusters = clusters
+        return clusters
+
+    def find_terms(self, text_lower):
+        """テキストに出現するタグ名・タグ単語の語番号を返す"""
+        return self.automaton.find_all(text_lower)
+
+    def count_terms(self, text_lower):
+        """テキストに出現するタグ名・タグ単語の語番号ごとの出現回数を返す"""
+        return self.automaton.count_all(text_lower)
+
+    def names_containing(self, keyword):
+        """keywordを含むタグ名の語番号を返す
+
+        n-gramの出現リストの共通部分で候補を絞り、最後に部分文字列として照合する
+        """
+        if len(keyword) < NGRAM_SIZES[0]:
+            candidates = range(len(self.name_terms))
+        else:
+            size = NGRAM_SIZES[-1] if len(keyword) >= NGRAM_SIZES[-1] else NGRAM_SIZES[0]
+            postings = []
+            for start in range(len(keyword) - size + 1):
+                posting = self.name_grams.get(keyword[start:start + size])
+                if posting is None:
+                    return []
+                postings.append(posting)
+
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                # 候補が十分少なければ残りは照合に任せる
+                if len(posting) > len(candidates) * 4:
+                    break
+                candidates.intersection_update(posting)
+                if not candidates:
+                    return []
+
+        terms = []
+        for pos in candidates:
+            term = self.name_terms[pos]
+            if keyword in self.term_list[term]:
+                terms.append(term)
+        return terms
+
+    def related_names(self, keywords):
+        """キーワードを含む、またはキーワードに含まれるタグ名を返す
+
+        戻り値は {タグ名の語番号: 該当キーワードの集合}
+        """
+        related = {}
+
+        # タグ名 ⊂ キーワード
+        for keyword in keywords:
+            for term in self.automaton.find_all(keyword):
+                if term in self.name_tags:
+                    related.setdefault(term, set()).add(keyword)
+
+        # キーワード ⊂ タグ名
+        for keyword in keywords:
+            for term in self.names_containing(keyword):
+                related.setdefault(term, set()).add(keyword)
+
+        return related
+
+
+class RankedTags(Sequence):
+    """事前フィルタの結果（スコア順の (タグ番号, スコア)）
+
+    要素は {'id', 'name', 'score', 'relevance_percentage'} の辞書として参照できるが、
+    辞書は参照された時にだけ作る。タグIDとタグ名はマッチャーの配列を引く。
+    参照・反復で得る辞書は読み取り専用として扱う（参照のたびに新しく作るため、
+    書き換えても結果には残らない）。書き換える場合はto_dictsで辞書のリストにする。
+    表記の違いだけのタグはまとまりごとに最もスコアの高い1件だけを残し、
+    残りはduplicatesで引く
+    """
+    __slots__ = ('matcher', 'ranked', 'max_score', 'positions')
+
+    def __init__(self, matcher, ranked, max_tags=None):
+        self.matcher = matcher
+        self.ranked = self._collapse(matcher.clusters(), ranked, max_tags)
+        self.max_score = max((score for _, score in self.ranked), default=0)
+        self.positions = None  # タグ番号 → 順位（findで初めて作る）
+
+    @staticmethod
+    def _collapse(clusters, ranked, max_tags):
+        if not clusters:
+            return ranked[:max_tags]
+        collapsed = []
+        seen = set()
+        for index, score in ranked:
+            members = clusters.get(index)
+            if members is not None:
+                if members[0] in seen:
+                    continue
+                seen.add(members[0])
+            collapsed.append((index, score))
+            if max_tags is not None and len(collapsed) >= max_tags:
+                break
+        return collapsed
+
+    def __len__(self):
+        return len(self.ranked)
+
+    def __getitem__(self, position):
+        """位置の要素を新しい辞書で返す（読み取り用）"""
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        index, score = self.ranked[position]
+        return {
+            'id': self.matcher.tag_ids[index],
+            'name': self.matcher.tag_names[index],
+            'score': score,
+            'relevance_percentage': self.relevance(position)
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def to_dicts(self):
+        """書き換えてよい辞書のリスト（全候補の辞書を作るため、採点の途中では使わない）"""
+        return self[:]
+
+    def tag_id(self, position):
+        return self.matcher.tag_ids[self.ranked[position][0]]
+
+    def tag_name(self, position):
+        return self.matcher.tag_names[self.ranked[position][0]]
+
+    def score(self, position):
+        return self.ranked[position][1]
+
+    def relevance(self, position):
+        """最高スコアに対する割合（%）"""
+        score = self.ranked[position][1]
+        return round((score / self.max_score * 100) if self.max_score > 0 else 0, 1)
+
+    def duplicates(self, position):
+        """候補と表記の違いだけのタグを (タグID, タグ名) で返す（タグID順）"""
+        index = self.ranked[position][0]
+        return [
+            (self.matcher.tag_ids[member], self.matcher.tag_names[member])
+            for member in self.matcher.clusters().get(index, ())
+            if member != index
+        ]
+
+    def find(self, tag_id):
+        """タグIDの順位（候補になければ-1）。候補にまとめられたタグのIDでも引ける"""
+        if self.positions is None:
+            self.positions = {index: position for position, (index, _) in enumerate(self.ranked)}
+        index = self.matcher.index_of(tag_id)
+        position = self.positions.get(index)
+        if position is None:
+            for member in self.matcher.clusters().get(index, ()):
+                position = self.positions.get(member)
+                if position is not None:
+                    break
+        return -1 if position is None else position
+
+    def lines(self):
+        """プロンプト用の "タグID\tタグ名" の並び"""
+        return RankedTagLines(self)
+
+class RankedTagLines(Sequence):
+    """RankedTagsを "タグID\tタグ名" の文字列として参照するビュー"""
+    __slots__ = ('tags',)
+
+    def __init__(self, tags):
+        self.tags = tags
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        return f"{self.tags.tag_id(position)}\t{self.tags.tag_name(position)}"
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+def register_tag_splitter(kind, split_words):
+    """差分更新で使うタグ名の分割関数を登録"""
+    TAG_SPLITTERS[kind] = split_words
+
+def register_live_tags_hashes(get_hashes):
+    """使用中のtags_hashの集合を返す関数を登録（それ以外のマッチャー・ファイルキャッシュを破棄する）"""
+    global LIVE_TAGS_HASHES
+    LIVE_TAGS_HASHES = get_hashes
+
+def get_live_hashes(tags_hash):
+    """残すtags_hashの集合（tags_hash自身を含む）"""
+    live = set()
+    if LIVE_TAGS_HASHES is not None:
+        try:
+            live = set(LIVE_TAGS_HASHES())
+        except Exception:
+            pass  # 取得できなければ最新の1つだけ残す
+    live.add(tags_hash)
+    return live
+
+def patch_tag_matchers(old_hash, new_hash, added, renamed, removed):
+    """old_hashのマッチャーに差分を反映し、new_hashのマッチャーとして登録・保存
+
+    old_hashのマッチャーは同じタグ一覧の他のスペースが使っている場合があるため残す
+    （差し替え後にrelease_tag_matchersで破棄する）
+    """
+    with MATCHER_LOCK:
+        old_matchers = [(key[0], matcher) for key, matcher in MATCHER_CACHE.items() if key[1] == old_hash]
+    for kind, old_matcher in old_matchers:
+        if kind not in TAG_SPLITTERS:
+            continue
+        try:
+            matcher = old_matcher.patched(added, renamed, removed, TAG_SPLITTERS[kind])
+        except Exception:
+            continue  # 反映できなければ次回の呼び出しで再構築
+        with MATCHER_LOCK:
+            MATCHER_CACHE[(kind, new_hash)] = matcher
+        save_tag_matcher(matcher, new_hash, kind)
+
+def release_tag_matchers(tags_hash):
+    """どのスペースも使っていなければtags_hashのマッチャーを破棄"""
+    if tags_hash in get_live_hashes(None):
+        return
+    with MATCHER_LOCK:
+        for key in [key for key in MATCHER_CACHE if key[1] == tags_hash]:
+            del MATCHER_CACHE[key]
+
+def get_index_cache_file(kind, tags_hash):
+    """転置インデックスのファイルキャッシュのパス（タグキャッシュと同じ場所、tags_hashごと）"""
+    return os.path.join(INDEX_CACHE_DIR, f"contentful_tags_index_{kind}.{tags_hash}.json")
+
+def remove_stale_index_files(kind, live_hashes):
+    """使われていないtags_hashの転置インデックスのファイルキャッシュを削除"""
+    prefix = f"contentful_tags_index_{kind}."
+    for path in glob.glob(os.path.join(INDEX_CACHE_DIR, glob.escape(prefix) + '*.json')):
+        tags_hash = os.path.basename(path)[len(prefix):-len('.json')]
+        if tags_hash not in live_hashes:
+            try:
+                os.remove(path)
+            except Exception:
+                pass  # 削除エラーは無視
+
+def load_tag_matcher(tags_hash, kind):
+    """ファイルキャッシュからマッチャーを復元（ハッシュ不一致ならNone）"""
+    cache_file = get_index_cache_file(kind, tags_hash)
+    if not os.path.exists(cache_file):
+        return None
+
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache_data = json.load(f)
+        if cache_data.get('tags_hash') != tags_hash or cache_data.get('version') != INDEX_VERSION:
+            return None
+        return TagMatcher.from_dict(cache_data['index'])
+    except Exception:
+        return None  # 読み込みエラー時は再構築
+
+def save_tag_matcher(matcher, tags_hash, kind):
+    """マッチャーの転置インデックスをファイルキャッシュに保存"""
+    try:
+        cache_data = {
+            'tags_hash': tags_hash,
+            'version': INDEX_VERSION,
+            'index': matcher.to_dict(),
+            'timestamp': time.time()
+        }
+        with open(get_index_cache_file(kind, tags_hash), 'w', encoding='utf-8') as f:
+            json.dump(cache_data, f, ensure_ascii=False)
+    except Exception:
+        pass  # 保存エラーは無視
+
+def get_tag_matcher(all_tags, tags_hash, kind, split_words):
+    """tags_hashごとにマッチャーを構築・キャッシュ
+
+    kindは単語分割方式の識別子（分割方式が違えば別のマッチャーになる）
+    メモリ → ファイル → 構築の順に探す
+    """
+    if not tags_hash:
+        return TagMatcher.from_tags(all_tags, split_words)
+
+    cache_key = (kind, tags_hash)
+    with MATCHER_LOCK:
+        matcher = MATCHER_CACHE.get(cache_key)
+    if matcher is not None:
+        return matcher
+
+    live_hashes = get_live_hashes(tags_hash)
+    matcher = load_tag_matcher(tags_hash, kind)
+    if matcher is None:
+        matcher = TagMatcher.from_tags(all_tags, split_words)
+        save_tag_matcher(matcher, tags_hash, kind)
+        remove_stale_index_files(kind, live_hashes)
+
+    # どのスペースも使っていないハッシュのマッチャーは破棄（構築の間に他のスレッドが登録していればそちらを使う）
+    with MATCHER_LOCK:
+        for key in [key for key in MATCHER_CACHE if key[0] == kind and key[1] not in live_hashes]:
+            del MATCHER_CACHE[key]
+        matcher = MATCHER_CACHE.setdefault(cache_key, matcher)
+
+    return matcher
@@ -0,0 +1,103 @@
+import random
+import re
+import zlib
+
+# 文字n-gram（シングル）の長さ
+SHINGLE_SIZE = 2
+
+# MinHashの署名長とLSHのバンド数（1バンド3行 → 類似度0.6で約9割が候補になる）
+MINHASH_PERMUTATIONS = 30
+LSH_BANDS = 10
+
+# 候補を最終的に採用するJaccard係数の下限
+FUZZY_THRESHOLD = 0.6
+
+# 短すぎる語句はシングルが少なく誤検出が多いので対象外
+MIN_PHRASE_LENGTH = 3
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(42)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+
+def normalize_phrase(text):
+    """表記揺れ比較用に小文字化し、空白・区切り記号を除去"""
+    return re.sub(r'[\s\-_・]+', '', text.lower())
+
+def get_shingles(text):
+    """文字n-gramの集合"""
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[start:start + SHINGLE_SIZE] for start in range(len(text) - SHINGLE_SIZE + 1)}
+
+class MinHashLSH:
+    """文字シングルのMinHash署名をバンドに分けてバケット化した近似検索インデックス"""
+
+    def __init__(self, phrases):
+        self.phrases = list(phrases)
+        self.shingle_sets = [get_shingles(phrase) for phrase in self.phrases]
+        self.hash_cache = {}  # シングル → 各ハッシュ関数の値（カタログ分のみ保持）
+        self.buckets = {}
+
+        for index, shingles in enumerate(self.shingle_sets):
+            for key in self._band_keys(self._signature(shingles, cache=True)):
+                self.buckets.setdefault(key, []).append(index)
+
+    def _shingle_hashes(self, shingle, cache):
+        values = self.hash_cache.get(shingle)
+        if values is None:
+            x = zlib.crc32(shingle.encode('utf-8'))
+            values = [(a * x + b) % _PRIME for a, b in _PERMUTATIONS]
+            if cache:
+                self.hash_cache[shingle] = values
+        return values
+
+    def _signature(self, shingles, cache=False):
+        return list(map(min, zip(*(self._shingle_hashes(shingle, cache) for shingle in shingles))))
+
+    def _band_keys(self, signature):
+        rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        return [(band, tuple(signature[band * rows:(band + 1) * rows])) for band in range(LSH_BANDS)]
+
+    def query(self, phrase, threshold=FUZZY_THRESHOLD):
+        """phraseに近い登録語句を (番号, Jaccard係数) で返す"""
+        shingles = get_shingles(phrase)
+        candidates = set()
+        for key in self._band_keys(self._signature(shingles)):
+            candidates.update(self.buckets.get(key, ()))
+
+        # バケットが衝突しただけの候補は実際のJaccard係数で除外
+        results = []
+        for index in candidates:
+            other = self.shingle_sets[index]
+            similarity = len(shingles & other) / len(shingles | other)
+            if similarity >= threshold:
+                results.append((index, similarity))
+        return results
+
+class FuzzyTagIndex:
+    """タグ名の表記揺れ（"Cloud Formation" と "CloudFormation" など）を拾う索引"""
+
+    def __init__(self, matcher):
+        self.phrase_terms = {}  # 正規化したタグ名 → タグ名の語番号
+        for term in matcher.name_tags:
+            phrase = normalize_phrase(matcher.term_list[term])
+            if len(phrase) >= MIN_PHRASE_LENGTH:
+                self.phrase_terms.setdefault(phrase, []).append(term)
+
+        self.lsh = MinHashLSH(self.phrase_terms)
+
+    def similar_names(self, phrases):
+        """記事の語句に近いタグ名の語番号を返す"""
+        terms = set()
+        for phrase in phrases:
+            for index, _ in self.lsh.query(phrase):
+                terms.update(self.phrase_terms[self.lsh.phrases[index]])
+        return terms
+
+def get_fuzzy_index(matcher):
+    """マッチャーに対応するMinHash索引を構築（マッチャーと同じくtags_hashごとに1回）"""
+    fuzzy_index = getattr(matcher, 'fuzzy_index', None)
+    if fuzzy_index is None:
+        fuzzy_index = FuzzyTagIndex(matcher)
+        matcher.fuzzy_index = fuzzy_index
+    return fuzzy_index
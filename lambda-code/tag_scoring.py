@@ -0,0 +1,222 @@
+import gzip
+import json
+import math
+import os
+from collections import defaultdict
+
+# NumPy/SciPyのインポート（フォールバック付き）
+try:
+    import numpy as np
+    from scipy import sparse
+    SPARSE_AVAILABLE = True
+except ImportError:
+    SPARSE_AVAILABLE = False
+
+# enhanced_pre_filter_tagsの採点ルール
+EXACT_MATCH_SCORE = 15  # タグ名が記事に出現
+KEYWORD_MATCH_SCORE = 10  # キーワードとタグ名が包含関係
+WORD_MATCH_SCORE = 5  # タグ名の単語が記事・キーワードに出現
+PARTIAL_MATCH_SCORE = 2  # 3文字以上のキーワード1件ごと
+FUZZY_MATCH_SCORE = 8  # タグ名の表記揺れが記事に出現（MinHash）
+
+# BM25のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 記事コーパスの統計（文書頻度）
+TAG_STATS = None
+TAG_STATS_PATH = os.environ.get(
+    'TAG_STATS_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tag_stats.json.gz')
+)
+
+def empty_features():
+    """記事1件分の特徴（語番号の集合）"""
+    return {
+        'exact': set(),  # 記事に出現したタグ名
+        'keyword': set(),  # キーワードと包含関係にあるタグ名
+        'partial': {},  # タグ名 → 包含関係にある3文字以上のキーワード数
+        'word': set(),  # 記事・キーワードに出現したタグ単語
+        'fuzzy': set(),  # 表記揺れとして記事に出現したタグ名
+        'tf': {},  # 語番号 → 出現回数（BM25用）
+        'length': 0  # 記事のキーワード数（BM25用）
+    }
+
+def load_tag_stats(path=None):
+    """BM25用の文書頻度を読み込み（ファイルがなければNone）"""
+    global TAG_STATS
+
+    path = path or TAG_STATS_PATH
+    if TAG_STATS is not None and TAG_STATS.get('path') == path:
+        return TAG_STATS
+
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            stats = json.load(f)
+        stats['path'] = path
+        TAG_STATS = stats
+        return stats
+    except Exception:
+        return None  # 読み込みエラー時は従来の採点
+
+def save_tag_stats(stats, path=None):
+    """文書頻度をgzip圧縮したJSONで保存"""
+    with gzip.open(path or TAG_STATS_PATH, 'wt', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, separators=(',', ':'))
+
+def score_features_bm25(matcher, features, stats):
+    """BM25でタグを採点し、(タグ番号, スコア) をスコア順で返す
+
+    タグ名・タグ単語をクエリ、記事を文書とみなす。
+    どの記事にも出てくる語（AWSなど）はidfが小さくなる
+    """
+    doc_count = stats['doc_count']
+    document_frequency = stats['df']
+    avg_length = stats['avg_length'] or 1
+    length_norm = BM25_K1 * (1 - BM25_B + BM25_B * features['length'] / avg_length)
+
+    tag_score_map = defaultdict(float)
+    for term, tf in features['tf'].items():
+        df = document_frequency.get(matcher.term_list[term], 0)
+        idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+        term_score = idf * tf * (BM25_K1 + 1) / (tf + length_norm)
+
+        for index in matcher.name_tags.get(term, ()):
+            tag_score_map[index] += term_score
+        for index in matcher.word_tags.get(term, ()):
+            tag_score_map[index] += term_score
+
+    ranked_tags = [(index, round(score, 2)) for index, score in tag_score_map.items()]
+    id_ranks = matcher.id_ranks()
+    return sorted(ranked_tags, key=lambda item: (-item[1], id_ranks[item[0]]))
+
+def score_features(matcher, features):
+    """特徴から該当タグだけを採点し、(タグ番号, スコア) をスコア順で返す"""
+    tag_score_map = defaultdict(int)
+
+    for term in features['exact']:
+        for index in matcher.name_tags[term]:
+            tag_score_map[index] += EXACT_MATCH_SCORE
+
+    for term in features['keyword']:
+        bonus = KEYWORD_MATCH_SCORE + PARTIAL_MATCH_SCORE * features['partial'].get(term, 0)
+        for index in matcher.name_tags[term]:
+            tag_score_map[index] += bonus
+
+    for term in features['word']:
+        for index in matcher.word_tags[term]:
+            tag_score_map[index] += WORD_MATCH_SCORE
+
+    for term in features['fuzzy']:
+        for index in matcher.name_tags[term]:
+            tag_score_map[index] += FUZZY_MATCH_SCORE
+
+    # 同点はタグID順（差分更新したマッチャーでも再構築した場合と同じ並び）
+    id_ranks = matcher.id_ranks()
+    return sorted(tag_score_map.items(), key=lambda item: (-item[1], id_ranks[item[0]]))
+
+class SparseTagScorer:
+    """タグ×語の疎行列による一括採点
+
+    列は [タグ名出現 | キーワード包含 | 部分一致数 | 単語出現 | 表記揺れ] の5ブロックで、
+    各ブロックに採点ルールの重みを持たせる。記事側は同じ列空間の
+    特徴ベクトルになり、スコアは行列積1回で求まる
+    """
+
+    def __init__(self, matcher):
+        self.term_count = len(matcher.term_list)
+        tag_count = len(matcher.tag_ids)
+        block = self.term_count
+
+        rows = []
+        cols = []
+        values = []
+        for term, indexes in matcher.name_tags.items():
+            for index in indexes:
+                rows.extend((index, index, index, index))
+                cols.extend((term, block + term, 2 * block + term, 4 * block + term))
+                values.extend((EXACT_MATCH_SCORE, KEYWORD_MATCH_SCORE, PARTIAL_MATCH_SCORE, FUZZY_MATCH_SCORE))
+        for term, indexes in matcher.word_tags.items():
+            for index in indexes:
+                # 同じ単語を複数回含むタグは重複分が加算される
+                rows.append(index)
+                cols.append(3 * block + term)
+                values.append(WORD_MATCH_SCORE)
+
+        self.matrix = sparse.csr_matrix(
+            (np.array(values, dtype=np.int32), (rows, cols)),
+            shape=(tag_count, 5 * block),
+            dtype=np.int32
+        )
+        self.id_ranks = np.array(matcher.id_ranks(), dtype=np.int64)
+
+    def feature_matrix(self, features_list):
+        """記事ごとの特徴を 語×記事 の疎行列に変換"""
+        block = self.term_count
+        rows = []
+        cols = []
+        values = []
+        for column, features in enumerate(features_list):
+            for term in features['exact']:
+                rows.append(term)
+                cols.append(column)
+                values.append(1)
+            for term in features['keyword']:
+                rows.append(block + term)
+                cols.append(column)
+                values.append(1)
+            for term, count in features['partial'].items():
+                rows.append(2 * block + term)
+                cols.append(column)
+                values.append(count)
+            for term in features['word']:
+                rows.append(3 * block + term)
+                cols.append(column)
+                values.append(1)
+            for term in features['fuzzy']:
+                rows.append(4 * block + term)
+                cols.append(column)
+                values.append(1)
+
+        return sparse.csc_matrix(
+            (np.array(values, dtype=np.int32), (rows, cols)),
+            shape=(5 * block, len(features_list)),
+            dtype=np.int32
+        )
+
+    def score_batch(self, features_list):
+        """複数記事を1回の行列積で採点し、記事ごとに (タグ番号, スコア) をスコア順で返す"""
+        if not features_list:
+            return []
+
+        scores = (self.matrix @ self.feature_matrix(features_list)).tocsc()
+        scores.eliminate_zeros()
+
+        results = []
+        for column in range(len(features_list)):
+            start, end = scores.indptr[column], scores.indptr[column + 1]
+            indexes = scores.indices[start:end]
+            data = scores.data[start:end]
+            # スコア降順、同点はタグID順
+            order = np.lexsort((self.id_ranks[indexes], -data))
+            results.append(list(zip(indexes[order].tolist(), data[order].tolist())))
+
+        return results
+
+def get_sparse_scorer(matcher):
+    """マッチャーに対応する疎行列を構築（マッチャーと同じくtags_hashごとに1回）"""
+    scorer = getattr(matcher, 'sparse_scorer', None)
+    if scorer is None:
+        scorer = SparseTagScorer(matcher)
+        matcher.sparse_scorer = scorer
+    return scorer
+
+def rank_tags(matcher, features_list):
+    """複数記事の特徴をまとめて採点（NumPy/SciPyがなければ記事ごとに採点）"""
+    if SPARSE_AVAILABLE:
+        return get_sparse_scorer(matcher).score_batch(features_list)
+
+    return [score_features(matcher, features) for features in features_list]
@@ -0,0 +1,155 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import uuid
+from array import array
+from collections.abc import Sequence
+from tag_matcher import normalize_tag_name
+
+# スナップショットの形式
+#   マジック(8) | メタデータ長(4) | メタデータ(JSON) | 列ごとに [オフセット(uint32 × 件数+1) | UTF-8の連結]
+# 列は ids / names / normalized_names（照合用に正規化したタグ名）。各列の開始位置はメタデータに持つ
+SNAPSHOT_MAGIC = b'TAGSNAP2'
+SNAPSHOT_COLUMNS = ('ids', 'names', 'normalized_names')
+# 書き直さずに更新するメタデータ（取得時刻など）のファイル（スナップショットのパス + この接尾辞）。
+# 書き込んだスナップショットのsnapshot_idを持ち、一致する時だけ読み込み時にメタデータに重ねる
+SNAPSHOT_META_SUFFIX = '.meta.json'
+
+class TagCatalog(Sequence):
+    """mmapしたスナップショット上のタグ一覧
+
+    list of dictと同じように使えるが、要素は参照された時にだけデコードする
+    """
+
+    def __init__(self, buffer, meta):
+        self.buffer = buffer
+        self.meta = meta
+        self.count = meta['count']
+        self.columns = {}
+        view = memoryview(buffer)
+        for column in SNAPSHOT_COLUMNS:
+            offsets_pos, blob_pos = meta['columns'][column]
+            offsets = view[offsets_pos:offsets_pos + 4 * (self.count + 1)].cast('I')
+            self.columns[column] = (offsets, blob_pos)
+
+    def _text(self, column, index):
+        offsets, blob_pos = self.columns[column]
+        return self.buffer[blob_pos + offsets[index]:blob_pos + offsets[index + 1]].decode('utf-8')
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('tag index out of range')
+        return {'id': self._text('ids', index), 'name': self._text('names', index)}
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def normalized_name(self, index):
+        """事前に正規化したタグ名（normalize_tag_name）"""
+        return self._text('normalized_names', index)
+
+def write_tag_snapshot(path, tags_data, metadata):
+    """タグ一覧をスナップショットに書き出し（一時ファイルに書いてから置き換える）
+
+    一時ファイルは書き込みごとに別名で作る（同じプロセスのバックグラウンドの再取得と同時に書いても混ざらない）
+    """
+    blobs = {column: [] for column in SNAPSHOT_COLUMNS}
+    for tag in tags_data:
+        tag_id = str(tag.get('id') or '')
+        tag_name = tag.get('name') or ''
+        blobs['ids'].append(tag_id.encode('utf-8'))
+        blobs['names'].append(tag_name.encode('utf-8'))
+        blobs['normalized_names'].append(normalize_tag_name(tag_name).encode('utf-8'))
+
+    sections = []
+    for column in SNAPSHOT_COLUMNS:
+        offsets = array('I', [0])
+        for value in blobs[column]:
+            offsets.append(offsets[-1] + len(value))
+        sections.append((offsets.tobytes(), b''.join(blobs[column])))
+
+    # メタデータ長が決まるまで列の位置を確定できないため、位置の桁数が収まるまで繰り返す
+    meta = dict(metadata, snapshot_id=uuid.uuid4().hex, count=len(blobs['ids']), columns={})
+    while True:
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        position = _align(len(SNAPSHOT_MAGIC) + 4 + len(meta_bytes))
+        columns = {}
+        for column, (offsets, blob) in zip(SNAPSHOT_COLUMNS, sections):
+            columns[column] = [position, position + len(offsets)]
+            position = _align(position + len(offsets) + len(blob))
+        if columns == meta['columns']:
+            break
+        meta['columns'] = columns
+
+    def write(f):
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack('<I', len(meta_bytes)))
+        f.write(meta_bytes)
+        _pad(f)
+        for offsets, blob in sections:
+            f.write(offsets)
+            f.write(blob)
+            _pad(f)
+
+    _replace_file(path, write)
+
+def update_tag_snapshot_meta(path, snapshot, metadata):
+    """スナップショットを書き直さずにメタデータ（取得時刻・sync_tokenなど）を更新
+
+    snapshotはpathから読み込んだTagCatalog。別のファイルに保存し、load_tag_snapshotで重ねる
+    （その後スナップショットが書き直されていれば、snapshot_idが一致しないため使わない）
+    """
+    data = json.dumps({'snapshot_id': snapshot.meta['snapshot_id'], 'meta': metadata}, ensure_ascii=False)
+    _replace_file(path + SNAPSHOT_META_SUFFIX, lambda f: f.write(data.encode('utf-8')))
+
+def load_tag_snapshot(path):
+    """スナップショットをmmapで開く（なければ・形式が違えばNone）"""
+    try:
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            return None
+        meta_start = len(SNAPSHOT_MAGIC) + 4
+        meta_length = struct.unpack('<I', buffer[len(SNAPSHOT_MAGIC):meta_start])[0]
+        meta = json.loads(buffer[meta_start:meta_start + meta_length])
+    except Exception:
+        return None
+    try:
+        with open(path + SNAPSHOT_META_SUFFIX, 'r', encoding='utf-8') as f:
+            updated = json.load(f)
+        if updated['snapshot_id'] == meta.get('snapshot_id'):
+            meta.update(updated['meta'])
+    except Exception:
+        pass  # 更新したメタデータがなければスナップショットのまま
+    return TagCatalog(buffer, meta)
+
+def _replace_file(path, write):
+    """一時ファイルに書いてから置き換える（一時ファイルは書き込みごとに別名）"""
+    fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(temp_file, path)
+    except BaseException:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
+
+def _align(position):
+    return (position + 3) & ~3
+
+def _pad(f):
+    f.write(b'\0' * (_align(f.tell()) - f.tell()))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+import contentful_client
+import space_cache
+from contentful_client import ContentfulClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Contentfulの代わりに応答するローカルサーバーのハンドラー
+
+    server.responder(handler) が返したデータをJSONで返す。
+    Noneを返した場合はresponderがsend_body・send_jsonで応答済みとみなす
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # 応答ヘッダーと本文の送信を遅延ACKで待たない
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.respond()
+
+    def respond(self):
+        data = self.server.responder(self)
+        if data is not None:
+            self.send_json(data)
+
+    @property
+    def query(self):
+        return parse_qs(urlparse(self.path).query)
+
+    def read_json(self):
+        return json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+
+    def send_json(self, data, status=200, headers=None):
+        self.send_body(status, json.dumps(data, ensure_ascii=False).encode('utf-8'), headers)
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def contentful_stub(responder, **client_options):
+    """responderが応答するローカルサーバーを起動し、共有のContentfulクライアントをそこへ向ける
+
+    Delivery API・GraphQL Content APIとも同じサーバーに送る。タグ一覧のファイルキャッシュは
+    一時ディレクトリに書き、抜けるときにCONTENTFUL_CLIENT・TAGS_CACHE_DIR・SPACESを元に戻す
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.responder = responder
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    original_client = contentful_client.CONTENTFUL_CLIENT
+    original_cache_dir = space_cache.TAGS_CACHE_DIR
+    original_spaces = dict(space_cache.SPACES)
+    contentful_client.CONTENTFUL_CLIENT = ContentfulClient(base_url=base_url, graphql_url=base_url, **client_options)
+    space_cache.TAGS_CACHE_DIR = tempfile.mkdtemp()
+    space_cache.SPACES.clear()
+    try:
+        yield contentful_client.CONTENTFUL_CLIENT
+    finally:
+        server.shutdown()
+        server.server_close()
+        contentful_client.CONTENTFUL_CLIENT = original_client
+        space_cache.TAGS_CACHE_DIR = original_cache_dir
+        space_cache.SPACES.clear()
+        space_cache.SPACES.update(original_spaces)
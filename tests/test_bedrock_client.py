@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+import boto3
+import bedrock_client
+from bedrock_client import create_bedrock_client, get_bedrock_client
+
+CALLS = 20
+MODEL_ID = 'us.anthropic.claude-haiku-4-5-20251001-v1:0'
+RESPONSE = {'content': [{'text': '{"tags": []}'}], 'usage': {'input_tokens': 10, 'output_tokens': 5}}
+
+
+class InvokeHandler(BaseHTTPRequestHandler):
+    """InvokeModelの代わりに応答するローカルサーバー（接続元ポートを記録）"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    client_ports = set()
+    warm_up_paths = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        InvokeHandler.client_ports.add(self.client_address[1])
+        self.send_json(200, RESPONSE)
+
+    def do_GET(self):
+        # ListAsyncInvokes（接続の準備）。権限がない場合と同じくAccessDeniedExceptionを返す
+        InvokeHandler.client_ports.add(self.client_address[1])
+        InvokeHandler.warm_up_paths.append(self.path)
+        self.send_json(403, {'message': 'not authorized to perform: bedrock:ListAsyncInvokes'}, 'AccessDeniedException')
+
+    def send_json(self, status, payload, error_type=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if error_type:
+            self.send_header('x-amzn-ErrorType', error_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def invoke(client):
+    response = client.invoke_model(modelId=MODEL_ID, body=json.dumps({'messages': []}))
+    return json.loads(response['body'].read())
+
+
+def test_bedrock_client():
+    print("=== Shared Bedrock Runtime Client Test (local stand-in server) ===")
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), InvokeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        # 1. 設定（接続プール・keep-alive・タイムアウト・adaptiveリトライ）
+        client = create_bedrock_client(endpoint_url)
+        config = client.meta.config
+        print(f"Config: pool {config.max_pool_connections}, keep-alive {config.tcp_keepalive}, "
+              f"timeouts {config.connect_timeout}s/{config.read_timeout}s, retries {config.retries}")
+        assert config.max_pool_connections == bedrock_client.BEDROCK_MAX_POOL_CONNECTIONS
+        assert config.tcp_keepalive is True
+        assert config.retries == {'total_max_attempts': bedrock_client.BEDROCK_MAX_ATTEMPTS, 'mode': 'adaptive'}
+
+        # 2. 従来: 呼び出しごとにクライアントを作成（1回目はサービス定義の読み込みを含む）
+        InvokeHandler.client_ports.clear()
+        start_time = time.perf_counter()
+        invoke(boto3.client('bedrock-runtime', endpoint_url=endpoint_url))
+        first_call = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for _ in range(CALLS):
+            assert invoke(boto3.client('bedrock-runtime', endpoint_url=endpoint_url)) == RESPONSE
+        per_call = (time.perf_counter() - start_time) / CALLS
+        per_call_connections = len(InvokeHandler.client_ports)
+
+        # 3. 共有クライアント（作成済み・接続を使い回す）
+        invoke(client)
+        InvokeHandler.client_ports.clear()
+        start_time = time.perf_counter()
+        for _ in range(CALLS):
+            assert invoke(client) == RESPONSE
+        shared = (time.perf_counter() - start_time) / CALLS
+        shared_connections = len(InvokeHandler.client_ports)
+
+        print(f"Client per call:  {per_call * 1000:.1f}ms/call, {per_call_connections} connections "
+              f"(first call {first_call * 1000:.0f}ms incl. service model load)")
+        print(f"Shared client:    {shared * 1000:.1f}ms/call, {shared_connections} connection")
+        print(f"Setup saved:      {(per_call - shared) * 1000:.1f}ms/call "
+              f"({(per_call - shared) * 2 * 1000:.1f}ms for a long article with 2 calls)")
+        assert shared < per_call
+        assert shared_connections == 1 and per_call_connections > 1
+
+        # 4. 複数スレッドから同時に取得しても作成は1回
+        bedrock_client.BEDROCK_CLIENT = None
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(get_bedrock_client())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"Clients created by 8 threads: {len({id(c) for c in clients})}")
+        assert len({id(c) for c in clients}) == 1
+
+        # 5. 準備で接続を張り（権限がなくても）、最初の呼び出しはその接続を使う
+        bedrock_client.BEDROCK_CLIENT = create_bedrock_client(endpoint_url)
+        bedrock_client.BEDROCK_CONNECTION_WARMING = None
+        InvokeHandler.client_ports.clear()
+        warming = bedrock_client.warm_up_bedrock()
+        warming.join()
+        assert bedrock_client.warm_up_bedrock() is None  # コンテナごとに1回
+        start_time = time.perf_counter()
+        assert invoke(get_bedrock_client()) == RESPONSE
+        first_call = time.perf_counter() - start_time
+        print(f"After warm-up: first call {first_call * 1000:.1f}ms, {len(InvokeHandler.client_ports)} connection "
+              f"(warm-up requests {InvokeHandler.warm_up_paths})")
+        assert InvokeHandler.warm_up_paths and InvokeHandler.warm_up_paths[0].startswith('/async-invoke')
+        assert len(InvokeHandler.client_ports) == 1
+    finally:
+        bedrock_client.BEDROCK_CLIENT = None
+        bedrock_client.BEDROCK_CONNECTION_WARMING = None
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_bedrock_client()
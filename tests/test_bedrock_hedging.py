@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+import bedrock_client
+from bedrock_client import create_bedrock_client, get_hedge_delay, get_hedge_model_id, record_latency
+from claude_model import invoke_claude_model
+from test_bedrock_streaming import BedrockHandler, encode_event, stream_events
+
+MODEL_ID = 'us.anthropic.claude-haiku-4-5-20251001-v1:0'
+CALLS = 40
+NORMAL_LATENCY = 0.05  # 通常の応答時間（秒）
+SLOW_LATENCY = 0.8     # 遅い応答（10回に1回）
+HEDGE_SERVER_LOCK = threading.Lock()
+DELTAS = ['{"tags": [', '{"id": "1", "name": "AWS Lambda"}', ']}'] + ['\n補足です。'] * 20
+
+
+class HedgeHandler(BedrockHandler):
+    """us.の推論プロファイルへのリクエストだけ10回に1回遅れるローカルサーバー"""
+    requests_by_profile = {}
+    slow_events_sent = []
+    slow_every = 10
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        model_id = self.path.split('/')[2].replace('%3A', ':')
+        profile = model_id.split('.')[0]
+        with HEDGE_SERVER_LOCK:
+            HedgeHandler.requests_by_profile[profile] = HedgeHandler.requests_by_profile.get(profile, 0) + 1
+            count = HedgeHandler.requests_by_profile[profile]
+        slow = profile == 'us' and count % HedgeHandler.slow_every == 0
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.amazon.eventstream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        time.sleep(SLOW_LATENCY if slow else NORMAL_LATENCY)
+        events_sent = 0
+        try:
+            for event in stream_events(model_id, DELTAS):
+                message = encode_event(event)
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(message), message))
+                self.wfile.flush()
+                events_sent += 1
+                time.sleep(0.005)
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        if slow:
+            HedgeHandler.slow_events_sent.append(events_sent)
+
+
+def run_calls(hedge):
+    """CALLS回タグ選択を呼び出し、応答時間（秒）のリスト・ヘッジした回数・呼び出しごとのcache_infoを返す"""
+    bedrock_client.BEDROCK_HEDGE = hedge
+    bedrock_client.HEDGE_STATS.update(calls=0, hedges=0)
+    HedgeHandler.requests_by_profile.clear()
+    latencies = []
+    hedged = 0
+    cache_infos = []
+    for _ in range(CALLS):
+        start_time = time.perf_counter()
+        tags, cache_info = invoke_claude_model('ブログ記事', ['1\tAWS Lambda'], 'hash', MODEL_ID)
+        latencies.append(time.perf_counter() - start_time)
+        assert tags == [{'id': '1', 'name': 'AWS Lambda'}]
+        hedged += cache_info['hedged']
+        cache_infos.append(cache_info)
+    return sorted(latencies), hedged, cache_infos
+
+
+def test_bedrock_hedging():
+    print("=== Hedged Bedrock Requests Test (local stand-in server) ===")
+
+    # 1. ヘッジの送り先（推論プロファイルの差し替え）
+    bedrock_client.BEDROCK_HEDGE_PROFILE = 'global'
+    assert get_hedge_model_id(MODEL_ID) == 'global.anthropic.claude-haiku-4-5-20251001-v1:0'
+    assert get_hedge_model_id('openai.gpt-oss-20b-1:0') == 'openai.gpt-oss-20b-1:0'
+
+    # 2. 待ち時間は直近の応答時間のパーセンタイル（件数が少なければ固定値）
+    original = (bedrock_client.BEDROCK_HEDGE_MIN_SAMPLES, bedrock_client.BEDROCK_HEDGE_DELAY,
+                bedrock_client.BEDROCK_HEDGE_BUDGET, bedrock_client.BEDROCK_HEDGE_PERCENTILE)
+    bedrock_client.BEDROCK_HEDGE_MIN_SAMPLES = 20
+    bedrock_client.BEDROCK_HEDGE_PERCENTILE = 95
+    for i in range(19):
+        record_latency('percentile-test', (i + 1) / 100)
+    assert get_hedge_delay('percentile-test') == bedrock_client.BEDROCK_HEDGE_DELAY
+    record_latency('percentile-test', 5.0)
+    print(f"p95 of 0.01..0.19s and one 5s outlier: {get_hedge_delay('percentile-test')}s")
+    assert get_hedge_delay('percentile-test') == 0.19
+    bedrock_client.HEDGE_LATENCIES.clear()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), HedgeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    bedrock_client.BEDROCK_CLIENT = create_bedrock_client(f"http://127.0.0.1:{server.server_address[1]}")
+    # 代替サーバーの応答時間はほぼ一定なので、パーセンタイルの代わりに固定の待ち時間を使う
+    bedrock_client.BEDROCK_HEDGE_MIN_SAMPLES = 1000
+    bedrock_client.BEDROCK_HEDGE_DELAY = 0.15
+    bedrock_client.BEDROCK_HEDGE_BUDGET = 0.1
+
+    try:
+        # 3. 遅い応答を待つ場合とヘッジを送る場合の比較
+        plain, _, _ = run_calls(False)
+        hedged_latencies, hedged, cache_infos = run_calls(True)
+        time.sleep(0.2)  # 打ち切った遅い応答の送信の失敗を検出するまで待つ
+        requests = dict(HedgeHandler.requests_by_profile)
+        for name, latencies in (('No hedging', plain), ('Hedging', hedged_latencies)):
+            print(f"{name + ':':12} p50 {latencies[CALLS // 2] * 1000:.0f}ms, "
+                  f"p95 {latencies[int(CALLS * 0.95)] * 1000:.0f}ms, max {latencies[-1] * 1000:.0f}ms")
+        print(f"Hedges: {hedged} of {CALLS} calls (budget {bedrock_client.BEDROCK_HEDGE_BUDGET:.0%}), requests {requests}")
+        print(f"Events sent by the slow responses after the hedge won: {HedgeHandler.slow_events_sent[-hedged:]}")
+        assert plain[-1] > SLOW_LATENCY
+        assert hedged_latencies[-1] < SLOW_LATENCY / 2
+        assert hedged == requests.get('global', 0) == CALLS // HedgeHandler.slow_every
+        assert all(events < len(DELTAS) for events in HedgeHandler.slow_events_sent[-hedged:])
+
+        # 打ち切った方の入力トークン数（見積もり）も加算する
+        hedged_inputs = [info['input_tokens'] for info in cache_infos if info['hedged']]
+        print(f"Input tokens: {cache_infos[0]['input_tokens']} without a hedge, {hedged_inputs[0]} with a hedge")
+        assert all(info['input_tokens'] == 500 for info in cache_infos if not info['hedged'])
+        assert all(tokens > 500 for tokens in hedged_inputs)
+
+        # 応答時間は全ての呼び出しを記録し、ヘッジが勝った呼び出しは待ち時間以上（打ち切るまでの時間）
+        recorded = list(bedrock_client.HEDGE_LATENCIES[MODEL_ID])
+        print(f"Recorded latencies: {len(recorded)}, max {max(recorded) * 1000:.0f}ms")
+        assert len(recorded) == CALLS
+        assert sum(latency >= bedrock_client.BEDROCK_HEDGE_DELAY for latency in recorded) == hedged
+        assert list(bedrock_client.HEDGE_LATENCIES) == [MODEL_ID]
+
+        # 4. 全ての応答が遅くても、ヘッジは予算（呼び出しの10%）までしか送らない
+        HedgeHandler.slow_every = 1
+        bedrock_client.BEDROCK_HEDGE = True
+        bedrock_client.HEDGE_STATS.update(calls=0, hedges=0)
+        for _ in range(20):
+            invoke_claude_model('ブログ記事', ['1\tAWS Lambda'], 'hash', MODEL_ID)
+        print(f"All slow: {bedrock_client.HEDGE_STATS['hedges']} hedges in {bedrock_client.HEDGE_STATS['calls']} calls")
+        assert bedrock_client.HEDGE_STATS['hedges'] == 2
+
+        # 5. ヘッジ専用のスレッドや接続プールに空きがなければ、予算があってもヘッジを送らない
+        bedrock_client.BEDROCK_HEDGE_BUDGET = 1.0
+        for name, value in (('BEDROCK_HEDGE_MAX_IN_FLIGHT', 0), ('BEDROCK_MAX_POOL_CONNECTIONS', 1)):
+            original_value = getattr(bedrock_client, name)
+            setattr(bedrock_client, name, value)
+            bedrock_client.HEDGE_STATS.update(calls=0, hedges=0)
+            try:
+                _, cache_info = invoke_claude_model('ブログ記事', ['1\tAWS Lambda'], 'hash', MODEL_ID)
+            finally:
+                setattr(bedrock_client, name, original_value)
+            print(f"{name}={value}: hedged {cache_info['hedged']}")
+            assert not cache_info['hedged'] and bedrock_client.HEDGE_STATS['hedges'] == 0
+        time.sleep(0.2)
+        assert bedrock_client.HEDGE_STATS['in_flight'] == bedrock_client.HEDGE_STATS['hedges_in_flight'] == 0
+    finally:
+        HedgeHandler.slow_every = 10
+        (bedrock_client.BEDROCK_HEDGE_MIN_SAMPLES, bedrock_client.BEDROCK_HEDGE_DELAY,
+         bedrock_client.BEDROCK_HEDGE_BUDGET, bedrock_client.BEDROCK_HEDGE_PERCENTILE) = original
+        bedrock_client.BEDROCK_HEDGE = False
+        bedrock_client.BEDROCK_HEDGE_PROFILE = ''
+        bedrock_client.HEDGE_LATENCIES.clear()
+        bedrock_client.HEDGE_STATS.update(calls=0, hedges=0)
+        bedrock_client.BEDROCK_CLIENT = None
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_bedrock_hedging()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import base64
+import binascii
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+from botocore.exceptions import ClientError
+import bedrock_client
+from bedrock_client import JsonObjectScanner, create_bedrock_client, estimate_tokens
+from claude_model import invoke_claude_model
+from gpt_model import invoke_gpt_model
+from nova_model import invoke_nova_model
+
+DELTA_DELAY = 0.005  # 1イベントあたりの生成時間（秒）
+
+# 推論（回答例のJSONを含む）→ 回答のJSON → 余分な説明、の順に生成されるモデルの出力
+REASONING = ['<reasoning>', '回答例は {"tags": [{"id": "123", "name": "タグ名"}]} の形式。'] + ['記事を検討します。'] * 40 + ['</reasoning>']
+ANSWER = ['{"tags": [', '{"id": "1", "name": "AWS Lambda"}, ', '{"id": "2", "name": "Amazon {S3}"}', ']}']
+TRAILER = ['\n\n選んだ理由：'] + ['この記事はサーバーレスについて説明しています。'] * 150
+
+MODELS = {
+    'us.anthropic.claude-haiku-4-5-20251001-v1:0': (invoke_claude_model, ANSWER + TRAILER),
+    'us.amazon.nova-lite-v1:0': (invoke_nova_model, ANSWER + TRAILER),
+    'openai.gpt-oss-20b-1:0': (invoke_gpt_model, REASONING + ANSWER + TRAILER),
+}
+
+
+def encode_event(payload):
+    """AWSのイベントストリーム形式のメッセージ（chunkイベント）"""
+    headers = b''
+    for name, value in ((':event-type', 'chunk'), (':content-type', 'application/json'), (':message-type', 'event')):
+        headers += bytes([len(name)]) + name.encode() + b'\x07' + struct.pack('>H', len(value)) + value.encode()
+    body = json.dumps({'bytes': base64.b64encode(json.dumps(payload).encode()).decode()}).encode()
+    total = 12 + len(headers) + len(body) + 4
+    prelude = struct.pack('>II', total, len(headers))
+    message = prelude + struct.pack('>I', binascii.crc32(prelude)) + headers + body
+    return message + struct.pack('>I', binascii.crc32(message))
+
+
+def stream_events(model_id, deltas):
+    """モデルファミリーごとのストリーミングのイベント"""
+    if 'anthropic' in model_id:
+        yield {'type': 'message_start', 'message': {'usage': {'input_tokens': 500, 'output_tokens': 1}}}
+        for text in deltas:
+            yield {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': text}}
+        yield {'type': 'message_delta', 'usage': {'output_tokens': len(deltas)}}
+    elif 'nova' in model_id:
+        for text in deltas:
+            yield {'contentBlockDelta': {'delta': {'text': text}}}
+        yield {'metadata': {'usage': {'inputTokens': 500, 'outputTokens': len(deltas)}}}
+    else:
+        for text in deltas:
+            yield {'choices': [{'delta': {'content': text}}]}
+        yield {'choices': [], 'usage': {'prompt_tokens': 500, 'completion_tokens': len(deltas)}}
+
+
+def full_body(model_id, text, output_tokens):
+    if 'anthropic' in model_id:
+        return {'content': [{'text': text}], 'usage': {'input_tokens': 500, 'output_tokens': output_tokens}}
+    if 'nova' in model_id:
+        return {'output': {'message': {'content': [{'text': text}]}}, 'usage': {'inputTokens': 500, 'outputTokens': output_tokens}}
+    return {'choices': [{'message': {'content': text}}], 'usage': {'prompt_tokens': 500, 'completion_tokens': output_tokens}}
+
+
+class BedrockHandler(BaseHTTPRequestHandler):
+    """InvokeModel・InvokeModelWithResponseStreamの代わりに応答するローカルサーバー"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    events_sent = 0
+    stream_error = None  # (ステータス, エラーの種類, メッセージ)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        model_id = self.path.split('/')[2].replace('%3A', ':')
+        deltas = MODELS[model_id][1]
+
+        if self.path.endswith('/invoke-with-response-stream'):
+            if BedrockHandler.stream_error:
+                status, error_type, message = BedrockHandler.stream_error
+                self.send_json(status, {'message': message}, error_type)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/vnd.amazon.eventstream')
+            self.send_header('Transfer-Encoding', 'chunked')  # イベントごとに1チャンク
+            self.end_headers()
+            BedrockHandler.events_sent = 0
+            try:
+                for event in stream_events(model_id, deltas):
+                    time.sleep(DELTA_DELAY)
+                    message = encode_event(event)
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(message), message))
+                    self.wfile.flush()
+                    BedrockHandler.events_sent += 1
+                self.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # クライアントが途中で閉じた
+        else:
+            time.sleep(DELTA_DELAY * len(deltas))
+            self.send_json(200, full_body(model_id, ''.join(deltas), len(deltas)))
+
+    def send_json(self, status, data, error_type=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if error_type:
+            self.send_header('x-amzn-ErrorType', error_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def timed(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def test_bedrock_streaming():
+    print("=== Streaming Bedrock Responses Test (local stand-in server) ===")
+
+    # 1. 分割して届くJSONの検出（文字列中の括弧・推論部分の回答例は無視）
+    scanner = JsonObjectScanner('tags')
+    results = [scanner.feed(text) for text in ['<think', 'ing>{"tags": []}</thin', 'king>{"tags": [{"name": "a}"', '}]}', 'x']]
+    assert results[:3] == [None, None, None] and results[3] == {'tags': [{'name': 'a}'}]}
+    assert scanner.text == '<thinking>{"tags": []}</thinking>{"tags": [{"name": "a}"}]}x'
+
+    # 長い応答も追加した分だけ走査する（1文字ずつ届くJSON、推論部分・前置きの長さに比例した時間）
+    def scan_stream(size):
+        scanner = JsonObjectScanner('tags')
+        deltas = ['<reasoning>'] + ['{"tags": "例"} を検討します。'] * size + ['</reasoning>', '回答です。'] * size
+        deltas += list('{"tags": [{"id": "1", "name": "AWS Lambda"}]}')
+        start_time = time.perf_counter()
+        results = [scanner.feed(text) for text in deltas]
+        return results[-1], len(scanner.pending), time.perf_counter() - start_time
+
+    small_result, _, small_time = scan_stream(5000)
+    large_result, pending, large_time = scan_stream(20000)
+    print(f"Scanner: 4x longer stream took {large_time / small_time:.1f}x ({small_time * 1000:.0f}ms -> {large_time * 1000:.0f}ms)")
+    assert small_result == large_result == {'tags': [{'id': '1', 'name': 'AWS Lambda'}]}
+    assert pending == 0
+    assert large_time < small_time * 10  # 走査し直すと2乗（16倍以上）になる
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BedrockHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    bedrock_client.BEDROCK_CLIENT = create_bedrock_client(f"http://127.0.0.1:{server.server_address[1]}")
+    expected = [{'id': '1', 'name': 'AWS Lambda'}, {'id': '2', 'name': 'Amazon {S3}'}]
+
+    try:
+        # 2. モデルファミリーごとに、タグのJSONが揃った時点で打ち切る
+        for model_id, (invoke, deltas) in MODELS.items():
+            bedrock_client.BEDROCK_STREAMING = False
+            (full_tags, full_info), full_time = timed(invoke, 'ブログ記事', ['1\tAWS Lambda'], 'hash', model_id)
+            bedrock_client.BEDROCK_STREAMING = True
+            (tags, cache_info), stream_time = timed(invoke, 'ブログ記事', ['1\tAWS Lambda'], 'hash', model_id)
+            time.sleep(0.05)  # サーバー側で送信の失敗を検出するまで待つ
+
+            print(f"{model_id}:")
+            print(f"  invoke_model:  {full_time * 1000:.0f}ms, {full_info['output_tokens']} output tokens")
+            print(f"  streaming:     {stream_time * 1000:.0f}ms, {cache_info['output_tokens']} output tokens "
+                  f"(server sent {BedrockHandler.events_sent} of {len(list(stream_events(model_id, deltas)))} events)")
+            assert tags == full_tags == expected
+            assert cache_info['stream_stopped_early'] is True
+            # 代替サーバーは1イベント1トークンと数えるため、全文の見積もりと比べる
+            assert cache_info['output_tokens'] < estimate_tokens(''.join(deltas))
+            # 最後の使用量が届かなくても0にはせず、見積もりであることを示す
+            print(f"  usage:         {cache_info['input_tokens']} input tokens (estimated: {cache_info['usage_estimated']})")
+            assert cache_info['usage_estimated'] is True and full_info['usage_estimated'] is False
+            assert cache_info['input_tokens'] > 0 and cache_info['output_tokens'] > 0
+            if 'anthropic' in model_id:
+                assert cache_info['input_tokens'] == full_info['input_tokens']  # message_startで届く
+            assert stream_time < full_time
+            assert BedrockHandler.events_sent < len(deltas)
+
+        # 3. リクエストの誤りによるエラーではストリーミングを止めない
+        model_id = 'us.amazon.nova-lite-v1:0'
+        BedrockHandler.stream_error = (400, 'ValidationException', 'Malformed input request, please reformat your input and try again.')
+        try:
+            invoke_nova_model('ブログ記事', [], 'hash', model_id)
+            raise AssertionError('ValidationException expected')
+        except ClientError:
+            pass
+        assert model_id not in bedrock_client.STREAMING_UNAVAILABLE
+        print("Request errors keep streaming enabled: True")
+
+        # 4. ストリーミングの権限がなければinvoke_modelで呼び、以後もそうする
+        BedrockHandler.stream_error = (403, 'AccessDeniedException', 'User: arn:aws:sts::123456789012:assumed-role/tag-selector is not '
+                                       'authorized to perform: bedrock:InvokeModelWithResponseStream on resource: model')
+        tags, cache_info = invoke_nova_model('ブログ記事', [], 'hash', model_id)
+        assert tags == expected and cache_info['stream_stopped_early'] is False
+        assert model_id in bedrock_client.STREAMING_UNAVAILABLE
+        print("Falls back to invoke_model without streaming permission: True")
+    finally:
+        BedrockHandler.stream_error = None
+        bedrock_client.BEDROCK_STREAMING = True
+        bedrock_client.STREAMING_UNAVAILABLE.clear()
+        bedrock_client.BEDROCK_CLIENT = None
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_bedrock_streaming()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+import enhanced_common
+import tag_matcher
+import tag_scoring
+from build_tag_stats import build_tag_stats
+from enhanced_common import enhanced_pre_filter_tags, extract_tag_features, get_enhanced_tag_matcher
+from tag_scoring import load_tag_stats, save_tag_stats, score_features_bm25
+
+CATALOG = [
+    {'id': '1', 'name': 'AWS'},
+    {'id': '2', 'name': 'Bedrock'},
+    {'id': '3', 'name': 'Lambda'},
+]
+TAGS_HASH = 'bm25-test-hash'
+# AWSは全ての記事に出現し、Bedrockは1件だけ
+CORPUS = ['AWSのサービスを使ってアプリケーションを作りました。'] * 20 + ['AWSでBedrockを試しました。']
+ARTICLE = 'AWSとBedrockを組み合わせた構成です。'
+FILLER = 'アプリケーションの設計と運用について説明します。' * 40
+
+
+def score_of(stats, text, tag_id):
+    """記事に対するタグ1件のBM25スコア"""
+    matcher = get_enhanced_tag_matcher(CATALOG, TAGS_HASH)
+    features = extract_tag_features(text, matcher, with_counts=True, tags_hash=TAGS_HASH)
+    index = matcher.tag_ids.index(tag_id)
+    return dict(score_features_bm25(matcher, features, stats)).get(index, 0)
+
+
+def test_bm25_scoring():
+    print("=== BM25 Scoring Test ===")
+
+    original = (tag_scoring.TAG_STATS_PATH, tag_scoring.TAG_STATS, tag_scoring.BM25_B,
+                enhanced_common.TAG_WORDS_CACHE_DIR, tag_matcher.INDEX_CACHE_DIR)
+    with tempfile.TemporaryDirectory() as work_dir:
+        try:
+            enhanced_common.TAG_WORDS_CACHE_DIR = work_dir
+            tag_matcher.INDEX_CACHE_DIR = work_dir
+
+            # 1. build_tag_stats.pyで作った統計を保存して読み込める（ファイルがなければNone）
+            stats_path = os.path.join(work_dir, 'tag_stats.json.gz')
+            stats = build_tag_stats(CORPUS, CATALOG, TAGS_HASH)
+            save_tag_stats(stats, stats_path)
+            tag_scoring.TAG_STATS = None
+            loaded = load_tag_stats(stats_path)
+            print(f"Stats: {loaded['doc_count']} docs, avg length {loaded['avg_length']}, df {loaded['df']}")
+            assert {key: value for key, value in loaded.items() if key != 'path'} == stats
+            assert loaded['doc_count'] == len(CORPUS) and loaded['tags_hash'] == TAGS_HASH
+            assert loaded['df']['aws'] == len(CORPUS) and loaded['df']['bedrock'] == 1
+            assert 'lambda' not in loaded['df']
+            assert load_tag_stats(os.path.join(work_dir, 'missing.json.gz')) is None
+
+            # 2. 同じ回数出現しても、多くの記事に出てくる語（AWS）より珍しい語（Bedrock）が上位
+            tag_scoring.TAG_STATS_PATH = stats_path
+            heuristic = list(enhanced_pre_filter_tags(ARTICLE, CATALOG, tags_hash=TAGS_HASH, scoring='heuristic')[0])
+            bm25 = list(enhanced_pre_filter_tags(ARTICLE, CATALOG, tags_hash=TAGS_HASH, scoring='bm25')[0])
+            print(f"Heuristic: {heuristic}")
+            print(f"BM25:      {bm25}")
+            assert heuristic == ['1\tAWS', '2\tBedrock']
+            assert bm25 == ['2\tBedrock', '1\tAWS']
+            assert score_of(loaded, ARTICLE, '2') > score_of(loaded, ARTICLE, '1')
+
+            # 3. 記事長の正規化: 短い記事の1回が長い記事の2回より上位（b=0では逆転する）
+            short_text = 'Lambdaを使いました。'
+            long_text = 'Lambdaを使いました。' + FILLER + 'Lambdaの設定です。'
+            normalized = (score_of(loaded, short_text, '3'), score_of(loaded, long_text, '3'))
+            tag_scoring.BM25_B = 0
+            unnormalized = (score_of(loaded, short_text, '3'), score_of(loaded, long_text, '3'))
+            print(f"Lambda (short, long): b=0.75 {normalized}, b=0 {unnormalized}")
+            assert normalized[0] > normalized[1]
+            assert unnormalized[0] < unnormalized[1]
+        finally:
+            (tag_scoring.TAG_STATS_PATH, tag_scoring.TAG_STATS, tag_scoring.BM25_B,
+             enhanced_common.TAG_WORDS_CACHE_DIR, tag_matcher.INDEX_CACHE_DIR) = original
+
+
+if __name__ == "__main__":
+    test_bm25_scoring()
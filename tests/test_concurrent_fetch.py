@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+import bedrock_client
+import common
+import space_cache
+from common import fetch_article_and_tags, get_article_revision_from_contentful, get_tags_from_contentful_cached
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from contentful_stub import contentful_stub
+
+DELAY = 0.5  # 記事・タグ一覧それぞれの応答時間（秒）
+
+ARTICLE = {'items': [{'sys': {'revision': 1}, 'fields': {'title': 'テスト記事', 'content': 'Amazon Bedrockを試しました。'}}]}
+TAGS = {'items': [{'fields': {'tags': [{'id': '1', 'name': 'AWS'}, {'id': '2', 'name': 'Amazon Bedrock'}]}}]}
+
+
+def respond_slowly(request):
+    """記事・タグ一覧をDELAY秒遅れて返す"""
+    time.sleep(DELAY)
+    return TAGS if request.query.get('content_type') == ['blogTags'] else ARTICLE
+
+
+def reset_caches():
+    space = space_cache.get_space()
+    if os.path.exists(space.cache_file):
+        os.remove(space.cache_file)
+    space_cache.SPACES.clear()
+
+
+def test_concurrent_fetch():
+    print("=== Concurrent Article / Catalog Fetch Test (cold start) ===")
+
+    common.TAGS_SYNC = False
+    bedrock_client.BEDROCK_WARM_UP_CONNECTION = False  # AWSには接続しない
+
+    try:
+        with contentful_stub(respond_slowly):
+            # 1. 従来の順次取得（記事 → タグ一覧）
+            reset_caches()
+            start_time = time.perf_counter()
+            blog_text, revision = get_article_revision_from_contentful('test-slug')
+            tags_data, tags_hash = get_tags_from_contentful_cached()
+            sequential = time.perf_counter() - start_time
+            print(f"Sequential:  {sequential * 1000:.0f}ms")
+
+            # 2. 並行取得（Bedrockクライアントの作成も同時に行う）
+            reset_caches()
+            bedrock_client.BEDROCK_CLIENT = None
+            start_time = time.perf_counter()
+            result = fetch_article_and_tags('test-slug')
+            concurrent = time.perf_counter() - start_time
+            print(f"Concurrent:  {concurrent * 1000:.0f}ms (each fetch {DELAY * 1000:.0f}ms, incl. Bedrock client warm-up)")
+
+            assert result == (blog_text, revision, tags_data, tags_hash)
+            assert bedrock_client.BEDROCK_CLIENT is not None
+            assert sequential >= 2 * DELAY
+            # 遅い方の取得時間で終わる（合計にはならない）
+            assert concurrent < 1.5 * DELAY
+    finally:
+        common.TAGS_SYNC = True
+        bedrock_client.BEDROCK_WARM_UP_CONNECTION = True
+
+
+if __name__ == "__main__":
+    test_concurrent_fetch()
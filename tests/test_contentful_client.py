@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+import gzip
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+import common
+import space_cache
+from contentful_client import ContentfulError
+from common import get_article_from_contentful, get_article_revision_from_contentful, get_articles_from_contentful
+from space_cache import get_space
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from contentful_stub import contentful_stub
+
+ARTICLE = {
+    'items': [{
+        'sys': {'revision': 3},
+        'fields': {'title': 'テスト記事', 'content': 'Amazon Bedrockを試しました。'}
+    }]
+}
+
+# 一括取得用の記事（slug → 本文）
+BULK_ARTICLES = {f'article-{i}': f'本文{i}' for i in range(10)}
+BULK_PAGE_LIMIT = 3  # 代替サーバーが1回に返す最大件数
+
+
+class StandInResponder:
+    """Contentfulの代わりに応答する（失敗・ETag・gzip・一括取得）"""
+
+    def __init__(self):
+        self.failures = {}  # パス → 残りの失敗回数
+        self.client_ports = set()
+        self.requests = []
+        self.send_etag = True
+
+    def __call__(self, request):
+        self.client_ports.add(request.client_address[1])
+        self.requests.append((request.path, request.headers))
+        path = request.path.split('?')[0]
+
+        remaining = self.failures.get(path, 0)
+        if remaining:
+            self.failures[path] = remaining - 1
+            status = 429 if path.endswith('/rate-limited') else 503
+            request.send_body(status, b'{"message": "try again"}', {'Retry-After': '0'})
+        elif 'fields.slug[in]' in request.query:
+            return self.bulk(request.query)
+        elif path.endswith('/missing'):
+            request.send_body(404, b'{"message": "not found"}')
+        else:
+            body = json.dumps(ARTICLE, ensure_ascii=False).encode('utf-8')
+            headers = {}
+            if self.send_etag:
+                etag = f'"rev-{ARTICLE["items"][0]["sys"]["revision"]}"'
+                if request.headers.get('If-None-Match') == etag:
+                    request.send_body(304, b'')
+                    return None
+                headers['ETag'] = etag
+            if 'gzip' in request.headers.get('Accept-Encoding', ''):
+                request.send_body(200, gzip.compress(body), {**headers, 'Content-Encoding': 'gzip'})
+            else:
+                request.send_body(200, body, headers)
+        return None
+
+    def bulk(self, query):
+        slugs = query['fields.slug[in]'][0].split(',')
+        found = [slug for slug in slugs if slug in BULK_ARTICLES]
+        skip = int(query['skip'][0])
+        limit = min(int(query['limit'][0]), BULK_PAGE_LIMIT)
+        items = [
+            {'fields': {'slug': slug, 'title': slug, 'content': BULK_ARTICLES[slug]}}
+            for slug in found[skip:skip + limit]
+        ]
+        return {'items': items, 'total': len(found), 'skip': skip, 'limit': limit}
+
+
+def test_contentful_client():
+    print("=== Contentful Client Test (local stand-in server) ===")
+
+    responder = StandInResponder()
+    original_allowed = space_cache.ALLOWED_SPACE_IDS
+
+    try:
+        with contentful_stub(responder, space_id='space', access_token='token') as client:
+            # 1. gzip応答をバイト列のまま解析
+            data = client.get_entries({'limit': 1, 'fields.slug': 'a b&c'})
+            path, headers = responder.requests[-1]
+            print(f"gzip response parsed: {data == ARTICLE}")
+            assert data == ARTICLE
+            assert 'gzip' in headers['Accept-Encoding']
+            assert headers['Authorization'] == 'Bearer token'
+            assert 'fields.slug=a+b%26c' in path
+
+            # 2. 同じ接続を使い回す
+            for _ in range(5):
+                client.get_entries({'limit': 1})
+            print(f"Connections used for 6 requests: {len(responder.client_ports)}")
+            assert len(responder.client_ports) == 1
+
+            # 3. 503・429はリトライ
+            responder.failures = {'/flaky': 2, '/rate-limited': 1}
+            assert client.get_json('/flaky') == ARTICLE
+            assert client.get_json('/rate-limited') == ARTICLE
+            print("Retried 503 and 429: True")
+
+            # 4. リトライ上限を超えたらエラー
+            responder.failures = {'/flaky': 10}
+            try:
+                client.get_json('/flaky')
+                assert False, 'ContentfulError expected'
+            except ContentfulError as e:
+                assert e.status == 503
+            print(f"Gave up after retries: True (remaining failures: {responder.failures['/flaky']})")
+            assert responder.failures['/flaky'] == 10 - (client.max_retries + 1)
+
+            # 5. 404はリトライしない
+            request_count = len(responder.requests)
+            try:
+                client.get_json('/missing')
+                assert False, 'ContentfulError expected'
+            except ContentfulError as e:
+                assert e.status == 404
+            assert len(responder.requests) == request_count + 1
+            print("404 not retried: True")
+
+            # 6. 共有クライアント経由の記事取得
+            space_cache.ALLOWED_SPACE_IDS = {'space'}
+            space = get_space('space')
+            blog_text = get_article_from_contentful('test-slug', space)
+            print(f"get_article_from_contentful: {blog_text!r}")
+            assert blog_text == 'テスト記事\n\nAmazon Bedrockを試しました。'
+
+            # 7. ETagで再検証（未変更なら304で本文を受け取らない）
+            space.clear_articles()
+            get_article_revision_from_contentful('test-slug', space)
+            blog_text, revision = get_article_revision_from_contentful('test-slug', space)
+            _, headers = responder.requests[-1]
+            print(f"Revalidated with If-None-Match: {headers.get('If-None-Match')} (revision {revision})")
+            assert headers.get('If-None-Match') == '"rev-3"' and revision == 3
+
+            ARTICLE['items'][0]['sys']['revision'] = 4
+            ARTICLE['items'][0]['fields']['content'] = '更新しました。'
+            blog_text, revision = get_article_revision_from_contentful('test-slug', space)
+            assert (blog_text, revision) == ('テスト記事\n\n更新しました。', 4)
+
+            # 8. ETagがなければリビジョンだけを取得して比較
+            responder.send_etag = False
+            space.clear_articles()
+            get_article_revision_from_contentful('test-slug', space)
+            request_count = len(responder.requests)
+            blog_text, revision = get_article_revision_from_contentful('test-slug', space)
+            path, _ = responder.requests[-1]
+            print(f"Revalidated with revision-only query: {'select=sys.revision' in path}")
+            assert len(responder.requests) == request_count + 1 and 'select=sys.revision' in path
+            assert revision == 4
+
+            # 9. 同じリビジョンの処理結果は再利用
+            common.save_cached_result('test-slug', 4, '{"cached": true}', 'model', 'hash', space=space)
+            assert common.get_cached_result('test-slug', 4, 'model', 'hash', space=space) == '{"cached": true}'
+            assert common.get_cached_result('test-slug', 5, 'model', 'hash', space=space) is None
+            common.save_cached_result('test-slug', 5, '{"cached": false}', 'model', 'hash', space=space)
+            assert common.get_cached_result('test-slug', 4, 'model', 'hash', space=space) is None
+            print("Result cache keyed by revision: True")
+
+            # 10. fields.slug[in] で複数記事を一括取得（ページングあり）
+            slugs = [f'article-{i}' for i in range(10)] + ['no-such-article', 'article-0']
+            request_count = len(responder.requests)
+            articles = get_articles_from_contentful(iter(slugs), page_size=5, space=space)
+            assert len(responder.requests) == request_count  # ジェネレーターは読み進めるまで取得しない
+            results = dict(articles)
+            bulk_requests = len(responder.requests) - request_count
+            print(f"Bulk fetch: {len(results)} slugs in {bulk_requests} requests")
+            assert results['no-such-article'] is None
+            assert all(results[f'article-{i}'] == f'article-{i}\n\n本文{i}' for i in range(10))
+            # 5件ずつ3バッチ、1回3件までなので 2 + 2 + 1 リクエスト
+            assert bulk_requests == 5
+    finally:
+        space_cache.ALLOWED_SPACE_IDS = original_allowed
+
+
+if __name__ == "__main__":
+    test_contentful_client()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+import bedrock_client
+from bedrock_client import create_bedrock_client
+from common import pre_filter_tags
+from index import evaluate_tags_with_ai
+
+MODEL_ID = 'us.anthropic.claude-haiku-4-5-20251001-v1:0'
+CATALOG = [{'id': str(i), 'name': f'Service{i:03d}'} for i in range(1000)] + [
+    {'id': 'lambda', 'name': 'AWS Lambda'},
+    {'id': 's3', 'name': 'Amazon S3'},
+    {'id': 'bedrock', 'name': 'Amazon Bedrock'},
+]
+ARTICLE = 'AWS LambdaからAmazon S3とAmazon Bedrockを呼び出します。' + ' '.join(f'Service{i:03d}' for i in range(0, 1000, 7))
+
+
+class ScoresHandler(BaseHTTPRequestHandler):
+    """InvokeModelの代わりに、プロンプトのタグ一覧の全タグに適合度を返すローカルサーバー（scoresで上書き）"""
+    protocol_version = 'HTTP/1.1'
+    scores = {}
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        system_text = request['system'][0]['text']
+        tag_lines = system_text.split('タグリスト:\n', 1)[1].split('\n\n', 1)[0].splitlines()
+        scores = {line.split('\t', 1)[0]: 1 for line in tag_lines}
+        scores.update({tag_id: score for tag_id, score in ScoresHandler.scores.items() if tag_id in scores})
+        text = json.dumps({'scores': scores})
+        body = json.dumps({'content': [{'text': text}], 'usage': {'input_tokens': 100, 'output_tokens': 10}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_scores_server():
+    """ScoresHandlerを起動し、共有のBedrockクライアントをそこに向ける（ストリーミングなし）"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ScoresHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    bedrock_client.BEDROCK_CLIENT = create_bedrock_client(f"http://127.0.0.1:{server.server_address[1]}")
+    bedrock_client.BEDROCK_STREAMING = False
+    return server
+
+
+def stop_scores_server(server):
+    bedrock_client.BEDROCK_CLIENT = None
+    bedrock_client.BEDROCK_STREAMING = True
+    ScoresHandler.scores = {}
+    server.shutdown()
+
+
+def test_evaluate_tags():
+    print("=== index.evaluate_tags_with_ai Test (local stand-in server) ===")
+
+    server = start_scores_server()
+    try:
+        filtered_tags, tag_scores = pre_filter_tags(ARTICLE, CATALOG, max_tags=1000)
+        ScoresHandler.scores = {'bedrock': 10, 'lambda': 8}
+
+        # 1. 省略すると全候補を、合計スコアの高い順に返す
+        all_tags, cache_info = evaluate_tags_with_ai(ARTICLE, tag_scores, MODEL_ID, False)
+        print(f"max_results=None: {len(all_tags)} of {len(filtered_tags)} candidates")
+        assert len(all_tags) == len(tag_scores)
+        assert [tag['combined_score'] for tag in all_tags] == sorted((tag['combined_score'] for tag in all_tags), reverse=True)
+        assert cache_info['input_tokens'] == 100 and cache_info['used_summary'] is False
+        ai_scores = {tag['id']: tag['ai_score'] for tag in all_tags}
+        assert ai_scores['bedrock'] == 10 and ai_scores['lambda'] == 8
+
+        # 2. max_resultsを指定すると上位の件数だけを返す
+        for max_results in (1, 5, 20):
+            tags, _ = evaluate_tags_with_ai(ARTICLE, tag_scores, MODEL_ID, False, max_results=max_results)
+            print(f"max_results={max_results}: {[tag['id'] for tag in tags]}")
+            assert len(tags) == max_results
+            assert [tag['id'] for tag in tags] == [tag['id'] for tag in all_tags[:max_results]]
+            assert tags[0]['relevance_percentage'] == 100.0
+    finally:
+        stop_scores_server(server)
+
+
+if __name__ == "__main__":
+    test_evaluate_tags()
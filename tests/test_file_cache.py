@@ -14,7 +14,7 @@ def test_file_cache():
     print("=== File Cache Performance Test ===")
     
     # キャッシュファイルを削除
-    cache_file = '/tmp/contentful_tags_cache.json'
+    cache_file = '/tmp/contentful_tags_cache.bin'
     if os.path.exists(cache_file):
         os.remove(cache_file)
     
@@ -29,9 +29,8 @@ def test_file_cache():
     print(f"  Cache file exists: {os.path.exists(cache_file)}")
     
     # グローバルキャッシュをクリア（ファイルキャッシュのみテスト）
-    import common
-    common.TAGS_CACHE = None
-    common.TAGS_HASH = None
+    import space_cache
+    space_cache.SPACES.clear()
     
     # 2回目: ファイル読み込み
     print("\n2nd call (File Cache):")
@@ -52,7 +52,7 @@ def lambda_handler(event, context):
         )
         
         # 3. LLMでタグランキング評価（簡易版）
-        final_tags = evaluate_tags_simple(tag_scores, processing_text)
+        final_tags = evaluate_tags_simple(tag_scores.to_dicts(), processing_text)  # 書き換えるため辞書のリストにする
         
         # コスト計算（簡易版）
         combined_cache_info = {
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+import enhanced_common
+import tag_matcher
+from enhanced_common import enhanced_pre_filter_tags, extract_tag_features, get_enhanced_tag_matcher
+from tag_scoring import FUZZY_MATCH_SCORE
+
+CATALOG = [
+    {'id': '1', 'name': 'CloudFormation'},
+    {'id': '2', 'name': 'Amazon CloudWatch'},
+    {'id': '3', 'name': 'DynamoDB'},
+    {'id': '4', 'name': 'CloudFront'},
+    {'id': '5', 'name': 'Step Functions'},
+]
+TAGS_HASH = 'fuzzy-test-hash'
+# "CloudFormation" を空白・ハイフンで区切った表記揺れ
+ARTICLE = 'Cloud Formationでスタックを作り、Step-Functionsのワークフローから呼び出しました。'
+
+
+def get_scores(tag_scores):
+    return {tag_scores.tag_id(position): tag_scores.score(position) for position in range(len(tag_scores))}
+
+
+def fuzzy_tag_ids(matcher, text):
+    features = extract_tag_features(text, matcher, fuzzy=True, tags_hash=TAGS_HASH)
+    return sorted(tag_id for term in features['fuzzy'] for tag_id in
+                  (matcher.tag_ids[index] for index in matcher.name_tags[term]))
+
+
+def test_fuzzy_match():
+    print("=== Fuzzy Tag Name Matching Test (MinHash LSH) ===")
+
+    original = (enhanced_common.TAG_WORDS_CACHE_DIR, tag_matcher.INDEX_CACHE_DIR, os.environ.pop('PREFILTER_FUZZY', None))
+    with tempfile.TemporaryDirectory() as work_dir:
+        try:
+            enhanced_common.TAG_WORDS_CACHE_DIR = work_dir
+            tag_matcher.INDEX_CACHE_DIR = work_dir
+            matcher = get_enhanced_tag_matcher(CATALOG, TAGS_HASH)
+
+            # 1. 表記揺れのタグ名は拾い、一部の文字が共通なだけのタグ（CloudWatch・CloudFront）は拾わない
+            found = fuzzy_tag_ids(matcher, ARTICLE)
+            print(f"Fuzzy matches: {found}")
+            assert found == ['1', '5']
+            assert fuzzy_tag_ids(matcher, 'DynamoDBのテーブルを作りました。') == []
+
+            # 2. デフォルトでは表記揺れの加点はなく、fuzzy=True（PREFILTER_FUZZY=1）で拾ったタグだけに加わる
+            default_scores = get_scores(enhanced_pre_filter_tags(ARTICLE, CATALOG, tags_hash=TAGS_HASH)[1])
+            fuzzy_scores = get_scores(enhanced_pre_filter_tags(ARTICLE, CATALOG, tags_hash=TAGS_HASH, fuzzy=True)[1])
+            os.environ['PREFILTER_FUZZY'] = '1'
+            env_scores = get_scores(enhanced_pre_filter_tags(ARTICLE, CATALOG, tags_hash=TAGS_HASH)[1])
+            print(f"Default: {default_scores}")
+            print(f"Fuzzy:   {fuzzy_scores}")
+            assert env_scores == fuzzy_scores
+            for tag_id, score in fuzzy_scores.items():
+                bonus = FUZZY_MATCH_SCORE if tag_id in found else 0
+                assert score == default_scores.get(tag_id, 0) + bonus
+            assert '3' not in fuzzy_scores
+        finally:
+            enhanced_common.TAG_WORDS_CACHE_DIR, tag_matcher.INDEX_CACHE_DIR, fuzzy_env = original
+            os.environ.pop('PREFILTER_FUZZY', None)
+            if fuzzy_env is not None:
+                os.environ['PREFILTER_FUZZY'] = fuzzy_env
+
+
+if __name__ == "__main__":
+    test_fuzzy_match()
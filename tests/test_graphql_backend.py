@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+import bedrock_client
+import common
+import contentful_client
+import space_cache
+from contentful_client import ContentfulError
+from common import fetch_article_and_tags
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from contentful_stub import contentful_stub
+
+DELAY = 0.2  # 1回の往復にかかる時間（秒）
+
+TITLE = 'テスト記事'
+CONTENT = 'Amazon Bedrockを試しました。'
+TAGS = [{'id': '1', 'name': 'AWS'}, {'id': '2', 'name': 'Amazon Bedrock'}]
+
+
+REQUESTS = []  # (メソッド, パスまたはGraphQLのペイロード, ヘッダー)
+
+
+def respond_rest_or_graphql(request):
+    """Delivery API（GET）とGraphQL Content API（POST）の代わりに応答する"""
+    time.sleep(DELAY)
+    if request.command == 'GET':
+        REQUESTS.append(('GET', request.path, request.headers))
+        if request.query.get('content_type') == ['blogTags']:
+            return {'items': [{'fields': {'tags': TAGS}}]}
+        return {'items': [{'sys': {'revision': 3}, 'fields': {'title': TITLE, 'content': CONTENT}}]}
+
+    payload = request.read_json()
+    REQUESTS.append(('POST', payload, request.headers))
+    query = payload['query']
+    if 'noSuchField' in query:
+        return {'data': None, 'errors': [{'message': 'Cannot query field "noSuchField"'}]}
+    items = []
+    if payload['variables']['slug'] == 'test-slug':
+        items = [{'sys': {'publishedVersion': 5}, 'title': TITLE, 'content': CONTENT}]
+    data = {'blogPostCollection': {'items': items}}
+    if 'blogTagsCollection' in query:
+        data['blogTagsCollection'] = {'items': [{'tags': TAGS}]}
+    return {'data': data}
+
+
+def reset_caches():
+    space = space_cache.get_space()
+    if os.path.exists(space.cache_file):
+        os.remove(space.cache_file)
+    space_cache.SPACES.clear()
+
+
+def timed_fetch(slug):
+    request_count = len(REQUESTS)
+    start_time = time.perf_counter()
+    result = fetch_article_and_tags(slug)
+    elapsed = time.perf_counter() - start_time
+    return result, len(REQUESTS) - request_count, elapsed
+
+
+def test_graphql_backend():
+    print("=== GraphQL Backend Test (local stand-in server) ===")
+
+    common.TAGS_SYNC = False
+    bedrock_client.BEDROCK_WARM_UP_CONNECTION = False  # AWSには接続しない
+    common.warm_up_bedrock()
+
+    try:
+        with contentful_stub(respond_rest_or_graphql, space_id='space', access_token='token'):
+            # 1. REST: 記事とタグ一覧で2往復（並行）
+            common.CONTENTFUL_BACKEND = 'rest'
+            reset_caches()
+            rest_result, rest_requests, elapsed = timed_fetch('test-slug')
+            print(f"REST cold:     {rest_requests} round trips, {elapsed * 1000:.0f}ms")
+            assert rest_requests == 2
+
+            # 2. GraphQL: 記事とタグ一覧を1往復で取得
+            common.CONTENTFUL_BACKEND = 'graphql'
+            reset_caches()
+            graphql_result, graphql_requests, elapsed = timed_fetch('test-slug')
+            print(f"GraphQL cold:  {graphql_requests} round trip,  {elapsed * 1000:.0f}ms")
+            assert graphql_requests == 1
+
+            method, payload, headers = REQUESTS[-1]
+            assert method == 'POST' and payload['variables'] == {'slug': 'test-slug', 'locale': 'ja'}
+            assert headers['Content-Type'] == 'application/json' and headers['Authorization'] == 'Bearer token'
+
+            # 本文・タグ一覧・tags_hashはRESTと同じ（リビジョンは sys.publishedVersion）
+            blog_text, revision, tags_data, tags_hash = graphql_result
+            assert (blog_text, tags_data, tags_hash) == (rest_result[0], rest_result[2], rest_result[3])
+            assert revision == 5
+            print(f"Same article and catalog as REST: True (tags_hash {tags_hash[:8]})")
+
+            # 3. タグ一覧がキャッシュ済みなら記事だけを問い合わせる
+            _, warm_requests, elapsed = timed_fetch('test-slug')
+            _, payload, _ = REQUESTS[-1]
+            print(f"GraphQL warm:  {warm_requests} round trip,  {elapsed * 1000:.0f}ms (article only)")
+            assert warm_requests == 1 and 'blogTagsCollection' not in payload['query']
+
+            # 4. 記事がなければ本文None
+            blog_text, revision, tags_data, _ = fetch_article_and_tags('no-such-article')
+            assert blog_text is None and revision is None and tags_data == TAGS
+            print("Missing article: None")
+
+            # 5. GraphQLのエラーはContentfulError
+            try:
+                contentful_client.CONTENTFUL_CLIENT.query_graphql('{ noSuchField }')
+                assert False, 'ContentfulError expected'
+            except ContentfulError as e:
+                assert 'noSuchField' in str(e)
+            print("GraphQL errors raised: True")
+    finally:
+        common.CONTENTFUL_BACKEND = 'rest'
+        common.TAGS_SYNC = True
+        bedrock_client.BEDROCK_WARM_UP_CONNECTION = True
+
+
+if __name__ == "__main__":
+    test_graphql_backend()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+import bedrock_client
+from bedrock_client import create_bedrock_client
+from model_router import fuse_rankings, select_tags_with_model, select_tags_with_models
+from test_bedrock_streaming import BedrockHandler, encode_event, stream_events
+
+CLAUDE = 'us.anthropic.claude-haiku-4-5-20251001-v1:0'
+NOVA = 'us.amazon.nova-lite-v1:0'
+GPT = 'openai.gpt-oss-20b-1:0'
+FILTERED_TAGS = ['1\tAWS Lambda', '2\tAmazon S3', '3\tAmazon DynamoDB', '4\tサーバーレス']
+
+# モデルごとの1イベントあたりの生成時間（秒）と回答（回答の前に20イベント分の前置きを生成する）
+DELAYS = {CLAUDE: 0.005, NOVA: 0.01, GPT: 0.02}
+ANSWERS = {
+    CLAUDE: '{"tags": [{"id": "1", "name": "AWS Lambda"}, {"id": "2", "name": "Amazon S3"}, {"id": "3", "name": "Amazon DynamoDB"}]}',
+    NOVA: '{"tags": [{"id": "2", "name": "Amazon S3"}, {"id": "1", "name": "AWS Lambda"}]}',
+    GPT: '{"tags": [{"id": "2", "name": "Amazon S3"}, {"id": "4", "name": "サーバーレス"}]}',
+}
+
+
+class FanoutHandler(BedrockHandler):
+    """モデルごとに生成速度と回答を変えるストリーミングのローカルサーバー（モデルごとの送信イベント数を記録）"""
+    events_by_model = {}
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        model_id = self.path.split('/')[2].replace('%3A', ':')
+        deltas = ['記事の内容を確認しています。'] * 20 + [ANSWERS[model_id]] + ['\n補足です。'] * 20
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.amazon.eventstream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        FanoutHandler.events_by_model[model_id] = 0
+        try:
+            for event in stream_events(model_id, deltas):
+                time.sleep(DELAYS[model_id])
+                message = encode_event(event)
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(message), message))
+                self.wfile.flush()
+                FanoutHandler.events_by_model[model_id] += 1
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+def timed(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def test_model_fanout():
+    print("=== Multi-Model Fan-Out Test (local stand-in server) ===")
+
+    # 1. Reciprocal Rank Fusion（複数のモデルが上位に選んだタグが上位、同点は先に現れた順）
+    fused = fuse_rankings([
+        [{'id': 'a', 'name': 'A'}, {'id': 'b', 'name': 'B'}],
+        [{'id': 'b', 'name': 'B'}, {'id': 'a', 'name': 'A'}, {'id': 'a', 'name': 'A'}],
+        [{'id': 'c', 'name': 'C'}],
+    ], k=60)
+    assert [tag['id'] for tag in fused] == ['a', 'b', 'c']
+    assert fused[0]['votes'] == 2 and fused[0]['rrf_score'] == round(1 / 61 + 1 / 62, 6)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FanoutHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    bedrock_client.BEDROCK_CLIENT = create_bedrock_client(f"http://127.0.0.1:{server.server_address[1]}")
+    model_ids = [CLAUDE, NOVA, GPT]
+
+    try:
+        # 2. 従来: モデルを1つずつ呼び出す
+        sequential_time = 0
+        for model_id in model_ids:
+            _, elapsed = timed(select_tags_with_model, 'ブログ記事', FILTERED_TAGS, 'hash', model_id)
+            print(f"{model_id}: {elapsed * 1000:.0f}ms")
+            sequential_time += elapsed
+
+        # 3. 同時に呼び出して順位を統合（最も遅いモデルの待ち時間で返る）
+        (tags, cache_info, results), rrf_time = timed(
+            select_tags_with_models, 'ブログ記事', FILTERED_TAGS, 'hash', model_ids, 'rrf')
+        slowest = max(result['latency_ms'] for result in results)
+        print(f"Sequential:        {sequential_time * 1000:.0f}ms")
+        print(f"Fan-out (rrf):     {rrf_time * 1000:.0f}ms (slowest model {slowest}ms)")
+        print(f"  fused: {[(tag['name'], tag['votes']) for tag in tags]}")
+        assert [tag['id'] for tag in tags] == ['2', '1', '4', '3']
+        assert cache_info['output_tokens'] >= 21 * 3
+        assert cache_info['input_tokens'] > 500  # 打ち切ったNova・GPT-OSSの入力トークン数は見積もり
+        assert rrf_time < sequential_time * 0.75
+
+        # 4. 最初の有効な回答を使い、残りのモデルのストリームを閉じる
+        (tags, cache_info, results), first_time = timed(
+            select_tags_with_models, 'ブログ記事', FILTERED_TAGS, 'hash', model_ids, 'first')
+        time.sleep(0.1)  # サーバー側で送信の失敗を検出するまで待つ
+        cancelled = [result['model'] for result in results if result.get('cancelled')]
+        print(f"Fan-out (first):   {first_time * 1000:.0f}ms, winner {results[0]['model']}, cancelled {len(cancelled)}")
+        print(f"  events sent: {FanoutHandler.events_by_model}")
+        assert [tag['id'] for tag in tags] == ['1', '2', '3']
+        assert cancelled == [NOVA, GPT]
+        assert first_time < rrf_time
+        assert FanoutHandler.events_by_model[GPT] < 21
+        # 打ち切ったモデルも送信済みのため、入力と受け取ったところまでの出力のトークン数を見積もって含める
+        for result in results:
+            if result.get('cancelled'):
+                print(f"  {result['model']} (cancelled): {result['cache_info']}")
+                assert result['cache_info']['usage_estimated']
+                assert result['cache_info']['input_tokens'] > 0 and result['cache_info']['output_tokens'] > 0
+        for key in ('input_tokens', 'output_tokens'):
+            assert cache_info[key] == sum(result['cache_info'][key] for result in results)
+        assert cache_info['input_tokens'] > results[0]['cache_info']['input_tokens']
+
+        # 5. 候補にないタグだけを返したモデルは無視して次の回答を待つ
+        ANSWERS[CLAUDE], original = '{"tags": [{"id": "999", "name": "存在しないタグ"}]}', ANSWERS[CLAUDE]
+        try:
+            tags, _, results = select_tags_with_models('ブログ記事', FILTERED_TAGS, 'hash', model_ids, 'first')
+        finally:
+            ANSWERS[CLAUDE] = original
+        print(f"Skips answers without candidate tags: {[tag['id'] for tag in tags] == ['2', '1']}")
+        assert [tag['id'] for tag in tags] == ['2', '1']
+        assert [result['model'] for result in results if result.get('cancelled')] == [GPT]
+    finally:
+        bedrock_client.BEDROCK_CLIENT = None
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_model_fanout()
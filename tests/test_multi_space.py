@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+import os
+import sys
+from urllib.parse import urlparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+os.environ['CONTENTFUL_ACCESS_TOKEN_OTHER'] = 'other-token'
+import bedrock_client
+import common
+import enhanced_common
+import space_cache
+import tag_matcher
+from common import fetch_article_and_tags, get_cached_result, pre_filter_tags, save_cached_result
+from enhanced_common import enhanced_pre_filter_tags
+from space_cache import get_space
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from contentful_stub import contentful_stub
+
+# スペース（・環境）ごとの記事とタグ一覧
+SPACES = {
+    '/spaces/space': {
+        'blogPost': ('Lambdaの記事', 'AWS Lambdaを試しました。'),
+        'blogTags': [{'id': '1', 'name': 'AWS Lambda'}, {'id': '2', 'name': 'Amazon S3'}],
+    },
+    '/spaces/other/environments/staging': {
+        'article': ('Bedrockの記事', 'Amazon Bedrockを試しました。'),
+        'tags': [{'id': 'a', 'name': 'Amazon Bedrock'}, {'id': 'b', 'name': '生成AI'}],
+    },
+}
+
+
+REQUESTS = []  # (パス, ヘッダー)
+
+
+def respond_by_space(request):
+    """スペース・環境のパスとコンテンツタイプで応答を変える"""
+    path = urlparse(request.path).path
+    REQUESTS.append((path, request.headers))
+    content = SPACES.get(path[:-len('/entries')], {}).get(request.query['content_type'][0])
+    if content is None:
+        return {'items': []}
+    if isinstance(content, list):
+        return {'items': [{'fields': {'tags': content}}]}
+    title, text = content
+    return {'items': [{'sys': {'revision': 1}, 'fields': {'title': title, 'content': text}}]}
+
+
+def test_multi_space():
+    print("=== Multi-Space Cache Test (local stand-in server) ===")
+
+    common.TAGS_SYNC = False
+    bedrock_client.BEDROCK_WARM_UP_CONNECTION = False  # AWSには接続しない
+    original_limits = space_cache.ARTICLE_CACHE_SIZE, space_cache.SPACE_CACHE_MAX
+    original_allowed = space_cache.ALLOWED_SPACE_IDS
+    space_cache.ALLOWED_SPACE_IDS = {'space', 'other', 'a', 'b', 'c'}
+
+    try:
+        with contentful_stub(respond_by_space, space_id='space', access_token='token'):
+            tag_matcher.INDEX_CACHE_DIR = space_cache.TAGS_CACHE_DIR
+            enhanced_common.TAG_WORDS_CACHE_DIR = space_cache.TAGS_CACHE_DIR
+            enhanced_common.TAG_WORDS_CACHE.clear()
+
+            # 0. CONTENTFUL_SPACE_IDSにないスペースと、パス・クエリに使えない文字を含む指定は拒否
+            rejected = [
+                ('unlisted',),
+                ('x/../../etc',),
+                ('space', 'master', 'blogPost(where:{}){items{sys{id}}} evil: blogPost'),
+                ('space', None, None, 'blogTags\n'),
+                (['space'],),
+            ]
+            for args in rejected:
+                try:
+                    get_space(*args)
+                except ValueError:
+                    continue
+                raise AssertionError(f"accepted {args}")
+            assert not space_cache.SPACES and not os.listdir(space_cache.TAGS_CACHE_DIR)
+            print(f"Rejected unlisted space and unsafe identifiers: {len(rejected)}")
+
+            # 1. スペース・環境・コンテンツタイプごとに記事とタグ一覧を取得
+            blog = get_space('space')
+            other = get_space('other', 'staging', 'article', 'tags')
+            blog_text, _, blog_tags, blog_hash = fetch_article_and_tags('test-slug', blog)
+            other_text, _, other_tags, other_hash = fetch_article_and_tags('test-slug', other)
+            print(f"space:         {blog_text.splitlines()[0]} / {len(blog_tags)} tags, hash {blog_hash[:8]}")
+            print(f"other/staging: {other_text.splitlines()[0]} / {len(other_tags)} tags, hash {other_hash[:8]}")
+            assert blog_tags == SPACES['/spaces/space']['blogTags']
+            assert other_tags == SPACES['/spaces/other/environments/staging']['tags']
+
+            # スペースごとのアクセストークン（CONTENTFUL_ACCESS_TOKEN_<スペースID>）
+            other_requests = [headers for path, headers in REQUESTS if path.startswith('/spaces/other/')]
+            assert other_requests and all(headers['Authorization'] == 'Bearer other-token' for headers in other_requests)
+            print("Per-space access token: True")
+
+            # タグ一覧のファイルキャッシュもスペースごと
+            assert blog.cache_file != other.cache_file
+            assert os.path.exists(blog.cache_file) and os.path.exists(other.cache_file)
+
+            # 2. 両スペースのマッチャーとインデックスのファイルキャッシュを保持
+            blog_filtered, _ = pre_filter_tags(blog_text, blog_tags, tags_hash=blog_hash)
+            other_filtered, _ = pre_filter_tags(other_text, other_tags, tags_hash=other_hash)
+            assert list(blog_filtered) == ['1\tAWS Lambda'] and list(other_filtered) == ['a\tAmazon Bedrock']
+            assert ('simple', blog_hash) in tag_matcher.MATCHER_CACHE and ('simple', other_hash) in tag_matcher.MATCHER_CACHE
+            assert os.path.exists(tag_matcher.get_index_cache_file('simple', blog_hash))
+            assert os.path.exists(tag_matcher.get_index_cache_file('simple', other_hash))
+            print("Matchers kept for both spaces: True")
+
+            # タグ名の分割結果もスペースのタグ一覧ごとに保持（交互に使っても再解析しない）
+            for _ in range(2):
+                enhanced_pre_filter_tags(blog_text, blog_tags, tags_hash=blog_hash)
+                enhanced_pre_filter_tags(other_text, other_tags, tags_hash=other_hash)
+            assert {key[0] for key in enhanced_common.TAG_WORDS_CACHE} == {blog_hash, other_hash}
+            assert os.path.exists(enhanced_common.get_tag_words_cache_file(blog_hash))
+            assert os.path.exists(enhanced_common.get_tag_words_cache_file(other_hash))
+            print("Tag-name words kept for both spaces: True")
+
+            # 3. 忙しいスペースが静かなスペースのキャッシュを追い出さない
+            space_cache.ARTICLE_CACHE_SIZE = 5
+            save_cached_result('test-slug', 1, '{"other": true}', 'model', other_hash, space=other)
+            for i in range(20):
+                fetch_article_and_tags(f'busy-{i}', blog)
+                save_cached_result(f'busy-{i}', 1, '{}', 'model', blog_hash, space=blog)
+            print(f"Busy space: {len(blog.articles)} articles, {len(blog.results)} results cached")
+            assert len(blog.articles) <= 5 and len(blog.results) <= 5
+            assert other.get_article('test-slug') is not None
+            assert get_cached_result('test-slug', 1, 'model', other_hash, space=other) == '{"other": true}'
+            print("Quiet space kept its article and result: True")
+
+            # 読んだ記事は残り、最も長く使われていない記事から破棄
+            blog.clear_articles()
+            space_cache.ARTICLE_CACHE_SIZE = 2
+            blog.cache_article('read', {'text': 'a', 'revision': 1, 'etag': None})
+            blog.cache_article('unread', {'text': 'b', 'revision': 1, 'etag': None})
+            blog.get_article('read')
+            blog.cache_article('new', {'text': 'c', 'revision': 1, 'etag': None})
+            print(f"LRU articles: {list(blog.articles)}")
+            assert list(blog.articles) == ['read', 'new']
+            space_cache.ARTICLE_CACHE_SIZE = 5
+
+            # 4. 本文の合計文字数でも上限をかける
+            space_cache.ARTICLE_CACHE_CHARS, original_chars = 30, space_cache.ARTICLE_CACHE_CHARS
+            try:
+                for i in range(3):
+                    blog.cache_article(f'long-{i}', {'text': 'x' * 20, 'revision': 1, 'etag': None})
+                print(f"Character budget: {blog.article_chars} chars in {len(blog.articles)} articles")
+                assert blog.article_chars <= 30 and list(blog.articles) == ['long-2']
+            finally:
+                space_cache.ARTICLE_CACHE_CHARS = original_chars
+
+            # 5. スペース数の上限を超えたら最も長く使われていないスペースを破棄（デフォルトは残す）
+            space_cache.SPACE_CACHE_MAX = 3
+            default = get_space()
+            get_space('space')
+            for name in ('a', 'b', 'c'):
+                get_space(name)
+            keys = [key[0] for key in space_cache.SPACES]
+            print(f"Spaces kept (max 3): {keys}")
+            assert len(keys) == 3 and default.space_id in keys and keys[-1] == 'c'
+            assert get_space() is default
+
+            # 6. 1つのスペースIDが環境・コンテンツタイプを増やしても、他のスペースは追い出さない
+            space_cache.SPACES.clear()
+            space_cache.SPACE_CACHE_MAX = 4
+            default = get_space()
+            quiet = get_space('a')
+            for environment in ('e1', 'e2', 'e3', 'e4', 'e5'):
+                get_space('b', environment)
+            keys = list(space_cache.SPACES)
+            print(f"Busy tenant with 5 environments (max {space_cache.SPACE_VARIANTS_MAX} per space): {keys}")
+            assert quiet.key in keys and default.key in keys
+            assert [key[1] for key in keys if key[0] == 'b'] == ['e4', 'e5']
+    finally:
+        space_cache.ARTICLE_CACHE_SIZE, space_cache.SPACE_CACHE_MAX = original_limits
+        space_cache.ALLOWED_SPACE_IDS = original_allowed
+        tag_matcher.INDEX_CACHE_DIR = '/tmp'
+        enhanced_common.TAG_WORDS_CACHE_DIR = '/tmp'
+        enhanced_common.TAG_WORDS_CACHE.clear()
+        common.TAGS_SYNC = True
+        bedrock_client.BEDROCK_WARM_UP_CONNECTION = True
+
+
+if __name__ == "__main__":
+    test_multi_space()
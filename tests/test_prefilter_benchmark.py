@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+import enhanced_common
+import tag_matcher
+from common import pre_filter_tags
+from enhanced_common import (
+    enhanced_pre_filter_tags, enhanced_pre_filter_tags_batch, extract_tag_features, get_enhanced_tag_matcher
+)
+from tag_scoring import rank_tags
+from enhanced_index import parse_llm_ranking
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from test_tokenizer_benchmark import legacy_simple_japanese_split
+
+BASE_TAGS = [
+    'AWS', 'Amazon Bedrock', 'Amazon Nova', 'AWS Lambda', 'Lambda', 'Amazon S3', 'CloudFormation',
+    'Amazon EC2', 'Amazon ECS', 'AWS CDK', 'Terraform', 'Python', 'JavaScript', 'TypeScript',
+    'Docker', 'Kubernetes', 'GitHub Actions', 'Claude', 'ChatGPT', 'OpenAI', 'Cursor',
+    '生成AI', '機械学習', 'データベース', 'セキュリティ', 'ネットワーク', 'サーバーレス',
+    'コンテナ', '初心者向け', 'アップデート', 're:Invent', 'Amazon DynamoDB', 'Amazon Aurora',
+    'MeCab', '形態素解析', 'Contentful', 'Next.js', 'React', 'Go', 'Rust',
+]
+
+SENTENCES = [
+    'Amazon Bedrock上でClaudeを使った生成AIアプリケーションを構築しました。',
+    'AWS LambdaとAmazon S3を組み合わせてサーバーレスな処理を実装します。',
+    'CloudFormationテンプレートでECSのコンテナ環境をデプロイしました。',
+    'MeCabによる形態素解析でキーワードを抽出し、タグ候補を絞り込みます。',
+    'TypeScriptとNext.jsでフロントエンドを作り、GitHub ActionsでCIを回しています。',
+    '機械学習モデルの精度を検証するためにPythonでスクリプトを書きました。',
+    'セキュリティグループとネットワーク設定を見直して初心者向けに解説します。',
+    'Cursor 2.0のアップデート内容を試してみました。',
+]
+
+
+def build_catalog(size):
+    """ベンチマーク用の疑似タグカタログを生成（実行環境のキャッシュに依存しないよう常に合成する）"""
+    rng = random.Random(0)
+    tags = [{'id': str(i + 1), 'name': name} for i, name in enumerate(BASE_TAGS)]
+    while len(tags) < size:
+        name = f"{rng.choice(BASE_TAGS)} {rng.choice(['入門', 'Tips', 'ハンズオン', 'アーキテクチャ', 'v2', '検証'])}{len(tags)}"
+        tags.append({'id': str(len(tags) + 1), 'name': name})
+    return tags
+
+
+def build_scaling_catalog(size):
+    """記事と無関係なタグで水増ししたカタログを生成（ヒット数を揃えて規模だけ変える）"""
+    rng = random.Random(2)
+    syllables = ['ka', 'ri', 'mo', 'zu', 'te', 'no', 'ア', 'ギ', 'ネ', 'ポ', 'ル', 'ヨ']
+    tags = build_catalog(len(BASE_TAGS))
+    while len(tags) < size:
+        name = ''.join(rng.choice(syllables) for _ in range(rng.randint(3, 6)))
+        tags.append({'id': str(len(tags) + 1), 'name': f"{name} {len(tags)}"})
+    return tags
+
+
+def legacy_pre_filter_tags(blog_text, all_tags, max_tags=1000):
+    """全タグ×全キーワードを走査する従来実装（比較用）"""
+    blog_lower = blog_text.lower()
+    keywords = re.findall(r'[A-Za-z0-9]+|[ぁ-んァ-ヶ一-龯]+', blog_text)
+    keywords = [k.lower() for k in keywords if len(k) >= 2]
+
+    scored_tags = []
+    for tag in all_tags:
+        tag_id = str(tag.get('id', ''))
+        tag_name = tag.get('name', '')
+        if not tag_id or not tag_name:
+            continue
+        tag_name_lower = tag_name.lower()
+
+        score = 0
+        if tag_name_lower in blog_lower:
+            score += 10
+        for keyword in keywords:
+            if keyword in tag_name_lower or tag_name_lower in keyword:
+                score += 5
+        for word in tag_name_lower.split():
+            if len(word) >= 2 and word in blog_lower:
+                score += 2
+
+        if score > 0:
+            scored_tags.append((score, tag_id, tag_name))
+
+    # 同点の並びは現在の実装に揃えてタグID順（従来はカタログ順）
+    scored_tags.sort(key=lambda x: (-x[0], x[1]))
+    return [(tag_id, score) for score, tag_id, _ in scored_tags[:max_tags]]
+
+
+def legacy_tokenize_japanese(text):
+    """従来実装の形態素解析（システム辞書のみ、比較用）"""
+    if enhanced_common.tagger:
+        return enhanced_common.tagger.parse(text).strip().split()
+    return legacy_simple_japanese_split(text)
+
+
+def legacy_extract_keywords_with_mecab(text):
+    """従来実装のキーワード抽出（英数字をすべて除いてから形態素解析、比較用）"""
+    english_keywords = re.findall(r'[A-Za-z0-9]+', text)
+    english_keywords = [k.lower() for k in english_keywords if len(k) >= 2]
+
+    japanese_text = re.sub(r'[A-Za-z0-9\s]+', '', text)
+    japanese_keywords = legacy_tokenize_japanese(japanese_text)
+    japanese_keywords = [k.lower() for k in japanese_keywords if len(k) >= 2]
+
+    return english_keywords + japanese_keywords
+
+
+def legacy_split_tag_name(tag_name):
+    """従来実装のタグ名の分割（正規化なし、比較用）"""
+    words = []
+    for part in tag_name.split():
+        if re.match(r'^[A-Za-z0-9]+$', part):
+            words.append(part.lower())
+        else:
+            words.extend(w.lower() for w in legacy_tokenize_japanese(part))
+    return [w for w in words if len(w) >= 2]
+
+
+def legacy_enhanced_pre_filter_tags(blog_text, all_tags, max_tags=200):
+    """全タグ×全キーワードを走査する従来実装（キーワード抽出・タグ名の分割も従来のもの、比較用）"""
+    keywords = legacy_extract_keywords_with_mecab(blog_text)
+    blog_lower = blog_text.lower()
+
+    scored_tags = []
+    for tag in all_tags:
+        tag_id = str(tag.get('id', ''))
+        tag_name = tag.get('name', '')
+        if not tag_id or not tag_name:
+            continue
+        tag_name_lower = tag_name.lower()
+
+        score = 0
+        if tag_name_lower in blog_lower:
+            score += 15
+        for keyword in keywords:
+            if keyword in tag_name_lower or tag_name_lower in keyword:
+                score += 10
+                break
+        for word in legacy_split_tag_name(tag_name):
+            if word in keywords or word in blog_lower:
+                score += 5
+        for keyword in keywords:
+            if len(keyword) >= 3:
+                if keyword in tag_name_lower or tag_name_lower in keyword:
+                    score += 2
+
+        if score > 0:
+            scored_tags.append((score, tag_id, tag_name))
+
+    # 同点の並びは現在の実装に揃えてタグID順（従来はカタログ順）
+    scored_tags.sort(key=lambda x: (-x[0], x[1]))
+    return [(tag_id, score) for score, tag_id, _ in scored_tags[:max_tags]]
+
+
+def measure(func, repeat=3):
+    """最速の実行時間と結果を返す"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def test_prefilter_benchmark():
+    print("=== Prefilter Benchmark (scan vs Aho-Corasick) ===")
+
+    # マッチャー・タグ名の分割結果のファイルキャッシュは一時ディレクトリに書く
+    original = (tag_matcher.INDEX_CACHE_DIR, enhanced_common.TAG_WORDS_CACHE_DIR)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        tag_matcher.INDEX_CACHE_DIR = enhanced_common.TAG_WORDS_CACHE_DIR = cache_dir
+        try:
+            run_prefilter_benchmark()
+        finally:
+            tag_matcher.INDEX_CACHE_DIR, enhanced_common.TAG_WORDS_CACHE_DIR = original
+
+
+def run_prefilter_benchmark():
+    all_tags = build_catalog(2159)
+    rng = random.Random(1)
+    blog_text = ''.join(rng.choice(SENTENCES) for _ in range(400))
+    tags_hash = 'benchmark'
+
+    print(f"Tags count: {len(all_tags)}")
+    print(f"Article length: {len(blog_text)} chars")
+
+    cases = [
+        ('pre_filter_tags', 1000,
+         lambda max_tags: legacy_pre_filter_tags(blog_text, all_tags, max_tags),
+         lambda max_tags: pre_filter_tags(blog_text, all_tags, max_tags, tags_hash=tags_hash)),
+        ('enhanced_pre_filter_tags', 200,
+         lambda max_tags: legacy_enhanced_pre_filter_tags(blog_text, all_tags, max_tags),
+         lambda max_tags: enhanced_pre_filter_tags(blog_text, all_tags, max_tags, tags_hash=tags_hash, fuzzy=False)),
+    ]
+
+    for name, max_tags, legacy, current in cases:
+        # 初回呼び出しでオートマトンを構築
+        start_time = time.perf_counter()
+        current(max_tags)
+        build_time = time.perf_counter() - start_time
+
+        legacy_time, legacy_result = measure(lambda: legacy(max_tags), repeat=1)
+        current_time, (_, tag_scores) = measure(lambda: current(max_tags))
+        current_result = [(tag['id'], tag['score']) for tag in tag_scores]
+
+        print(f"\n{name}:")
+        print(f"  Scan:           {legacy_time:.3f}s")
+        print(f"  Automaton:      {current_time:.3f}s (first call incl. build: {build_time:.3f}s)")
+        print(f"  Speedup:        {legacy_time / current_time:.1f}x")
+        print(f"  Results match:  {legacy_result == current_result}")
+        assert legacy_result == current_result
+
+        # メモリキャッシュを消してファイルキャッシュから転置インデックスを復元
+        tag_matcher.MATCHER_CACHE.clear()
+        reload_time, (_, tag_scores) = measure(lambda: current(max_tags), repeat=1)
+        print(f"  Cold start (index file): {reload_time:.3f}s")
+        assert [(tag['id'], tag['score']) for tag in tag_scores] == legacy_result
+
+    # 結果をタグ番号のまま持つ場合と、従来どおり辞書・文字列のリストにする場合のメモリ
+    def retained_memory(func):
+        tracemalloc.start()
+        result = func()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size, result
+
+    pre_filter_tags(blog_text, all_tags, 1000, tags_hash=tags_hash)  # マッチャーを読み込んでおく
+    index_size, (filtered_tags, tag_scores) = retained_memory(lambda: pre_filter_tags(blog_text, all_tags, 1000, tags_hash=tags_hash))
+    dict_size, _ = retained_memory(lambda: [list(part) for part in pre_filter_tags(blog_text, all_tags, 1000, tags_hash=tags_hash)])
+    print(f"\nResult memory (pre_filter_tags, {len(tag_scores)} candidates):")
+    print(f"  Dicts/strings:  {dict_size / 1024:.0f}KB")
+    print(f"  Tag indices:    {index_size / 1024:.0f}KB")
+    assert index_size < dict_size
+
+    # LLMの結果はタグIDから順位を引き、選ばれたタグだけ辞書にする
+    llm_text = '{"tags": [{"id": "%s", "score": 90}, {"id": "unknown", "score": 80}, {"id": "%s", "score": "70"}]}' % (
+        tag_scores.tag_id(1), tag_scores.tag_id(0))
+    ranked = parse_llm_ranking(llm_text, tag_scores)
+    assert [tag['id'] for tag in ranked] == [tag_scores.tag_id(1), tag_scores.tag_id(0)]
+    assert ranked[0]['final_score'] == tag_scores.score(1) + 90 and ranked[1]['relevance_percentage'] == 100.0
+    assert filtered_tags[0] == f"{tag_scores.tag_id(0)}\t{tag_scores.tag_name(0)}"
+    print(f"  LLM ranking parsed: {len(ranked)} tags")
+
+    # 参照で得る辞書は参照のたびに作る読み取り用（書き換えは残らない）。書き換える場合はto_dicts
+    tag_scores[0]['score'] = -1
+    assert tag_scores[0]['score'] == tag_scores.score(0) != -1
+    tag_dicts = tag_scores.to_dicts()
+    tag_dicts[0]['score'] = -1
+    assert tag_dicts[0]['score'] == -1 and tag_dicts[1:] == tag_scores[1:]
+
+    # 表記揺れ検出（MinHash LSH）の追加コスト
+    fuzzy_time, _ = measure(lambda: enhanced_pre_filter_tags(blog_text, all_tags, 200, tags_hash=tags_hash, fuzzy=True))
+    exact_time, _ = measure(lambda: enhanced_pre_filter_tags(blog_text, all_tags, 200, tags_hash=tags_hash, fuzzy=False))
+    print("\nFuzzy matching (MinHash LSH):")
+    print(f"  Without fuzzy:  {exact_time:.3f}s")
+    print(f"  With fuzzy:     {fuzzy_time:.3f}s")
+
+    # 複数記事をまとめて採点（疎行列の積1回）
+    blog_texts = [''.join(rng.choice(SENTENCES) for _ in range(50)) for _ in range(100)]
+    single_time, single_results = measure(
+        lambda: [enhanced_pre_filter_tags(text, all_tags, 200, tags_hash=tags_hash) for text in blog_texts], repeat=1)
+    batch_time, batch_results = measure(
+        lambda: enhanced_pre_filter_tags_batch(blog_texts, all_tags, 200, tags_hash=tags_hash), repeat=1)
+
+    # 内訳: まとめて速くなるのは採点だけで、時間の大半は記事ごとの特徴抽出（形態素解析・オートマトン照合）
+    matcher = get_enhanced_tag_matcher(all_tags, tags_hash)
+    features_time, features_list = measure(
+        lambda: [extract_tag_features(text, matcher, tags_hash=tags_hash) for text in blog_texts], repeat=1)
+    single_scoring_time, single_ranked = measure(
+        lambda: [rank_tags(matcher, [features])[0] for features in features_list], repeat=1)
+    batch_scoring_time, batch_ranked = measure(lambda: rank_tags(matcher, features_list), repeat=1)
+
+    print(f"\nenhanced_pre_filter_tags_batch ({len(blog_texts)} articles):")
+    print(f"  One by one:     {single_time:.3f}s")
+    print(f"  Batch:          {batch_time:.3f}s")
+    print(f"  Results match:  {single_results == batch_results}")
+    print(f"  Breakdown:      features {features_time:.3f}s, "
+          f"scoring {single_scoring_time:.3f}s one by one / {batch_scoring_time:.3f}s batch")
+    assert single_results == batch_results and single_ranked == batch_ranked
+    assert features_time > batch_scoring_time
+
+    # カタログ規模による1記事あたりの処理時間の変化
+    # ヒットするタグは同じなので、カタログが50倍になっても処理時間はほぼ変わらない（全件走査なら50倍）
+    print("\nCatalog scaling (enhanced_pre_filter_tags, warm):")
+    scaled_times = {}
+    for size in (2000, 100000):
+        scaled_tags = build_scaling_catalog(size)
+        scaled_hash = f'benchmark-{size}'
+        enhanced_pre_filter_tags(blog_text, scaled_tags, 200, tags_hash=scaled_hash)
+        scaled_times[size], _ = measure(lambda: enhanced_pre_filter_tags(blog_text, scaled_tags, 200, tags_hash=scaled_hash))
+        print(f"  {size:>6} tags:    {scaled_times[size]:.3f}s")
+    assert scaled_times[100000] < scaled_times[2000] * 10
+
+
+if __name__ == "__main__":
+    test_prefilter_benchmark()
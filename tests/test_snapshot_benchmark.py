@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+from tag_matcher import TagMatcher
+from tag_snapshot import load_tag_snapshot, write_tag_snapshot
+from test_prefilter_benchmark import build_scaling_catalog
+
+
+def measure_load(load, repeat=3):
+    """最速の読み込み時間と、読み込んだオブジェクトが確保したメモリを返す"""
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        load()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+
+    # 時間の計測に影響しないようメモリは別に計測
+    tracemalloc.start()
+    result = load()
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, memory, result
+
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['tags_data']
+
+
+def test_snapshot_benchmark():
+    print("=== Tag Catalog Snapshot Benchmark (JSON vs mmap) ===")
+
+    work_dir = tempfile.mkdtemp()
+    for size in (2000, 100000):
+        tags_data = build_scaling_catalog(size)
+        json_file = os.path.join(work_dir, f'tags_{size}.json')
+        snapshot_file = os.path.join(work_dir, f'tags_{size}.bin')
+
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump({'tags_data': tags_data, 'tags_hash': 'benchmark', 'timestamp': 0}, f, ensure_ascii=False)
+        write_tag_snapshot(snapshot_file, tags_data, {'tags_hash': 'benchmark', 'timestamp': 0})
+
+        json_time, json_memory, json_tags = measure_load(lambda: load_json(json_file))
+        snapshot_time, snapshot_memory, snapshot = measure_load(lambda: load_tag_snapshot(snapshot_file))
+
+        print(f"\n{size} tags:")
+        print(f"  File size:      JSON {os.path.getsize(json_file) / 1024:.0f}KB / snapshot {os.path.getsize(snapshot_file) / 1024:.0f}KB")
+        print(f"  Load (JSON):    {json_time * 1000:.2f}ms, {json_memory / 1024:.0f}KB allocated")
+        print(f"  Load (mmap):    {snapshot_time * 1000:.2f}ms, {snapshot_memory / 1024:.0f}KB allocated")
+        print(f"  Speedup:        {json_time / snapshot_time:.0f}x")
+
+        # 全件参照しても同じ内容
+        assert snapshot == json_tags
+        assert snapshot[size - 1] == json_tags[-1] and snapshot[-1] == json_tags[-1]
+        assert snapshot.meta['tags_hash'] == 'benchmark'
+
+        # 小文字化済みのタグ名を使ったマッチャー構築も同じ結果
+        split_words = lambda name: name.lower().split()
+        assert TagMatcher.from_tags(snapshot, split_words).to_dict() == TagMatcher.from_tags(json_tags, split_words).to_dict()
+
+
+
+def test_concurrent_writes():
+    print("\n=== Concurrent Snapshot Writes (same process) ===")
+
+    # バックグラウンドの再取得とリクエストのスレッドが同じファイルに書き込む
+    work_dir = tempfile.mkdtemp()
+    path = os.path.join(work_dir, 'contentful_tags_cache.bin')
+    catalogs = [build_scaling_catalog(size) for size in (200, 300, 400, 500)]
+    errors = []
+
+    def write(tags_data):
+        try:
+            for _ in range(20):
+                write_tag_snapshot(path, tags_data, {'tags_hash': str(len(tags_data))})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(tags_data,)) for tags_data in catalogs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = load_tag_snapshot(path)
+    print(f"Errors: {errors}, files left: {sorted(os.listdir(work_dir))}")
+    assert errors == []
+    assert os.listdir(work_dir) == ['contentful_tags_cache.bin']
+    assert snapshot == catalogs[int(snapshot.meta['tags_hash']) // 100 - 2]
+
+
+if __name__ == "__main__":
+    test_snapshot_benchmark()
+    test_concurrent_writes()
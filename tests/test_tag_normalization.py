@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+from common import pre_filter_tags
+from enhanced_common import enhanced_pre_filter_tags
+from enhanced_index import parse_llm_ranking
+from tag_matcher import normalize_tag_name
+from tag_snapshot import load_tag_snapshot, write_tag_snapshot
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from index import evaluate_tags_with_ai
+from test_evaluate_tags import MODEL_ID, ScoresHandler, start_scores_server, stop_scores_server
+
+# 全角・半角、大文字・小文字、空白・区切り記号だけが違うタグを含むカタログ
+CATALOG = [
+    {'id': '1', 'name': 'AWS Lambda'},
+    {'id': '2', 'name': 'ＡＷＳ　Ｌａｍｂｄａ'},
+    {'id': '3', 'name': 'aws lambda'},
+    {'id': '4', 'name': 'AWS-Lambda'},
+    {'id': '5', 'name': 'Amazon Bedrock'},
+    {'id': '6', 'name': 'サーバーレス'},
+    {'id': '7', 'name': 'ｻｰﾊﾞｰﾚｽ'},
+    {'id': '8', 'name': 'Amazon  S3'},
+]
+
+ARTICLE = 'ＡＷＳ Ｌａｍｂｄａ とAmazon Bedrockでｻｰﾊﾞｰﾚｽな生成AIを作りました。Amazon S3も使います。'
+
+
+def candidate_ids(tag_scores):
+    return [tag_scores.tag_id(position) for position in range(len(tag_scores))]
+
+
+def test_tag_normalization():
+    print("=== Tag Name Normalization Test ===")
+
+    assert normalize_tag_name('ＡＷＳ　Ｌａｍｂｄａ') == 'aws lambda'
+    assert normalize_tag_name('ｻｰﾊﾞｰﾚｽ') == 'サーバーレス'
+    assert normalize_tag_name(' Amazon  S3 ') == 'amazon s3'
+
+    for name, prefilter in (('pre_filter_tags', pre_filter_tags), ('enhanced_pre_filter_tags', enhanced_pre_filter_tags)):
+        filtered_tags, tag_scores = prefilter(ARTICLE, CATALOG)
+        ids = candidate_ids(tag_scores)
+        print(f"{name}: {len(filtered_tags)} candidates {ids}")
+
+        # 1. 全角・半角の違う記事でも照合でき、まとまりごとに1件だけ候補になる
+        assert len([tag_id for tag_id in ids if tag_id in ('1', '2', '3', '4')]) == 1
+        assert len([tag_id for tag_id in ids if tag_id in ('6', '7')]) == 1
+        assert '5' in ids and '8' in ids
+        assert len(filtered_tags) == len(tag_scores) == 4
+
+        # 2. LLMが選んだ代表のIDは元のタグIDに展開する
+        lambda_position = next(position for position, tag_id in enumerate(ids) if tag_id in ('1', '2', '3', '4'))
+        lambda_id = ids[lambda_position]
+        llm_text = '{"tags": [{"id": "%s", "score": 95}, {"id": "5", "score": 80}]}' % lambda_id
+        ranked = parse_llm_ranking(llm_text, tag_scores)
+        print(f"  LLM selected {lambda_id}, 5 -> {[tag['id'] for tag in ranked]}")
+        assert sorted(tag['id'] for tag in ranked[:4]) == ['1', '2', '3', '4']
+        assert all(tag['llm_score'] == 95 for tag in ranked[:4]) and ranked[4]['id'] == '5'
+        assert {tag['name'] for tag in ranked[:4]} == {'AWS Lambda', 'ＡＷＳ　Ｌａｍｂｄａ', 'aws lambda', 'AWS-Lambda'}
+
+        # まとめられた側のIDでも候補を引ける
+        assert all(tag_scores.find(tag_id) == lambda_position for tag_id in ('1', '2', '3', '4'))
+
+        # 代表とまとめられた側のIDを両方返されても、同じタグは1回だけ
+        member_id = next(tag_id for tag_id in ('1', '2', '3', '4') if tag_id != lambda_id)
+        llm_text = '{"tags": [{"id": "%s", "score": 95}, {"id": "%s", "score": 90}, {"id": "5", "score": 80}]}' % (lambda_id, member_id)
+        for text in (llm_text, '%s,95,理由\n%s,90,理由\n5,80,理由' % (lambda_id, member_id)):
+            ranked = parse_llm_ranking(text, tag_scores)
+            print(f"  LLM selected {lambda_id}, {member_id}, 5 -> {[tag['id'] for tag in ranked]}")
+            assert sorted(tag['id'] for tag in ranked) == ['1', '2', '3', '4', '5']
+            assert all(tag['llm_score'] == 95 for tag in ranked[:4])
+
+    # 3. index.pyの評価結果でも、まとめた代表のタグを元のタグIDに展開する
+    server = start_scores_server()
+    try:
+        _, tag_scores = pre_filter_tags(ARTICLE, CATALOG)
+        ScoresHandler.scores = {'5': 9}
+        tags, _ = evaluate_tags_with_ai(ARTICLE, tag_scores, MODEL_ID, False)
+        print(f"index.evaluate_tags_with_ai: {[tag['id'] for tag in tags]}")
+        assert sorted(tag['id'] for tag in tags) == ['1', '2', '3', '4', '5', '6', '7', '8']
+        lambda_tags = [tag for tag in tags if tag['id'] in ('1', '2', '3', '4')]
+        assert len({tag['combined_score'] for tag in lambda_tags}) == 1
+        assert 'ＡＷＳ　Ｌａｍｂｄａ' in [tag['name'] for tag in lambda_tags]
+        assert tags[0]['id'] == '5'
+    finally:
+        stop_scores_server(server)
+
+    # 4. スナップショットの正規化済みタグ名から構築しても同じ結果
+    path = os.path.join(tempfile.mkdtemp(), 'contentful_tags_cache.bin')
+    write_tag_snapshot(path, CATALOG, {'tags_hash': 'normalization-test'})
+    snapshot = load_tag_snapshot(path)
+    assert [snapshot.normalized_name(i) for i in range(len(snapshot))] == [normalize_tag_name(tag['name']) for tag in CATALOG]
+    from_list = list(pre_filter_tags(ARTICLE, CATALOG)[1])
+    from_snapshot = list(pre_filter_tags(ARTICLE, snapshot)[1])
+    print(f"Snapshot catalog gives same candidates: {from_list == from_snapshot}")
+    assert from_list == from_snapshot
+
+
+if __name__ == "__main__":
+    test_tag_normalization()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+import enhanced_common
+from enhanced_common import get_tag_name_words
+
+CATALOG = [{'id': str(i), 'name': name} for i, name in enumerate([
+    'AWS Lambda', 'サーバーレスアーキテクチャ', '形態素解析', '生成AI', 'Amazon Bedrock', '機械学習 入門',
+])]
+TAGS_HASH = 'tag-words-test-hash'
+
+
+def test_tag_words_cache():
+    print("=== Tag Name Words Cache Test ===")
+
+    calls = []
+    original_tokenize = enhanced_common.tokenize_japanese
+    original_dir = enhanced_common.TAG_WORDS_CACHE_DIR
+
+    def counting_tokenize(text, tags_hash=None):
+        calls.append(text)
+        return original_tokenize(text, tags_hash)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        enhanced_common.TAG_WORDS_CACHE_DIR = cache_dir
+        enhanced_common.tokenize_japanese = counting_tokenize
+        try:
+            # 1. 初回は日本語部分ごとに1回ずつ解析する
+            tag_words = get_tag_name_words(CATALOG, TAGS_HASH)
+            print(f"Cold: {len(calls)} tokenizer calls")
+            assert len(calls) == len(set(calls)) > 0
+
+            # 2. 同じtags_hashの2回目以降はメモリキャッシュから返し、解析しない
+            del calls[:]
+            for _ in range(3):
+                assert get_tag_name_words(CATALOG, TAGS_HASH) == tag_words
+            print(f"Warm (memory): {len(calls)} tokenizer calls")
+            assert calls == []
+
+            # 3. コールドスタート（メモリキャッシュなし）でもファイルキャッシュから返す
+            enhanced_common.TAG_WORDS_CACHE.clear()
+            assert get_tag_name_words(CATALOG, TAGS_HASH) == tag_words
+            print(f"Warm (file): {len(calls)} tokenizer calls")
+            assert calls == []
+
+            # 4. tags_hashが変わったら解析し直す
+            get_tag_name_words(CATALOG, 'tag-words-test-hash-2')
+            print(f"New tags_hash: {len(calls)} tokenizer calls")
+            assert len(calls) > 0
+        finally:
+            enhanced_common.tokenize_japanese = original_tokenize
+            enhanced_common.TAG_WORDS_CACHE_DIR = original_dir
+            enhanced_common.TAG_WORDS_CACHE.clear()
+
+
+if __name__ == "__main__":
+    test_tag_words_cache()
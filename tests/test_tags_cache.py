@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+import common
+from common import get_tags_from_contentful_cached
+from space_cache import get_space
+from tag_snapshot import load_tag_snapshot
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from contentful_stub import contentful_stub
+
+
+class TagsResponder:
+    """タグ一覧を返す（delayで応答を遅らせる）"""
+
+    def __init__(self):
+        self.tags = [{'id': '1', 'name': 'AWS'}]
+        self.delay = 0
+        self.request_count = 0
+
+    def __call__(self, request):
+        self.request_count += 1
+        time.sleep(self.delay)
+        return {'items': [{'fields': {'tags': self.tags}}]}
+
+
+def test_tags_cache():
+    print("=== Tag Catalog Cache Test (stale-while-revalidate) ===")
+
+    responder = TagsResponder()
+    common.TAGS_SYNC = False  # 全件取得（Sync APIはtest_tags_sync.py）
+    original_ttl = common.TAGS_CACHE_TTL
+    space = None
+
+    try:
+        with contentful_stub(responder):
+            space = get_space()
+
+            # 1. キャッシュがない初回だけAPIを待つ
+            tags_data, first_hash = get_tags_from_contentful_cached()
+            print(f"1st call (API):        {len(tags_data)} tags, hash {first_hash[:8]}")
+            assert responder.request_count == 1
+
+            # 2. 期限内はAPIを呼ばない
+            common.TAGS_CACHE_TTL = 3600
+            get_tags_from_contentful_cached()
+            assert responder.request_count == 1
+
+            # 3. 期限切れでも古い一覧を即座に返し、裏で再取得
+            responder.tags = [{'id': '1', 'name': 'AWS'}, {'id': '2', 'name': 'Amazon Bedrock'}]
+            responder.delay = 0.5
+            common.TAGS_CACHE_TTL = 0
+            space.fetched_at = time.time() - 1
+            start_time = time.perf_counter()
+            tags_data, stale_hash = get_tags_from_contentful_cached()
+            elapsed = time.perf_counter() - start_time
+            print(f"Stale call:            {elapsed * 1000:.1f}ms (served hash {stale_hash[:8]})")
+            assert stale_hash == first_hash and elapsed < responder.delay
+
+            # 再取得中の呼び出しは2つ目のスレッドを起こさない
+            get_tags_from_contentful_cached()
+            space.refresh_thread.join()
+            assert responder.request_count == 2
+
+            tags_data, new_hash = get_tags_from_contentful_cached()
+            print(f"After refresh:         {len(tags_data)} tags, hash {new_hash[:8]}")
+            assert new_hash != first_hash and len(tags_data) == 2
+
+            # 4. ハッシュが変わらなければ一覧は差し替えない
+            space.refresh_attempt_at = 0
+            responder.delay = 0
+            common.refresh_tags_cache()
+            same_tags, same_hash = get_tags_from_contentful_cached()
+            assert same_hash == new_hash and same_tags is tags_data
+            print("Unchanged hash keeps the same catalog object: True")
+
+            # 5. ファイルキャッシュに新しい一覧とタイムスタンプ
+            snapshot = load_tag_snapshot(space.cache_file)
+            assert snapshot.meta['tags_hash'] == new_hash and snapshot.meta['timestamp'] == space.fetched_at
+            assert snapshot == tags_data
+            print("File cache updated: True")
+    finally:
+        if space is not None and space.refresh_thread is not None:
+            space.refresh_thread.join()
+        common.TAGS_SYNC = True
+        common.TAGS_CACHE_TTL = original_ttl
+
+
+if __name__ == "__main__":
+    test_tags_cache()
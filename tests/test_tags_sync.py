@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+import common
+import space_cache
+import tag_matcher
+import tag_scoring
+from common import diff_tags, get_tags_from_contentful_cached, pre_filter_tags
+from enhanced_common import enhanced_pre_filter_tags
+from space_cache import get_space
+from tag_snapshot import load_tag_snapshot
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from contentful_stub import contentful_stub
+
+CATALOG_V1 = [
+    {'id': '1', 'name': 'AWS'},
+    {'id': '2', 'name': 'Amazon Bedrock'},
+    {'id': '3', 'name': 'AWS Lambda'},
+    {'id': '4', 'name': '生成AI'},
+    {'id': '5', 'name': 'Amazon S3'},
+    {'id': '6', 'name': 'サーバーレス'},
+]
+
+# 2: 名前変更、5: 削除、7・8: 追加
+CATALOG_V2 = [
+    {'id': '1', 'name': 'AWS'},
+    {'id': '2', 'name': 'Amazon Bedrock AgentCore'},
+    {'id': '3', 'name': 'AWS Lambda'},
+    {'id': '4', 'name': '生成AI'},
+    {'id': '6', 'name': 'サーバーレス'},
+    {'id': '7', 'name': 'Claude'},
+    {'id': '8', 'name': '形態素解析'},
+]
+
+
+def sync_url(token):
+    return f"https://cdn.contentful.com/spaces/space/sync?sync_token={token}"
+
+
+def tags_entry(tags, revision):
+    return {
+        'sys': {'type': 'Entry', 'id': 'blogTagsEntry', 'revision': revision,
+                'contentType': {'sys': {'id': 'blogTags'}}},
+        'fields': {'tags': {'ja': tags}}
+    }
+
+
+# Sync APIの応答を記録したもの（初回 → 変更なし → 2ページに分かれた差分）
+RECORDED_SYNC = {
+    'initial': {'items': [tags_entry(CATALOG_V1, 1)], 'nextSyncUrl': sync_url('t1')},
+    't1': {'items': [], 'nextSyncUrl': sync_url('t2')},
+    't2': {'items': [{'sys': {'type': 'DeletedEntry', 'id': 'other'}}], 'nextPageUrl': sync_url('t3')},
+    't3': {'items': [tags_entry(CATALOG_V2, 2)], 'nextSyncUrl': sync_url('t4')},
+}
+
+ARTICLE = 'Amazon Bedrock AgentCoreとClaudeで生成AIアプリを作り、AWS Lambdaでサーバーレスに動かします。形態素解析も試しました。'
+
+
+def respond_sync(request):
+    """記録したSync APIの応答を返す"""
+    query = request.query
+    if 'sync_token' in query:
+        return RECORDED_SYNC[query['sync_token'][0]]
+    assert query.get('initial') == ['true'] and query.get('content_type') == ['blogTags']
+    return RECORDED_SYNC['initial']
+
+
+def scores(result):
+    return [(tag['id'], tag['score']) for tag in result[1]]
+
+
+def test_tags_sync():
+    print("=== Tag Catalog Sync Test (recorded Sync API) ===")
+
+    original_allowed, space_cache.ALLOWED_SPACE_IDS = space_cache.ALLOWED_SPACE_IDS, {'space'}
+
+    try:
+        with contentful_stub(respond_sync, space_id='space'):
+            space = get_space('space')
+
+            # 1. 初回同期で全件取得
+            tags_data, first_hash = get_tags_from_contentful_cached(space)
+            print(f"Initial sync:   {len(tags_data)} tags, token {space.sync_token}")
+            assert tags_data == CATALOG_V1 and space.sync_token == 't1'
+
+            # マッチャーを構築しておく
+            pre_filter_tags(ARTICLE, tags_data, tags_hash=first_hash)
+            enhanced_pre_filter_tags(ARTICLE, tags_data, tags_hash=first_hash)
+            kinds = [kind for kind, tags_hash in tag_matcher.MATCHER_CACHE if tags_hash == first_hash]
+
+            # 分割関数の呼び出しを数える（変更のあったタグだけ分割されるはず）
+            split_names = []
+            for kind in kinds:
+                split_words = tag_matcher.TAG_SPLITTERS[kind]
+                tag_matcher.TAG_SPLITTERS[kind] = lambda name, split_words=split_words: split_names.append(name) or split_words(name)
+
+            # 2. 変更なし（スナップショットは書き直さず、取得時刻・sync_tokenだけ更新）
+            snapshot_id = load_tag_snapshot(space.cache_file).meta['snapshot_id']
+            common.refresh_tags_cache(space)
+            reloaded = load_tag_snapshot(space.cache_file)
+            print(f"No changes:     hash unchanged {space.tags_hash == first_hash}, token {space.sync_token}")
+            assert space.tags_hash == first_hash and space.sync_token == 't2'
+            assert reloaded.meta['snapshot_id'] == snapshot_id
+            assert reloaded.meta['sync_token'] == 't2' and reloaded.meta['timestamp'] == space.fetched_at
+
+            # 3. 2ページに分かれた差分（名前変更・削除・追加）
+            common.refresh_tags_cache(space)
+            tags_data, new_hash = get_tags_from_contentful_cached(space)
+            print(f"Delta sync:     {len(tags_data)} tags, token {space.sync_token}")
+            assert tags_data == CATALOG_V2 and space.sync_token == 't4'
+
+            # 変更のあった5件（旧名・新名を含む）だけを各マッチャーで分割
+            print(f"Tag names split while patching: {len(split_names)} ({len(kinds)} matchers)")
+            assert sorted(split_names) == sorted(['Amazon Bedrock', 'Amazon Bedrock AgentCore', 'Amazon S3', 'Claude', '形態素解析'] * len(kinds))
+            assert all((kind, new_hash) in tag_matcher.MATCHER_CACHE for kind in kinds)
+            assert not any(tags_hash == first_hash for _, tags_hash in tag_matcher.MATCHER_CACHE)
+
+            # 4. 差分を反映したマッチャーと再構築したマッチャーで結果が一致
+            patched = scores(pre_filter_tags(ARTICLE, tags_data, tags_hash=new_hash))
+            rebuilt = scores(pre_filter_tags(ARTICLE, tags_data))
+            print(f"pre_filter_tags matches rebuild:          {patched == rebuilt}")
+            assert patched == rebuilt
+
+            patched = scores(enhanced_pre_filter_tags(ARTICLE, tags_data, tags_hash=new_hash))
+            rebuilt = scores(enhanced_pre_filter_tags(ARTICLE, tags_data))
+            print(f"enhanced_pre_filter_tags matches rebuild: {patched == rebuilt}")
+            assert patched == rebuilt
+            assert '5' not in [tag_id for tag_id, _ in patched]
+
+            # 5. sync_tokenはファイルキャッシュにも保存
+            assert load_tag_snapshot(space.cache_file).meta['sync_token'] == 't4'
+    finally:
+        space_cache.ALLOWED_SPACE_IDS = original_allowed
+
+
+def test_patched_ranking_order():
+    print("=== Patched Matcher Tie Order Test ===")
+
+    # 同点の3件（Bedrock・DynamoDB・Lambda）。差分更新ではDynamoDBが末尾に追加され、S3の番号は空く
+    old_tags = [{'id': '10', 'name': 'Bedrock'}, {'id': '30', 'name': 'Lambda'}, {'id': '40', 'name': 'S3'}]
+    new_tags = [{'id': '10', 'name': 'Bedrock'}, {'id': '20', 'name': 'DynamoDB'}, {'id': '30', 'name': 'Lambda'}]
+    article = 'BedrockとDynamoDBとLambdaを使います。'
+
+    original_dir, tag_matcher.INDEX_CACHE_DIR = tag_matcher.INDEX_CACHE_DIR, tempfile.mkdtemp()
+    original_sparse = tag_scoring.SPARSE_AVAILABLE
+    try:
+        pre_filter_tags(article, old_tags, tags_hash='tie-old')
+        enhanced_pre_filter_tags(article, old_tags, tags_hash='tie-old')
+        tag_matcher.patch_tag_matchers('tie-old', 'tie-new', *diff_tags(old_tags, new_tags))
+
+        # enhanced_pre_filter_tagsは疎行列・Pythonの両方の採点で確認
+        runs = [('pre_filter_tags', pre_filter_tags, original_sparse),
+                ('enhanced_pre_filter_tags (sparse)', enhanced_pre_filter_tags, original_sparse),
+                ('enhanced_pre_filter_tags (python)', enhanced_pre_filter_tags, False)]
+        for name, prefilter, sparse_available in runs:
+            tag_scoring.SPARSE_AVAILABLE = sparse_available
+            patched = scores(prefilter(article, new_tags, tags_hash='tie-new'))
+            rebuilt = scores(prefilter(article, new_tags))
+            print(f"{name}: patched {patched}, rebuilt {rebuilt}")
+            assert patched == rebuilt
+            assert [tag_id for tag_id, _ in patched] == ['10', '20', '30']
+    finally:
+        tag_matcher.INDEX_CACHE_DIR = original_dir
+        tag_scoring.SPARSE_AVAILABLE = original_sparse
+        tag_matcher.release_tag_matchers('tie-old')
+        tag_matcher.release_tag_matchers('tie-new')
+
+
+def test_matcher_cache_threads():
+    print("=== Matcher Cache Concurrent Update Test ===")
+
+    # バックグラウンドの再取得スレッドの差分反映・破棄と、リクエストのマッチャー取得を同時に実行
+    original_live = tag_matcher.LIVE_TAGS_HASHES
+    tag_matcher.register_live_tags_hashes(lambda: ())
+    errors = []
+    split_words = lambda name: name.lower().split()
+
+    def build(worker):
+        try:
+            for round_number in range(300):
+                tags_hash = f"thread-{worker}-{round_number % 5}"
+                tag_matcher.get_tag_matcher(CATALOG_V1, tags_hash, 'thread-test', split_words)
+                tag_matcher.patch_tag_matchers(tags_hash, f"{tags_hash}-patched", [], [], [])
+                tag_matcher.release_tag_matchers(tags_hash)
+                tag_matcher.release_tag_matchers(f"{tags_hash}-patched")
+        except Exception as e:
+            errors.append(e)
+
+    original_dir, tag_matcher.INDEX_CACHE_DIR = tag_matcher.INDEX_CACHE_DIR, tempfile.mkdtemp()
+    tag_matcher.register_tag_splitter('thread-test', split_words)
+    original_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # 走査中にスレッドが切り替わりやすくする
+    try:
+        # 走査に時間がかかるよう、他のスペースのマッチャーを多数登録しておく
+        with tag_matcher.MATCHER_LOCK:
+            for index in range(5000):
+                tag_matcher.MATCHER_CACHE[('thread-test-other', f"other-{index}")] = None
+        threads = [threading.Thread(target=build, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"Errors: {errors}")
+        assert errors == []
+    finally:
+        sys.setswitchinterval(original_interval)
+        tag_matcher.LIVE_TAGS_HASHES = original_live
+        tag_matcher.INDEX_CACHE_DIR = original_dir
+        tag_matcher.TAG_SPLITTERS.pop('thread-test', None)
+        with tag_matcher.MATCHER_LOCK:
+            for key in [key for key in tag_matcher.MATCHER_CACHE if key[0].startswith('thread-test')]:
+                del tag_matcher.MATCHER_CACHE[key]
+
+
+if __name__ == "__main__":
+    test_tags_sync()
+    test_patched_ranking_order()
+    test_matcher_cache_threads()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+import enhanced_common
+from enhanced_common import extract_keyword_counts, simple_japanese_split
+
+SENTENCES = [
+    'Amazon Bedrock上でClaudeを使った生成AIアプリケーションを構築しました。',
+    'AWS LambdaとAmazon S3を組み合わせてサーバーレスな処理を実装します。',
+    'CloudFormationテンプレートでECSのコンテナ環境をデプロイしました。',
+    'MeCabによる形態素解析でキーワードを抽出し、タグ候補を絞り込みます。',
+    '「re:Invent 2024」のセッション（約45分）をまとめました！！',
+    '機械学習モデルの精度を検証するためにPythonでスクリプトを書きました。\n\n',
+]
+
+
+def get_char_type(char):
+    """文字種別を判定（従来実装の1文字ずつの判定、比較用）"""
+    if re.match(r'[ぁ-ん]', char):
+        return 'hiragana'
+    elif re.match(r'[ァ-ヶ]', char):
+        return 'katakana'
+    elif re.match(r'[一-龯]', char):
+        return 'kanji'
+    elif re.match(r'[A-Za-z0-9]', char):
+        return 'ascii'
+    else:
+        return 'other'
+
+
+def legacy_simple_japanese_split(text):
+    """1文字ずつget_char_typeで判定する従来実装（比較用）"""
+    tokens = []
+    current_token = ""
+    current_type = None
+
+    for char in text:
+        char_type = get_char_type(char)
+
+        if char_type != current_type:
+            if current_token and len(current_token) >= 2:
+                tokens.append(current_token)
+            current_token = char
+            current_type = char_type
+        else:
+            current_token += char
+
+    if current_token and len(current_token) >= 2:
+        tokens.append(current_token)
+
+    return tokens
+
+
+def measure(func, repeat=5):
+    """最速の実行時間と結果を返す"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def test_tokenizer_benchmark():
+    print("=== Fallback Tokenizer Benchmark ===")
+
+    rng = random.Random(0)
+    text = ''.join(rng.choice(SENTENCES) for _ in range(500))
+    print(f"Article length: {len(text)} chars")
+
+    # 文字種の境界が多いランダム文字列でも一致を確認
+    alphabet = 'あいうアイウー一二三abcXYZ019 、。！!-_・\n　漢字カナ'
+    for _ in range(200):
+        sample = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        assert simple_japanese_split(sample) == legacy_simple_japanese_split(sample), sample
+
+    legacy_time, legacy_tokens = measure(lambda: legacy_simple_japanese_split(text), repeat=1)
+    current_time, current_tokens = measure(lambda: simple_japanese_split(text))
+
+    print("\nsimple_japanese_split:")
+    print(f"  Per character:  {legacy_time * 1000:.2f}ms")
+    print(f"  Compiled regex: {current_time * 1000:.2f}ms")
+    print(f"  Speedup:        {legacy_time / current_time:.1f}x")
+    print(f"  Results match:  {legacy_tokens == current_tokens}")
+    assert legacy_tokens == current_tokens
+
+    if enhanced_common.MECAB_AVAILABLE and enhanced_common.tagger:
+        mecab_time, _ = measure(lambda: enhanced_common.tagger.parse(text).split())
+        print(f"  MeCab:          {mecab_time * 1000:.2f}ms")
+    else:
+        print("  MeCab:          (not available)")
+
+    # 長い記事の段落単位の並列解析
+    paragraphs = [''.join(rng.choice(SENTENCES) for _ in range(20)) for _ in range(400)]
+    long_text = '\n\n'.join(paragraphs)
+    workers = max(2, os.cpu_count() or 1)
+    extract_keyword_counts(long_text, workers=workers)  # プールの起動
+
+    serial_time, serial_counts = measure(lambda: extract_keyword_counts(long_text, workers=1), repeat=1)
+    parallel_time, parallel_counts = measure(lambda: extract_keyword_counts(long_text, workers=workers), repeat=1)
+    # チャンク境界をまたぐ語だけ結果が変わりうる
+    difference = sum(((serial_counts - parallel_counts) + (parallel_counts - serial_counts)).values())
+
+    print(f"\nextract_keyword_counts ({len(long_text)} chars, {workers} workers):")
+    print(f"  Serial:         {serial_time:.3f}s")
+    print(f"  Parallel:       {parallel_time:.3f}s")
+    print(f"  Keywords:       {sum(serial_counts.values())} (differ at chunk boundaries: {difference})")
+
+
+if __name__ == "__main__":
+    test_tokenizer_benchmark()
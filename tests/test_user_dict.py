@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-code'))
+import enhanced_common
+import tag_matcher
+from build_user_dict import DEFAULT_DIC_SOURCE, build_user_dict
+from enhanced_common import (
+    enhanced_pre_filter_tags, extract_keywords_with_mecab, get_tokenizer_id, load_user_dic_version, load_user_dic_words,
+    split_tag_name
+)
+
+CATALOG = [
+    {'id': '1', 'name': '生成AI'},
+    {'id': '2', 'name': 'サーバーレスアーキテクチャ'},
+    {'id': '3', 'name': 'AWS Lambda'},
+    {'id': '4', 'name': '生成'},
+    {'id': '5', 'name': 'レス'},
+]
+TAGS_HASH = 'userdic-test-hash'
+BLOG_TEXT = '生成AIでサーバーレスアーキテクチャのAWS Lambda関数を作りました。'
+
+
+def find_dic_source():
+    """システム辞書のソース（環境変数・ipadic、なければunidic-lite）"""
+    if os.environ.get('MECAB_DIC_SOURCE'):
+        return os.environ['MECAB_DIC_SOURCE']
+    if os.path.exists(DEFAULT_DIC_SOURCE):
+        return DEFAULT_DIC_SOURCE
+    try:
+        import unidic_lite
+        return unidic_lite.DICDIR
+    except ImportError:
+        return None
+
+
+def test_user_dict():
+    print("=== MeCab User Dictionary Test ===")
+
+    dic_source = find_dic_source()
+    if not enhanced_common.MECAB_AVAILABLE or dic_source is None:
+        print("MeCabまたはシステム辞書のソースがないためスキップ")
+        return
+
+    original = (enhanced_common.MECAB_USER_DIC, enhanced_common.USER_DIC_TAGS_HASH, enhanced_common.USER_DIC_WORDS,
+                enhanced_common.user_tagger, enhanced_common.TAG_WORDS_CACHE_DIR, tag_matcher.INDEX_CACHE_DIR)
+    with tempfile.TemporaryDirectory() as work_dir:
+        try:
+            # 1. 小さなカタログから辞書を作成（英数字との複合語も登録し、英数字だけの部分は除く）
+            output = os.path.join(work_dir, 'mecab_user.dic')
+            words = build_user_dict(CATALOG, TAGS_HASH, output, dic_source)
+            print(f"Words: {words} (dic source {dic_source})")
+            assert '生成ai' in words and 'サーバーレスアーキテクチャ' in words
+            assert 'aws' not in words and 'lambda' not in words
+            assert load_user_dic_version(output) == TAGS_HASH
+            assert load_user_dic_words(output) == set(words)
+
+            enhanced_common.MECAB_USER_DIC = output
+            enhanced_common.USER_DIC_TAGS_HASH = load_user_dic_version(output)
+            enhanced_common.USER_DIC_WORDS = load_user_dic_words(output)
+            enhanced_common.user_tagger = None
+            enhanced_common.TAG_WORDS_CACHE_DIR = work_dir
+            tag_matcher.INDEX_CACHE_DIR = work_dir
+
+            # 2. 生成元のtags_hashではタグ名・記事とも複合語を1語として解析する
+            print(f"Without the dictionary: {split_tag_name('生成AI')}, {split_tag_name('サーバーレスアーキテクチャ')}")
+            print(f"With the dictionary:    {split_tag_name('生成AI', TAGS_HASH)}, "
+                  f"{split_tag_name('サーバーレスアーキテクチャ', TAGS_HASH)}")
+            assert split_tag_name('生成AI') != ['生成ai']
+            assert split_tag_name('生成AI', TAGS_HASH) == ['生成ai']
+            assert split_tag_name('サーバーレスアーキテクチャ', TAGS_HASH) == ['サーバーレスアーキテクチャ']
+            keywords = extract_keywords_with_mecab(BLOG_TEXT, TAGS_HASH)
+            print(f"Keywords: {keywords}")
+            assert '生成ai' in keywords and 'サーバーレスアーキテクチャ' in keywords
+            assert 'ai' in keywords and 'lambda' in keywords
+            assert 'レス' not in keywords
+
+            # 3. 判定していないカタログ（tags_hash）では辞書を使わない
+            assert get_tokenizer_id(TAGS_HASH) == f"mecab_{TAGS_HASH[:8]}"
+            assert get_tokenizer_id('other-hash') == 'mecab'
+            assert split_tag_name('生成AI', 'other-hash') == split_tag_name('生成AI')
+
+            # 4. 事前フィルタでも複合語のタグ名が一致する
+            tag_lines = list(enhanced_pre_filter_tags(BLOG_TEXT, CATALOG, max_tags=3, tags_hash=TAGS_HASH, fuzzy=False)[0])
+            print(f"Pre-filter: {tag_lines}")
+            assert '1\t生成AI' in tag_lines and '2\tサーバーレスアーキテクチャ' in tag_lines
+
+            # 5. タグを追加してtags_hashが変わっても、辞書の語が全て残っていれば使い続ける
+            added_catalog = CATALOG + [{'id': '6', 'name': 'ベクトル検索'}]
+            tag_lines = list(enhanced_pre_filter_tags(BLOG_TEXT, added_catalog, max_tags=3, tags_hash='added-hash')[0])
+            print(f"After adding a tag: {get_tokenizer_id('added-hash')}, {tag_lines}")
+            assert get_tokenizer_id('added-hash') == get_tokenizer_id(TAGS_HASH)
+            assert '1\t生成AI' in tag_lines and '2\tサーバーレスアーキテクチャ' in tag_lines
+
+            # 6. 辞書の語のタグを削除したカタログでは使わない（"生成ai" を1語にすると "生成" のタグが一致しない）
+            removed_catalog = [tag for tag in CATALOG if tag['id'] != '1']
+            tag_lines = list(enhanced_pre_filter_tags(BLOG_TEXT, removed_catalog, max_tags=5, tags_hash='removed-hash')[0])
+            print(f"After removing a tag: {get_tokenizer_id('removed-hash')}, {tag_lines}")
+            assert get_tokenizer_id('removed-hash') == 'mecab'
+            assert '4\t生成' in tag_lines
+        finally:
+            (enhanced_common.MECAB_USER_DIC, enhanced_common.USER_DIC_TAGS_HASH, enhanced_common.USER_DIC_WORDS,
+             enhanced_common.user_tagger, enhanced_common.TAG_WORDS_CACHE_DIR, tag_matcher.INDEX_CACHE_DIR) = original
+            enhanced_common.TAG_WORDS_CACHE.clear()
+            enhanced_common.USER_DIC_COVERAGE.clear()
+
+
+if __name__ == "__main__":
+    test_user_dict()